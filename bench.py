@@ -0,0 +1,456 @@
+import io
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import subprocess
+from contextlib import redirect_stdout
+from typing import Dict, Any, List, Optional, Tuple
+from main import EXAMPLE_QUERIES, TABLE_METADATA
+from src.ai_agent import AIAgent
+from src.utils.cassette import Cassette
+from src.utils.response_cache import ResponseCache
+from src.utils.resilience import RetryPolicy, HedgePolicy
+from src.utils.metrics import COLD_LOAD_THRESHOLD_MS
+from src.utils.prompt_templates import PROMPT_LAYOUTS, PREFIX_FIRST_LAYOUT
+from src.utils.ollama_client import (
+    configure_ollama, configure_response_cache, configure_cassette, configure_retries, configure_hedging, check_ollama_connection, get_router,
+    get_response_cache, OLLAMA_MAX_RETRIES, OLLAMA_REQUEST_TIMEOUT, OLLAMA_CACHE_MAX_ENTRIES, OLLAMA_CACHE_TTL
+)
+
+# Set up bench logger
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS = [
+    "Show me the top 5 customers by total spending this year",
+    "What are the best selling products in electronics category?",
+    "Get monthly sales trends for the last 6 months",
+    "How many orders were placed per country last quarter?",
+    "List customers who registered in 2023 but never placed an order",
+    "Which products are low on stock_quantity and still selling well?",
+    "Average order amount by order status",
+    "Revenue per product category for the last 30 days"
+]
+
+# Tables a correct answer to each built-in question needs, for scoring selection accuracy
+DEFAULT_EXPECTED_TABLES = {
+    DEFAULT_CORPUS[0]: ['customers', 'orders'],
+    DEFAULT_CORPUS[1]: ['products', 'order_items'],
+    DEFAULT_CORPUS[2]: ['orders'],
+    DEFAULT_CORPUS[3]: ['orders', 'customers'],
+    DEFAULT_CORPUS[4]: ['customers', 'orders'],
+    DEFAULT_CORPUS[5]: ['products', 'order_items'],
+    DEFAULT_CORPUS[6]: ['orders'],
+    DEFAULT_CORPUS[7]: ['products', 'order_items', 'orders']
+}
+
+# Relative slowdown beyond which a metric is reported as a regression against a baseline
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+# Baseline values below this are too small for a relative comparison to mean anything
+MIN_COMPARABLE_VALUE = 1.0
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0-100) of a list of values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+def latency_summary(values: List[float]) -> Dict[str, Any]:
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_standin(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    """Launch the Ollama stand-in in its own process so its CPU time is not counted as ours."""
+    command = [
+        sys.executable, '-m', 'src.tools.ollama_standin',
+        '--port', str(port),
+        '--latency-distribution', args.latency_distribution,
+        '--latency-ms', str(args.latency_ms),
+        '--latency-jitter-ms', str(args.latency_jitter_ms),
+        '--token-rate', str(args.token_rate),
+        '--prompt-rate', str(args.prompt_rate),
+        '--error-rate', str(args.error_rate),
+        '--stall-rate', str(args.stall_rate),
+        '--stall-seconds', str(args.stall_seconds),
+        '--cold-load-ms', str(args.cold_load_ms),
+        '--prefix-cache-slots', str(args.prefix_cache_slots),
+        '--seed', '42'
+    ]
+    for entry in args.model_speed:
+        command += ['--model-speed', entry]
+    logger.info(f"Starting Ollama stand-in: {' '.join(command)}")
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_for_host(timeout: float = 10.0) -> bool:
+    """Wait until every configured Ollama replica answers."""
+    deadline = time.time() + timeout
+    pending = list(get_router().hosts)
+    while time.time() < deadline:
+        pending = [host for host in pending if not await check_ollama_connection(host)]
+        if not pending:
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+def load_corpus(path: Optional[str]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """Questions to run and the expected tables of those that list them after a tab."""
+    if not path:
+        return DEFAULT_CORPUS, DEFAULT_EXPECTED_TABLES
+    questions, expected_tables = [], {}
+    with open(path) as handle:
+        for line in handle:
+            question, _, tables = line.strip().partition('\t')
+            if not question:
+                continue
+            questions.append(question)
+            if tables.strip():
+                expected_tables[question] = [table.strip() for table in tables.split(',') if table.strip()]
+    return questions, expected_tables
+
+
+def load_stage_profiles(value: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    if not value:
+        return {}
+    if value.lstrip().startswith('{'):
+        return json.loads(value)
+    with open(value) as handle:
+        return json.load(handle)
+
+
+async def run_workload(agent: AIAgent, corpus: List[str], concurrency: int, duration: float, requests: Optional[int]) -> List[Dict[str, Any]]:
+    """Drive process_query from concurrent workers until the duration or request budget is used up."""
+    results: List[Dict[str, Any]] = []
+    next_index = 0
+    deadline = time.time() + duration
+
+    async def worker() -> None:
+        nonlocal next_index
+        while True:
+            if requests is not None and next_index >= requests:
+                return
+            if requests is None and time.time() >= deadline:
+                return
+            question = corpus[next_index % len(corpus)]
+            next_index += 1
+            results.append(await agent.process_query(question, bypass_cache=True))
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return results
+
+
+def summarize(
+    results: List[Dict[str, Any]],
+    elapsed: float,
+    cpu_seconds: float,
+    expected_tables: Optional[Dict[str, List[str]]] = None
+) -> Dict[str, Any]:
+    """Throughput, end-to-end and per-stage latency percentiles, prompt sizes and table selection accuracy."""
+    stage_latency: Dict[str, List[float]] = {}
+    stage_prompt_chars: Dict[str, List[float]] = {}
+    stage_tokens_cached: Dict[str, List[float]] = {}
+    stage_prompt_eval: Dict[str, List[float]] = {}
+    for result in results:
+        for stage, metrics in result.get('metrics', {}).get('stages', {}).items():
+            if metrics.get('wall_ms') is not None:
+                stage_latency.setdefault(stage, []).append(metrics['wall_ms'])
+            if metrics.get('llm_calls'):
+                stage_prompt_chars.setdefault(stage, []).append(metrics['totals'].get('prompt_chars', 0))
+                stage_prompt_eval.setdefault(stage, []).append(metrics['totals'].get('prompt_eval_duration_ms', 0))
+
+    calls = [call for result in results for call in result.get('metrics', {}).get('calls', [])]
+    # Only chat session turns know how much of their prompt the server had cached
+    for call in calls:
+        if call.get('prompt_tokens_cached') is not None:
+            stage_tokens_cached.setdefault(call['stage'], []).append(call['prompt_tokens_cached'])
+    succeeded = sum(1 for result in results if result['success'])
+    return {
+        'requests': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'elapsed_seconds': elapsed,
+        'requests_per_second': len(results) / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': latency_summary([result['processing_time'] for result in results]),
+        'stages': {
+            stage: {
+                'latency_ms': latency_summary(values),
+                'prompt_chars_mean': (
+                    sum(stage_prompt_chars[stage]) / len(stage_prompt_chars[stage])
+                    if stage_prompt_chars.get(stage) else None
+                ),
+                'prompt_tokens_cached_mean': (
+                    sum(stage_tokens_cached[stage]) / len(stage_tokens_cached[stage])
+                    if stage_tokens_cached.get(stage) else None
+                ),
+                'prompt_eval_ms_mean': (
+                    sum(stage_prompt_eval[stage]) / len(stage_prompt_eval[stage])
+                    if stage_prompt_eval.get(stage) else None
+                )
+            }
+            for stage, values in stage_latency.items()
+        },
+        'ollama_calls': {
+            'total': len(calls),
+            'retries': sum(call.get('retries') or 0 for call in calls),
+            'hedged': sum(1 for call in calls if call.get('hedged')),
+            'errors': sum(1 for call in calls if call.get('error')),
+            'cold_loads': sum(1 for call in calls if (call.get('load_duration_ms') or 0) >= COLD_LOAD_THRESHOLD_MS)
+        },
+        'refinement_skipped': sum(1 for result in results if result.get('steps', {}).get('refinement', {}).get('skipped')),
+        'speculation': speculation_outcomes(results),
+        'table_accuracy': table_accuracy(results, expected_tables or {}),
+        'cpu_seconds': cpu_seconds,
+        'cpu_ms_per_request': cpu_seconds * 1000 / len(results) if results else None,
+        # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if platform.system() == 'Darwin' else 1024)
+    }
+
+
+def speculation_outcomes(results: List[Dict[str, Any]]) -> Dict[str, int]:
+    """How often speculative selections were accepted, rerun or cancelled."""
+    outcomes: Dict[str, int] = {}
+    for result in results:
+        speculation = result.get('steps', {}).get('refinement', {}).get('speculation') or {}
+        for stage in ('query_selection', 'table_selection'):
+            if stage in speculation:
+                key = f'{stage}.{speculation[stage]}'
+                outcomes[key] = outcomes.get(key, 0) + 1
+    return outcomes
+
+
+def table_accuracy(results: List[Dict[str, Any]], expected_tables: Dict[str, List[str]]) -> Dict[str, Any]:
+    """How well the selected tables match the expected ones: exact matches and mean recall and precision, in percent."""
+    scores = []
+    for result in results:
+        expected = set(expected_tables.get(result['user_input'], []))
+        if not expected:
+            continue
+        selected = set(result.get('steps', {}).get('table_selection', {}).get('selected_tables') or [])
+        found = len(expected & selected)
+        scores.append((selected == expected, found / len(expected), found / len(selected) if selected else 0.0))
+    if not scores:
+        return {'scored': 0, 'exact_pct': None, 'recall_pct': None, 'precision_pct': None}
+    return {
+        'scored': len(scores),
+        'exact_pct': 100.0 * sum(exact for exact, _, _ in scores) / len(scores),
+        'recall_pct': 100.0 * sum(recall for _, recall, _ in scores) / len(scores),
+        'precision_pct': 100.0 * sum(precision for _, _, precision in scores) / len(scores)
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Describe every tracked metric that got worse than the baseline by more than threshold."""
+    regressions = []
+    checks = [('requests_per_second', report['summary']['requests_per_second'], baseline['summary']['requests_per_second'], False)]
+    for q in ('p50', 'p95', 'p99'):
+        checks.append((f'latency_ms.{q}', report['summary']['latency_ms'][q], baseline['summary']['latency_ms'][q], True))
+    checks.append(('cpu_ms_per_request', report['summary']['cpu_ms_per_request'], baseline['summary']['cpu_ms_per_request'], True))
+    accuracy, base_accuracy = report['summary']['table_accuracy'], baseline['summary'].get('table_accuracy', {})
+    for metric in ('exact_pct', 'recall_pct'):
+        checks.append((f'table_accuracy.{metric}', accuracy[metric], base_accuracy.get(metric), False))
+    for stage, stats in report['summary']['stages'].items():
+        base_stats = baseline['summary']['stages'].get(stage)
+        if base_stats:
+            checks.append((f'stages.{stage}.p95', stats['latency_ms']['p95'], base_stats['latency_ms']['p95'], True))
+            checks.append((f'stages.{stage}.prompt_chars_mean', stats['prompt_chars_mean'], base_stats['prompt_chars_mean'], True))
+            checks.append((f'stages.{stage}.prompt_eval_ms_mean', stats['prompt_eval_ms_mean'], base_stats.get('prompt_eval_ms_mean'), True))
+
+    for name, current, previous, lower_is_better in checks:
+        if current is None or previous is None or previous < MIN_COMPARABLE_VALUE:
+            continue
+        change = (current - previous) / previous
+        if (lower_is_better and change > threshold) or (not lower_is_better and change < -threshold):
+            regressions.append(f"{name}: {previous:.2f} -> {current:.2f} ({change:+.1%})")
+    return regressions
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Benchmark the AI SQL Agent pipeline')
+    parser.add_argument('--corpus', help='File with one question per line, optionally followed by a tab and its expected tables '
+                                         '(comma separated); defaults to a built-in set')
+    parser.add_argument('--mode', default='staged', choices=['staged', 'fused'],
+                        help='Run refinement and selection as separate calls or as one fused call')
+    parser.add_argument('--prompt-layout', default=PREFIX_FIRST_LAYOUT, choices=list(PROMPT_LAYOUTS),
+                        help="Put each prompt's static instructions and catalog before the request, or use the original order")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run when --requests is not given')
+    parser.add_argument('--requests', type=int, help='Run exactly this many requests instead of a fixed duration')
+    parser.add_argument('--warmup', type=int, default=2, help='Requests run before measuring')
+    parser.add_argument('--host', help='Benchmark against this Ollama host instead of a local stand-in')
+    parser.add_argument('--model', help='Model to use (defaults to OLLAMA_MODEL)')
+    parser.add_argument('--cache', action='store_true', help='Enable the response and result caches')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', help='Compare against a previous JSON report and exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    parser.add_argument('--request-timeout', type=float, help='Per-attempt Ollama timeout in seconds')
+    parser.add_argument('--max-retries', type=int, help='Retries per Ollama call on retryable errors')
+    parser.add_argument('--hedge-percentile', type=float, help='Hedge Ollama calls slower than this latency percentile')
+    parser.add_argument('--cassette', help='Record Ollama responses to, or replay them from, this file')
+    parser.add_argument('--cassette-mode', default='replay', choices=['record', 'replay'])
+    parser.add_argument('--replay-latency', action='store_true', help='Sleep for the recorded latency of each replayed call')
+    parser.add_argument('--chat-session', action='store_true', help="Run each request's calls as turns of one chat (serializes the selection stages)")
+    parser.add_argument('--speculative', action='store_true', help='Run selection on the raw input while refinement runs')
+    parser.add_argument('--no-refinement-fast-path', action='store_true', help='Refine every question with the LLM')
+    parser.add_argument('--no-model-warmup', action='store_true', help='Skip preloading models when the agent starts')
+    parser.add_argument('--stage-profiles', help='JSON (or a JSON file) mapping pipeline stages to model and generation options')
+    standin = parser.add_argument_group('stand-in server')
+    standin.add_argument('--standin-port', type=int, default=0)
+    standin.add_argument('--replicas', type=int, default=1, help='Number of stand-in replicas to route between')
+    standin.add_argument('--latency-distribution', default='lognormal', choices=['constant', 'uniform', 'exponential', 'lognormal'])
+    standin.add_argument('--latency-ms', type=float, default=80.0)
+    standin.add_argument('--latency-jitter-ms', type=float, default=30.0)
+    standin.add_argument('--token-rate', type=float, default=400.0)
+    standin.add_argument('--prompt-rate', type=float, default=4000.0)
+    standin.add_argument('--error-rate', type=float, default=0.0)
+    standin.add_argument('--stall-rate', type=float, default=0.0)
+    standin.add_argument('--stall-seconds', type=float, default=5.0)
+    standin.add_argument('--prefix-cache-slots', type=int, default=0,
+                         help='Prompt cache slots per model; prompts sharing a cached prefix only evaluate the rest')
+    standin.add_argument('--cold-load-ms', type=float, default=0.0, help='Load time for a model that is not in memory')
+    standin.add_argument('--model-speed', action='append', default=[], metavar='MODEL=FACTOR',
+                         help='Make a model on the stand-in FACTOR times faster, e.g. a smaller model')
+    return parser
+
+
+async def bench(args: argparse.Namespace) -> int:
+    standins: List[subprocess.Popen] = []
+    replaying = args.cassette and args.cassette_mode == 'replay'
+    if args.cassette:
+        configure_cassette(Cassette(args.cassette, mode=args.cassette_mode, reproduce_latency=args.replay_latency))
+
+    if args.host or replaying:
+        configure_ollama(host=args.host, model=args.model)
+    else:
+        args.standin_port = args.standin_port or free_port()
+        ports = [args.standin_port] + [free_port() for _ in range(args.replicas - 1)]
+        standins = [start_standin(args, port) for port in ports]
+        configure_ollama(host=','.join(f"http://127.0.0.1:{port}" for port in ports), model=args.model)
+
+    try:
+        if not replaying and not await wait_for_host():
+            print('❌ Ollama host is not reachable')
+            return 2
+
+        if not args.cache:
+            configure_response_cache(None)
+        elif get_response_cache() is None:
+            configure_response_cache(ResponseCache(max_entries=OLLAMA_CACHE_MAX_ENTRIES, ttl=OLLAMA_CACHE_TTL))
+        if args.request_timeout is not None or args.max_retries is not None:
+            configure_retries(RetryPolicy(
+                max_retries=OLLAMA_MAX_RETRIES if args.max_retries is None else args.max_retries,
+                timeout=args.request_timeout or OLLAMA_REQUEST_TIMEOUT
+            ))
+        if args.hedge_percentile:
+            configure_hedging(HedgePolicy(percentile=args.hedge_percentile))
+
+        corpus, expected_tables = load_corpus(args.corpus)
+        agent = AIAgent({
+            'example_queries': EXAMPLE_QUERIES,
+            'table_metadata': TABLE_METADATA,
+            'result_cache': args.cache,
+            'stage_profiles': load_stage_profiles(args.stage_profiles),
+            'warmup': not args.no_model_warmup,
+            'refinement_fast_path': not args.no_refinement_fast_path,
+            'speculative_selection': args.speculative,
+            'mode': args.mode,
+            'chat_session': args.chat_session,
+            'prompt_layout': args.prompt_layout
+        })
+        await agent.start()
+
+        print(f'🏁 Benchmarking {len(corpus)} questions ({args.mode} mode, {args.prompt_layout} prompts) at concurrency {args.concurrency}...')
+        with redirect_stdout(io.StringIO()):
+            await run_workload(agent, corpus, args.concurrency, 0, args.warmup)
+            cpu_start = time.process_time()
+            start = time.time()
+            results = await run_workload(agent, corpus, args.concurrency, args.duration, args.requests)
+            elapsed = time.time() - start
+            cpu_seconds = time.process_time() - cpu_start
+        await agent.close()
+
+        report = {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+            'summary': summarize(results, elapsed, cpu_seconds, expected_tables),
+            'connection_stats': agent.get_connection_stats(),
+            'routing_stats': agent.get_routing_stats(),
+            'warmup_stats': agent.get_warmup_stats()
+        }
+    finally:
+        for standin in standins:
+            standin.terminate()
+            standin.wait()
+        configure_cassette(None)
+
+    summary = report['summary']
+    print(f'📈 {summary["requests"]} requests in {summary["elapsed_seconds"]:.1f}s: {summary["requests_per_second"]:.2f} req/s, {summary["failed"]} failed')
+    print(f'⏱️  end-to-end p50/p95/p99: {summary["latency_ms"]["p50"]}/{summary["latency_ms"]["p95"]}/{summary["latency_ms"]["p99"]} ms')
+    for stage, stats in summary['stages'].items():
+        latency = stats['latency_ms']
+        prompt_chars = f'{stats["prompt_chars_mean"]:.0f}' if stats['prompt_chars_mean'] is not None else '-'
+        tokens_cached = f'{stats["prompt_tokens_cached_mean"]:.0f}' if stats['prompt_tokens_cached_mean'] is not None else '-'
+        prompt_eval = f'{stats["prompt_eval_ms_mean"]:.1f}' if stats['prompt_eval_ms_mean'] is not None else '-'
+        print(f'   {stage:<18} p50 {latency["p50"]:8.1f}  p95 {latency["p95"]:8.1f}  p99 {latency["p99"]:8.1f} ms  '
+              f'prompt chars {prompt_chars}, session cached tokens {tokens_cached}, prompt eval {prompt_eval} ms')
+    calls = summary['ollama_calls']
+    print(f'🔁 {calls["total"]} Ollama calls: {calls["retries"]} retries, {calls["hedged"]} hedged, {calls["errors"]} failed, {calls["cold_loads"]} cold loads')
+    print(f'📝 Refinement skipped for {summary["refinement_skipped"]} of {summary["requests"]} requests')
+    accuracy = summary['table_accuracy']
+    if accuracy['scored']:
+        print(f'🎯 Table selection: {accuracy["exact_pct"]:.0f}% exact, recall {accuracy["recall_pct"]:.0f}%, precision {accuracy["precision_pct"]:.0f}% over {accuracy["scored"]} scored requests')
+    if summary['speculation']:
+        print(f'🔮 Speculative selections: {summary["speculation"]}')
+    print(f'🧮 CPU {summary["cpu_seconds"]:.2f}s ({summary["cpu_ms_per_request"]:.2f} ms/request), peak RSS {summary["peak_rss_mb"]:.1f} MB')
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2, default=str)
+        print(f'💾 Wrote {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = compare(report, json.load(handle), args.threshold)
+        if regressions:
+            print('⚠️  Regressions against baseline:')
+            for regression in regressions:
+                print(f'   {regression}')
+            return 1
+        print('✅ No regressions against baseline')
+    return 0
+
+
+if __name__ == "__main__":
+    # main and the components configure INFO logging on import; keep the benchmark output readable
+    logging.getLogger().setLevel(logging.WARNING)
+    sys.exit(asyncio.run(bench(build_arg_parser().parse_args())))
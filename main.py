@@ -2,7 +2,7 @@ import asyncio
 import sys
 import logging
 from src.ai_agent import AIAgent
-from src.utils.ollama_client import check_ollama_connection, list_ollama_models
+from src.utils.ollama_client import check_ollama_connection, list_ollama_models, get_client_pool
 
 # Set up main logger
 logger = logging.getLogger(__name__)
@@ -73,71 +73,80 @@ async def main():
     logger.info("Starting AI SQL Agent Demo")
     print('🚀 AI SQL Agent Demo (Python)\n')
     
-    logger.info("Checking Ollama connection")
-    print('🔌 Checking Ollama connection...')
-    is_connected = await check_ollama_connection()
+    agent = None
+    try:
+        logger.info("Checking Ollama connection")
+        print('🔌 Checking Ollama connection...')
+        is_connected = await check_ollama_connection()
     
-    if not is_connected:
-        logger.error("Failed to connect to Ollama")
-        print('❌ Cannot connect to Ollama. Please ensure Ollama is running on http://localhost:11434')
-        print('💡 Install Ollama from: https://ollama.ai')
-        print('💡 Start Ollama with: ollama serve')
-        print('💡 Pull a model with: ollama pull llama3.1')
-        return
+        if not is_connected:
+            logger.error("Failed to connect to Ollama")
+            print('❌ Cannot connect to Ollama. Please ensure Ollama is running on http://localhost:11434')
+            print('💡 Install Ollama from: https://ollama.ai')
+            print('💡 Start Ollama with: ollama serve')
+            print('💡 Pull a model with: ollama pull llama3.1')
+            return
     
-    logger.info("Ollama connection successful")
-    print('✅ Ollama connection successful')
+        logger.info("Ollama connection successful")
+        print('✅ Ollama connection successful')
     
-    try:
-        logger.info("Listing available Ollama models")
-        models = await list_ollama_models()
-        logger.info(f"Found {len(models)} available models: {models}")
-        print(f'📋 Available models: {", ".join(models)}')
-    except Exception as e:
-        logger.warning(f"Could not list available models: {str(e)}")
-        print('⚠️  Could not list available models')
+        try:
+            logger.info("Listing available Ollama models")
+            models = await list_ollama_models()
+            logger.info(f"Found {len(models)} available models: {models}")
+            print(f'📋 Available models: {", ".join(models)}')
+        except Exception as e:
+            logger.warning(f"Could not list available models: {str(e)}")
+            print('⚠️  Could not list available models')
     
-    logger.info(f"Initializing AI Agent with {len(EXAMPLE_QUERIES)} example queries and {len(TABLE_METADATA)} tables")
-    agent = AIAgent({
-        'example_queries': EXAMPLE_QUERIES,
-        'table_metadata': TABLE_METADATA
-    })
+        logger.info(f"Initializing AI Agent with {len(EXAMPLE_QUERIES)} example queries and {len(TABLE_METADATA)} tables")
+        agent = AIAgent({
+            'example_queries': EXAMPLE_QUERIES,
+            'table_metadata': TABLE_METADATA
+        })
+        await agent.start()
     
-    test_queries = [
-        "Show me the top 5 customers by total spending this year",
-        "What are the best selling products in electronics category?",
-        "Get monthly sales trends for the last 6 months"
-    ]
+        test_queries = [
+            "Show me the top 5 customers by total spending this year",
+            "What are the best selling products in electronics category?",
+            "Get monthly sales trends for the last 6 months"
+        ]
     
-    logger.info(f"Starting processing of {len(test_queries)} test queries")
+        logger.info(f"Starting processing of {len(test_queries)} test queries")
+        batch = await agent.process_queries(test_queries, max_concurrency=3)
     
-    for i, query in enumerate(test_queries, 1):
-        logger.info(f"Processing query {i}/{len(test_queries)}: '{query}'")
-        print(f'\n{"=" * 60}')
-        print(f'Query: {query}')
-        print(f'{"=" * 60}')
+        for i, (query, result) in enumerate(zip(test_queries, batch['results']), 1):
+            print(f'\n{"=" * 60}')
+            print(f'Query: {query}')
+            print(f'{"=" * 60}')
         
-        result = await agent.process_query(query)
-        
-        if result['success']:
-            logger.info(f"Query {i} processed successfully in {result['processing_time']}ms")
-            print('\n📊 Generated SQL Query:')
-            print('```sql')
-            print(result['final_query'])
-            print('```\n')
+            if result['success']:
+                logger.info(f"Query {i} processed successfully in {result['processing_time']}ms")
+                print('\n📊 Generated SQL Query:')
+                print('```sql')
+                print(result['final_query'])
+                print('```\n')
             
-            summary = agent.get_processing_summary(result)
-            logger.debug(f"Query {i} summary: {summary}")
-            print('📋 Processing Summary:')
-            print(f'- Refined Input: "{summary["steps"].get("refinement", {}).get("refined", "N/A")}"')
-            print(f'- Selected Tables: {", ".join(summary["steps"].get("table_selection", {}).get("selected_tables", [])) or "N/A"}')
-            print(f'- Query Confidence: {summary["steps"].get("query_selection", {}).get("confidence", "N/A")}%')
-            print(f'- Processing Time: {summary["processing_time"]}ms')
-            print(f'- Query Valid: {"✅" if summary["steps"].get("validation", {}).get("is_valid") else "❌"}')
-        else:
-            logger.error(f"Query {i} failed: {result['error']}")
-            print(f'\n❌ Error: {result["error"]}')
+                summary = agent.get_processing_summary(result)
+                logger.debug(f"Query {i} summary: {summary}")
+                print('📋 Processing Summary:')
+                print(f'- Refined Input: "{summary["steps"].get("refinement", {}).get("refined", "N/A")}"')
+                print(f'- Selected Tables: {", ".join(summary["steps"].get("table_selection", {}).get("selected_tables", [])) or "N/A"}')
+                print(f'- Query Confidence: {summary["steps"].get("query_selection", {}).get("confidence", "N/A")}%')
+                print(f'- Processing Time: {summary["processing_time"]}ms')
+                print(f'- Query Valid: {"✅" if summary["steps"].get("validation", {}).get("is_valid") else "❌"}')
+            else:
+                logger.error(f"Query {i} failed: {result['error']}")
+                print(f'\n❌ Error: {result["error"]}')
 
+        print(f'\n📈 Processed {batch["total"]} queries in {batch["processing_time"]}ms ({batch["throughput"]:.2f} queries/s)')
+        logger.info(f"Connection pool stats: {agent.get_connection_stats()}")
+    finally:
+        # Stop the agent's background tasks and close the pooled connections while the loop is still running
+        if agent is not None:
+            await agent.close()
+        else:
+            await get_client_pool().close()
     logger.info("AI SQL Agent Demo completed")
 
 
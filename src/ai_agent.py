@@ -1,14 +1,58 @@
+import copy
 import time
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Awaitable, AsyncIterator, Tuple
 from .components.input_refinement import InputRefinement
 from .components.query_selector import QuerySelector
 from .components.table_selector import TableSelector
 from .components.query_generator import QueryGenerator
+from .components.fused_selector import FusedSelector
+from .utils.ollama_client import (
+    get_client_pool, get_response_cache, get_router, configure_ollama, chat_session, ChatSession, OLLAMA_HEALTH_INTERVAL,
+    OLLAMA_FAST_MODEL, OLLAMA_KEEP_ALIVE_REFRESH
+)
+from .utils.model_warmer import ModelWarmer
+from .utils.pipeline import Pipeline, PipelineStage
+from .utils.prompt_templates import PromptTemplate, PROMPT_LAYOUTS, PREFIX_FIRST_LAYOUT
+from .utils.response_cache import LRUCache
+from .utils.metrics import trace_request, stage_scope, record_stage_skip
+from .utils.precision_classifier import PrecisionClassifier
+from .utils.resilience import deadline_scope
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+# Model and generation options per LLM stage; refinement and selection answers are short, so they get
+# tight output limits and, when OLLAMA_FAST_MODEL is set, the smaller model
+DEFAULT_STAGE_PROFILES = {
+    'refinement': {'model': OLLAMA_FAST_MODEL, 'num_predict': 256},
+    'query_selection': {'model': OLLAMA_FAST_MODEL, 'num_predict': 512},
+    'table_selection': {'model': OLLAMA_FAST_MODEL, 'num_predict': 1024},
+    'fused_selection': {'model': OLLAMA_FAST_MODEL, 'num_predict': 1280},
+    'query_generation': {'num_predict': 2000}
+}
+
+# System message of a chat session: the static catalog every stage of a request refers to
+CATALOG_SYSTEM_PROMPT = PromptTemplate("""
+You help turn questions about the database described below into Redshift SQL. The requests that follow refer to these example queries and tables.
+
+Available Example Queries:
+{example_queries_text}
+
+Available Tables and Columns:
+{metadata_text}
+""")
+
+
+def normalize_user_input(user_input: str) -> str:
+    """Fold case, runs of whitespace and trailing sentence punctuation so trivially different phrasings share a cache key.
+
+    Operators, '%', '-' and other symbols are kept, since questions that differ
+    only in them ask for different data.
+    """
+    return ' '.join(user_input.lower().split()).rstrip('.?! ')
+
 
 class AIAgent:
     """Main AI agent for SQL query generation."""
@@ -17,99 +61,264 @@ class AIAgent:
         config = config or {}
         logger.info("Initializing AI Agent")
         
+        # Per-stage overrides from config['stage_profiles'] are merged over the defaults
+        stage_profiles = config.get('stage_profiles', {})
+        self.stage_profiles = {
+            stage: {**profile, **stage_profiles.get(stage, {})}
+            for stage, profile in DEFAULT_STAGE_PROFILES.items()
+        }
+        logger.debug(f"Stage profiles: {self.stage_profiles}")
+        
+        # 'prefix_first' puts each prompt's static instructions and catalog ahead of the request so the
+        # server's prompt cache can reuse them across requests; 'legacy' keeps the original order
+        self.prompt_layout = config.get('prompt_layout', PREFIX_FIRST_LAYOUT)
+        if self.prompt_layout not in PROMPT_LAYOUTS:
+            raise ValueError(f"Unknown prompt layout: {self.prompt_layout}")
+        
         logger.debug("Creating InputRefinement component")
-        self.input_refinement = InputRefinement()
+        self.input_refinement = InputRefinement(profile=self.stage_profiles['refinement'], prompt_layout=self.prompt_layout)
         
         logger.debug(f"Creating QuerySelector with {len(config.get('example_queries', []))} example queries")
-        self.query_selector = QuerySelector(config.get('example_queries', []))
+        self.query_selector = QuerySelector(
+            config.get('example_queries', []),
+            top_k=config.get('example_top_k', 8),
+            embed_model=config.get('embed_model'),
+            use_schema=config.get('structured_output', True),
+            profile=self.stage_profiles['query_selection'],
+            prompt_layout=self.prompt_layout
+        )
         
         logger.debug(f"Creating TableSelector with {len(config.get('table_metadata', {}))} tables")
-        self.table_selector = TableSelector(config.get('table_metadata', {}))
+        self.table_selector = TableSelector(
+            config.get('table_metadata', {}),
+            max_tables=config.get('max_tables', 20),
+            max_columns_per_table=config.get('max_columns_per_table', 30),
+            embed_model=config.get('embed_model'),
+            use_schema=config.get('structured_output', True),
+            profile=self.stage_profiles['table_selection'],
+            prompt_layout=self.prompt_layout
+        )
+        
+        # Local checks that let already-precise questions skip the refinement round-trip and
+        # decide whether selections run speculatively on the raw input survive the refinement
+        self.precision_classifier = PrecisionClassifier(config.get('table_metadata', {}))
+        self.refinement_fast_path = config.get('refinement_fast_path', True)
+        self.speculative_selection = config.get('speculative_selection', False)
+        self.speculation_min_similarity = config.get('speculation_min_similarity', 0.6)
+        self._refinement_ewma_ms: Optional[float] = None
+        
+        # 'staged' runs refinement, query selection and table selection as separate calls;
+        # 'fused' asks for all three in one call and falls back to the staged calls if it fails
+        self.mode = config.get('mode', 'staged')
+        if self.mode not in ('staged', 'fused'):
+            raise ValueError(f"Unknown pipeline mode: {self.mode}")
+        self.fused_selector = FusedSelector(
+            self.query_selector,
+            self.table_selector,
+            use_schema=config.get('structured_output', True),
+            profile=self.stage_profiles['fused_selection'],
+            prompt_layout=self.prompt_layout
+        )
         
         logger.debug("Creating QueryGenerator component")
-        self.query_generator = QueryGenerator()
+        self.query_generator = QueryGenerator(
+            profile=self.stage_profiles['query_generation'],
+            prompt_layout=self.prompt_layout
+        )
+        
+        # Run each request's LLM calls as turns of one chat whose system message holds the catalog. Off by
+        # default: turns run one at a time, so query and table selection no longer overlap and latency
+        # only improves when the saved prompt evaluation outweighs that
+        self.chat_session = config.get('chat_session', False)
+        self._catalog_prompt: Optional[str] = None
         
         self.config = config
+        self.client_pool = get_client_pool()
+        self.model_warmer: Optional[ModelWarmer] = None
+        self.pipeline = self._build_pipeline()
+        
+        # Whole-pipeline results keyed on normalized input; cleared whenever the catalog changes
+        self.result_cache = LRUCache(
+            max_entries=config.get('result_cache_size', 256),
+            ttl=config.get('result_cache_ttl')
+        ) if config.get('result_cache', True) else None
+        self.catalog_version = 0
         logger.info("AI Agent initialization completed")
     
+    async def start(self) -> None:
+        """Open the pooled Ollama connections, probe every replica once and keep probing them in the background, then build the retrieval indexes."""
+        logger.info("Starting AI Agent")
+        hosts = self.config.get('ollama_hosts')
+        if hosts:
+            configure_ollama(host=','.join(hosts))
+        await self.client_pool.open(hosts)
+        router = get_router()
+        await router.refresh()
+        interval = self.config.get('health_check_interval', OLLAMA_HEALTH_INTERVAL)
+        if interval:
+            router.start_probing(interval)
+        if self.config.get('warmup', True):
+            await self.warm_up()
+        await self.build_retrieval_indexes()
+    
+    async def build_retrieval_indexes(self) -> None:
+        """Embed the example queries and schema catalog for retrieval before serving, so no request waits on them."""
+        await asyncio.gather(self.query_selector.build_index(), self.table_selector.build_index())
+    
+    async def warm_up(self) -> Dict[str, Dict[str, Any]]:
+        """Preload every stage's model on every replica, pinned with keep_alive, and keep them loaded while traffic flows."""
+        stages = ['fused_selection', 'query_generation'] if self.mode == 'fused' else [
+            stage for stage in self.stage_profiles if stage != 'fused_selection'
+        ]
+        embed_models = []
+        if self.query_selector.uses_retrieval or self.table_selector.uses_retrieval:
+            embed_models.append(self.config.get('embed_model'))
+        self.model_warmer = ModelWarmer(
+            [self.stage_profiles[stage].get('model') for stage in stages],
+            embed_models,
+            keep_alive=self.config.get('keep_alive'),
+            refresh_interval=self.config.get('keep_alive_refresh', OLLAMA_KEEP_ALIVE_REFRESH)
+        )
+        start_time = time.time()
+        stats = await self.model_warmer.warm()
+        logger.info(f"Model warm-up finished in {int((time.time() - start_time) * 1000)}ms")
+        self.model_warmer.start()
+        return stats
+    
+    async def close(self) -> None:
+        """Stop the health probes and keep-alive refresher and close the pooled Ollama connections."""
+        logger.info("Closing AI Agent")
+        await self.query_selector.close()
+        await self.table_selector.close()
+        if self.model_warmer is not None:
+            await self.model_warmer.stop()
+        await get_router().stop_probing()
+        await self.client_pool.close()
+    
+    async def __aenter__(self) -> 'AIAgent':
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+    
+    def get_connection_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get connection pool reuse statistics per Ollama host."""
+        return self.client_pool.get_stats()
+    
+    def get_routing_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get in-flight requests, latency EWMA, loaded models and circuit breaker state per Ollama replica."""
+        return get_router().get_stats()
+    
+    def get_warmup_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get the last model preload result per Ollama replica and model."""
+        return self.model_warmer.get_stats() if self.model_warmer is not None else {}
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss statistics of the Ollama response cache."""
+        cache = get_response_cache()
+        return cache.get_stats() if cache is not None else {}
+    
     def add_example_query(self, query: str, description: str) -> None:
         """Add an example query to the query selector."""
         logger.debug(f"Adding example query: {description}")
         self.query_selector.add_example_query(query, description)
+        self._invalidate_result_cache()
     
     def add_table_metadata(self, table_name: str, metadata: Dict[str, Any]) -> None:
         """Add table metadata to the table selector."""
         logger.debug(f"Adding table metadata for: {table_name}")
         self.table_selector.add_table_metadata(table_name, metadata)
+        self.precision_classifier.add_table(table_name, metadata)
+        self._invalidate_result_cache()
     
-    async def process_query(self, user_input: str) -> Dict[str, Any]:
-        """Process a user query through the complete AI agent pipeline."""
+    def _invalidate_result_cache(self) -> None:
+        """Drop cached pipeline results after a catalog change."""
+        self.catalog_version += 1
+        self._catalog_prompt = None
+        if self.result_cache is not None and len(self.result_cache):
+            logger.info(f"Catalog changed, invalidating {len(self.result_cache)} cached results")
+            self.result_cache.clear()
+    
+    def _new_session(self) -> Optional[ChatSession]:
+        """A chat session for one request, if sessions are on and the whole catalog fits in its system message."""
+        if not self.chat_session:
+            return None
+        if self.query_selector.uses_retrieval or self.table_selector.uses_retrieval:
+            logger.debug("Catalog is shortlisted per request, running without a chat session")
+            return None
+        if self._catalog_prompt is None:
+            self._catalog_prompt = CATALOG_SYSTEM_PROMPT.render(
+                example_queries_text=self.query_selector.catalog_text() or 'No example queries available',
+                metadata_text=self.table_selector.catalog_text()
+            )
+        return ChatSession(self._catalog_prompt)
+    
+    async def process_query(
+        self,
+        user_input: str,
+        bypass_cache: bool = False,
+        on_token: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Process a user query through the complete AI agent pipeline.
+        
+        When on_token is given, the final SQL is streamed to it chunk by chunk
+        and the time to its first chunk is recorded as time_to_first_token (ms).
+        timeout (seconds, defaulting to the 'request_timeout' config) bounds the
+        whole pipeline, including retries of individual Ollama calls.
+        """
         logger.info(f"Starting query processing pipeline for: '{user_input}'")
         start_time = time.time()
+        
+        cache_key = normalize_user_input(user_input)
+        if self.result_cache is not None and not bypass_cache:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                result = copy.deepcopy(cached)
+                result['user_input'] = user_input
+                result['cache_hit'] = True
+                result['metrics'] = {'stages': {}, 'calls': []}
+                result['processing_time'] = int((time.time() - start_time) * 1000)
+                if on_token is not None:
+                    on_token(result['final_query'])
+                    result['time_to_first_token'] = result['processing_time']
+                logger.info(f"=== Served pipeline result from cache in {result['processing_time']}ms ===")
+                print(f'⚡ Served cached result in {result["processing_time"]}ms')
+                return result
+        
         result = {
             'user_input': user_input,
             'steps': {},
             'final_query': None,
             'success': False,
-            'processing_time': 0
+            'cache_hit': False,
+            'processing_time': 0,
+            'time_to_first_token': None
         }
+        catalog_version = self.catalog_version
+        
+        context = {}
+        if on_token is not None:
+            def forward_token(chunk: str) -> None:
+                if result['time_to_first_token'] is None:
+                    result['time_to_first_token'] = int((time.time() - start_time) * 1000)
+                on_token(chunk)
+            context['on_token'] = forward_token
         
         try:
             logger.info("=== AI Agent Pipeline Started ===")
             print('🤖 Starting AI Agent processing...')
             
-            logger.info("Step 1: Starting input refinement")
-            print('📝 Step 1: Refining user input...')
-            result['steps']['refinement'] = await self.input_refinement.refine_user_input(user_input)
-            
-            if not result['steps']['refinement']['success']:
-                logger.error(f"Input refinement failed: {result['steps']['refinement']['error']}")
-                raise Exception(f"Input refinement failed: {result['steps']['refinement']['error']}")
-            
-            logger.info(f"Step 1 completed: '{result['steps']['refinement']['refined']}'")
-            
-            logger.info("Step 2: Starting query pattern selection")
-            print('🔍 Step 2: Selecting appropriate query pattern...')
-            result['steps']['query_selection'] = await self.query_selector.select_best_query(
-                result['steps']['refinement']['refined']
-            )
-            
-            logger.info(f"Step 2 completed with confidence: {result['steps']['query_selection'].get('confidence', 'N/A')}%")
-            
-            logger.info("Step 3: Starting table and column selection")
-            print('🗂️ Step 3: Selecting tables and columns...')
-            result['steps']['table_selection'] = await self.table_selector.select_tables_and_columns(
-                result['steps']['refinement']['refined']
-            )
-            
-            if not result['steps']['table_selection']['success']:
-                logger.error(f"Table selection failed: {result['steps']['table_selection']['error']}")
-                raise Exception(f"Table selection failed: {result['steps']['table_selection']['error']}")
-            
-            logger.info(f"Step 3 completed: selected {len(result['steps']['table_selection']['selected_tables'])} tables")
-            
-            logger.info("Step 4: Starting SQL query generation")
-            print('⚡ Step 4: Generating final Redshift query...')
-            result['steps']['query_generation'] = await self.query_generator.generate_redshift_query(
-                result['steps']['refinement']['refined'],
-                result['steps']['query_selection']['selected_query'],
-                result['steps']['table_selection']['selected_tables'],
-                result['steps']['table_selection']['selected_columns']
-            )
-            
-            if not result['steps']['query_generation']['success']:
-                logger.error(f"Query generation failed: {result['steps']['query_generation']['error']}")
-                raise Exception(f"Query generation failed: {result['steps']['query_generation']['error']}")
-            
-            logger.info("Step 4 completed: SQL query generated")
-            
-            logger.info("Step 5: Starting query validation")
-            print('✅ Step 5: Validating generated query...')
-            result['steps']['validation'] = self.query_generator.validate_query(
-                result['steps']['query_generation']['query']
-            )
-            
-            logger.info(f"Step 5 completed: query valid = {result['steps']['validation']['is_valid']}")
+            session = self._new_session()
+            with trace_request() as trace, deadline_scope(timeout or self.config.get('request_timeout')), chat_session(session):
+                try:
+                    await self.pipeline.run(result, context)
+                finally:
+                    self._cancel_speculation(context)
+                    result['metrics'] = trace.summary()
+                    if session is not None:
+                        result['chat_session'] = {'host': session.host, 'turns': len(session.turns) // 2}
             
             result['final_query'] = result['steps']['query_generation']['query']
             result['success'] = True
@@ -118,6 +327,10 @@ class AIAgent:
             logger.info(f"=== Pipeline completed successfully in {result['processing_time']}ms ===")
             print(f'🎉 Processing completed successfully in {result["processing_time"]}ms')
             
+            # Skip storing results computed against a catalog that changed mid-flight
+            if self.result_cache is not None and catalog_version == self.catalog_version:
+                self.result_cache.set(cache_key, copy.deepcopy(result))
+            
             return result
             
         except Exception as error:
@@ -130,11 +343,335 @@ class AIAgent:
             
             return result
     
+    async def iter_process_queries(
+        self,
+        inputs: List[str],
+        max_concurrency: int = 4
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """Process many queries concurrently, yielding (input_index, result) as each completes.
+        
+        At most max_concurrency pipelines run at once, and inputs that normalize
+        to the same text share a single pipeline run.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(indices: List[int]) -> Tuple[List[int], Dict[str, Any]]:
+            async with semaphore:
+                return indices, await self.process_query(inputs[indices[0]])
+        
+        indices_by_key: Dict[str, List[int]] = {}
+        for index, user_input in enumerate(inputs):
+            indices_by_key.setdefault(normalize_user_input(user_input), []).append(index)
+        
+        logger.info(f"Processing {len(inputs)} queries ({len(indices_by_key)} unique) with max_concurrency={max_concurrency}")
+        tasks = [asyncio.create_task(run(indices)) for indices in indices_by_key.values()]
+        
+        try:
+            for completed in asyncio.as_completed(tasks):
+                indices, result = await completed
+                for position, index in enumerate(indices):
+                    if position == 0:
+                        yield index, result
+                    else:
+                        duplicate = copy.deepcopy(result)
+                        duplicate['user_input'] = inputs[index]
+                        yield index, duplicate
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def process_queries(self, inputs: List[str], max_concurrency: int = 4) -> Dict[str, Any]:
+        """Process many queries concurrently and return their results in input order with throughput stats."""
+        start_time = time.time()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(inputs)
+        
+        async for index, result in self.iter_process_queries(inputs, max_concurrency=max_concurrency):
+            results[index] = result
+        
+        elapsed = time.time() - start_time
+        succeeded = sum(1 for result in results if result['success'])
+        batch = {
+            'results': results,
+            'total': len(inputs),
+            'unique': len({normalize_user_input(user_input) for user_input in inputs}),
+            'succeeded': succeeded,
+            'failed': len(inputs) - succeeded,
+            'processing_time': int(elapsed * 1000),
+            'throughput': len(inputs) / elapsed if elapsed > 0 else 0.0
+        }
+        
+        logger.info(f"Processed {batch['total']} queries in {batch['processing_time']}ms ({batch['throughput']:.2f} queries/s, {batch['failed']} failed)")
+        return batch
+    
+    async def stream_query(self, user_input: str, bypass_cache: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Process a user query, yielding SQL token events as they arrive and the full result last.
+        
+        Yields {'type': 'token', 'content': chunk} for each generated chunk,
+        then {'type': 'result', 'result': result}.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self.process_query(user_input, bypass_cache=bypass_cache, on_token=queue.put_nowait))
+        
+        try:
+            while True:
+                next_chunk = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait([next_chunk, task], return_when=asyncio.FIRST_COMPLETED)
+                if next_chunk in done:
+                    yield {'type': 'token', 'content': next_chunk.result()}
+                    continue
+                
+                next_chunk.cancel()
+                while not queue.empty():
+                    yield {'type': 'token', 'content': queue.get_nowait()}
+                yield {'type': 'result', 'result': task.result()}
+                return
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    def _build_pipeline(self) -> Pipeline:
+        """Describe the processing steps as a dependency graph.
+        
+        Query selection and table selection both depend only on the refined input,
+        so they run concurrently once refinement completes. In fused mode a single
+        stage produces all three results.
+        """
+        if self.mode == 'fused':
+            return Pipeline([
+                PipelineStage('fused_selection', self._run_fused_selection, description='Fused selection'),
+                PipelineStage(
+                    'query_generation',
+                    self._run_query_generation,
+                    depends_on=['fused_selection'],
+                    description='Query generation'
+                ),
+                PipelineStage('validation', self._run_validation, depends_on=['query_generation'], fatal=False)
+            ])
+        
+        return Pipeline([
+            PipelineStage('refinement', self._run_refinement, description='Input refinement'),
+            PipelineStage('query_selection', self._run_query_selection, depends_on=['refinement'], fatal=False),
+            PipelineStage('table_selection', self._run_table_selection, depends_on=['refinement'], description='Table selection'),
+            PipelineStage(
+                'query_generation',
+                self._run_query_generation,
+                depends_on=['query_selection', 'table_selection'],
+                description='Query generation'
+            ),
+            PipelineStage('validation', self._run_validation, depends_on=['query_generation'], fatal=False)
+        ])
+    
+    async def _run_refinement(self, result: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """Step 1: refine the raw user input, unless it already names its tables, columns and time range."""
+        assessment = None
+        if self.refinement_fast_path:
+            assessment = self.precision_classifier.assess(result['user_input'])
+            if assessment['precise']:
+                logger.info(f"Step 1 skipped: input is already precise (checked in {assessment['elapsed_ms']:.3f}ms)")
+                print('📝 Step 1: Input already precise, skipping refinement')
+                # The saving is estimated from the recent latency of refinement calls
+                record_stage_skip('refinement', self._refinement_ewma_ms)
+                return {
+                    'original': result['user_input'],
+                    'refined': result['user_input'],
+                    'success': True,
+                    'skipped': True,
+                    'precision': assessment,
+                    'saved_ms': self._refinement_ewma_ms
+                }
+            logger.info(f"Input needs refinement: {', '.join(assessment['reasons'])}")
+        
+        if self.speculative_selection:
+            self._start_speculation(result['user_input'], context)
+        
+        logger.info("Step 1: Starting input refinement")
+        print('📝 Step 1: Refining user input...')
+        start_time = time.time()
+        refinement = await self.input_refinement.refine_user_input(result['user_input'])
+        refinement['skipped'] = False
+        if assessment is not None:
+            refinement['precision'] = assessment
+        if 'speculation' in context:
+            refinement['speculation'] = self._check_speculation(result['user_input'], refinement['refined'], context)
+        
+        if refinement['success']:
+            elapsed_ms = (time.time() - start_time) * 1000
+            self._refinement_ewma_ms = elapsed_ms if self._refinement_ewma_ms is None else 0.2 * elapsed_ms + 0.8 * self._refinement_ewma_ms
+            logger.info(f"Step 1 completed: '{refinement['refined']}'")
+        else:
+            logger.error(f"Input refinement failed: {refinement['error']}")
+        return refinement
+    
+    def _start_speculation(self, user_input: str, context: Dict[str, Any]) -> None:
+        """Start query and table selection on the raw input while refinement runs."""
+        async def speculate(stage: str, select: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+            # Outside the chat session, whose turns would queue behind the refinement this is meant to overlap
+            with stage_scope(f'{stage}_speculative'), chat_session(None):
+                return await select(user_input)
+        
+        logger.info("Starting speculative query and table selection on the raw input")
+        context['speculation'] = {
+            'query_selection': asyncio.create_task(speculate('query_selection', self.query_selector.select_best_query)),
+            'table_selection': asyncio.create_task(speculate('table_selection', self.table_selector.select_tables_and_columns))
+        }
+    
+    def _check_speculation(self, user_input: str, refined: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep the speculative selections if the refinement kept the question's intent, else cancel them."""
+        comparison = self.precision_classifier.compare(user_input, refined)
+        comparison['accepted'] = refined == user_input or comparison['similarity'] >= self.speculation_min_similarity
+        if comparison['accepted']:
+            logger.info(f"Refinement kept the intent (similarity {comparison['similarity']:.2f}), keeping speculative selections")
+        else:
+            logger.info(f"Refinement changed the intent (similarity {comparison['similarity']:.2f}), cancelling speculative selections")
+            for stage in context.get('speculation', {}):
+                comparison[stage] = 'cancelled'
+            self._cancel_speculation(context)
+        return comparison
+    
+    @staticmethod
+    def _cancel_speculation(context: Dict[str, Any]) -> None:
+        for task in context.pop('speculation', {}).values():
+            task.cancel()
+    
+    async def _speculative_result(
+        self,
+        stage: str,
+        result: Dict[str, Any],
+        context: Dict[str, Any],
+        accept: Callable[[Dict[str, Any]], bool]
+    ) -> Optional[Dict[str, Any]]:
+        """The stage's speculative result if one was started and passes accept, else None so the stage reruns.
+
+        The outcome is recorded in the refinement step's speculation entry.
+        """
+        task = context.get('speculation', {}).pop(stage, None)
+        if task is None:
+            return None
+        stage_result = await task
+        speculation = result['steps']['refinement']['speculation']
+        if stage_result.get('success', True) and accept(stage_result):
+            logger.info(f"Using speculative {stage} result")
+            speculation[stage] = 'accepted'
+            return stage_result
+        logger.info(f"Speculative {stage} result rejected, rerunning on the refined input")
+        speculation[stage] = 'rerun'
+        return None
+    
+    async def _run_query_selection(self, result: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """Step 2: pick the closest example query for the refined input."""
+        speculative = await self._speculative_result('query_selection', result, context, lambda selection: True)
+        if speculative is not None:
+            return speculative
+        
+        logger.info("Step 2: Starting query pattern selection")
+        print('🔍 Step 2: Selecting appropriate query pattern...')
+        query_selection = await self.query_selector.select_best_query(
+            result['steps']['refinement']['refined']
+        )
+        
+        logger.info(f"Step 2 completed with confidence: {query_selection.get('confidence', 'N/A')}%")
+        return query_selection
+    
+    async def _run_table_selection(self, result: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """Step 3: pick the tables and columns for the refined input."""
+        def covers_refinement(selection: Dict[str, Any]) -> bool:
+            # Every table and column the refinement added must already be in the speculative selection
+            comparison = result['steps']['refinement']['speculation']
+            selected_columns = {column for columns in selection['selected_columns'].values() for column in columns}
+            return set(comparison['new_tables']) <= set(selection['selected_tables']) and set(comparison['new_columns']) <= selected_columns
+        
+        speculative = await self._speculative_result('table_selection', result, context, covers_refinement)
+        if speculative is not None:
+            return speculative
+        
+        logger.info("Step 3: Starting table and column selection")
+        print('🗂️ Step 3: Selecting tables and columns...')
+        table_selection = await self.table_selector.select_tables_and_columns(
+            result['steps']['refinement']['refined']
+        )
+        
+        if table_selection.get('success', True):
+            logger.info(f"Step 3 completed: selected {len(table_selection['selected_tables'])} tables")
+        else:
+            logger.error(f"Table selection failed: {table_selection['error']}")
+        return table_selection
+    
+    async def _run_fused_selection(self, result: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """Steps 1-3 in one call: refine the input and pick the example query, tables and columns.
+        
+        The three results are stored under their staged step names. If the fused
+        call fails, the staged calls run instead.
+        """
+        logger.info("Steps 1-3: Starting fused refinement and selection")
+        print('🧩 Steps 1-3: Refining input and selecting query pattern and tables...')
+        fused = await self.fused_selector.select(result['user_input'])
+        
+        if fused['success']:
+            for stage in ('refinement', 'query_selection', 'table_selection'):
+                result['steps'][stage] = {**fused[stage], 'fused': True}
+            logger.info(f"Steps 1-3 completed: selected {len(fused['table_selection']['selected_tables'])} tables")
+            return {'success': True, 'fallback': False}
+        
+        async def staged(stage: str, run: Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+            # Attribute the fallback calls to their own stages rather than to fused_selection
+            with stage_scope(stage):
+                return await run(result, context)
+        
+        logger.warning(f"Fused selection failed, falling back to staged calls: {fused['error']}")
+        refinement = await staged('refinement', self._run_refinement)
+        result['steps']['refinement'] = refinement
+        if not refinement['success']:
+            return {'success': False, 'fallback': True, 'fused_error': fused['error'], 'error': refinement['error']}
+        query_selection, table_selection = await asyncio.gather(
+            staged('query_selection', self._run_query_selection),
+            staged('table_selection', self._run_table_selection)
+        )
+        result['steps']['query_selection'] = query_selection
+        result['steps']['table_selection'] = table_selection
+        if not table_selection.get('success', True):
+            return {'success': False, 'fallback': True, 'fused_error': fused['error'], 'error': table_selection['error']}
+        return {'success': True, 'fallback': True, 'fused_error': fused['error']}
+    
+    async def _run_query_generation(self, result: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """Step 4: generate the final Redshift query."""
+        logger.info("Step 4: Starting SQL query generation")
+        print('⚡ Step 4: Generating final Redshift query...')
+        query_generation = await self.query_generator.generate_redshift_query(
+            result['steps']['refinement']['refined'],
+            result['steps']['query_selection']['selected_query'],
+            result['steps']['table_selection']['selected_tables'],
+            result['steps']['table_selection']['selected_columns'],
+            on_token=context.get('on_token')
+        )
+        
+        if query_generation['success']:
+            logger.info("Step 4 completed: SQL query generated")
+        else:
+            logger.error(f"Query generation failed: {query_generation['error']}")
+        return query_generation
+    
+    async def _run_validation(self, result: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """Step 5: validate the generated query."""
+        logger.info("Step 5: Starting query validation")
+        print('✅ Step 5: Validating generated query...')
+        validation = self.query_generator.validate_query(
+            result['steps']['query_generation']['query']
+        )
+        
+        logger.info(f"Step 5 completed: query valid = {validation['is_valid']}")
+        return validation
+    
     def get_processing_summary(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """Get a summary of the processing steps."""
         summary = {
             'success': result['success'],
             'processing_time': result['processing_time'],
+            'cache_hit': result.get('cache_hit', False),
+            'time_to_first_token': result.get('time_to_first_token'),
+            'stage_timings': {
+                name: step.get('duration_ms') for name, step in result['steps'].items()
+            },
             'steps': {}
         }
         
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional
+from .query_selector import QuerySelector
+from .table_selector import TableSelector
+from ..utils.ollama_client import call_ollama, split_profile, current_session
+from ..utils.prompt_templates import PromptTemplate, PromptLayout, SESSION_CATALOG_REFERENCE, PREFIX_FIRST_LAYOUT
+from ..utils.output_parsing import OutputParseError, parse_json_response
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+FUSED_PROMPT = PromptTemplate("""
+You are an expert SQL analyst. Given a user's request, a set of example SQL queries and database table metadata, prepare everything needed to write the SQL query in one pass.
+
+User Request: "{user_prompt}"
+
+Available Example Queries:
+{example_queries_text}
+
+Available Tables and Columns:
+{metadata_text}
+
+Please analyze the user request and:
+1. Rewrite it as a specific, unambiguous request for SQL generation
+2. Select the example query that best matches its intent, with a confidence score (0-100)
+3. Identify the tables and the specific columns from each table that are needed, with a confidence score (0-100)
+4. Explain your reasoning
+
+Respond in JSON format:
+{{
+  "refinedRequest": "<refined_request>",
+  "selectedQueryIndex": <example_number_of_selected_query>,
+  "queryConfidence": <confidence_score_0_to_100>,
+  "selectedTables": ["table1", "table2"],
+  "selectedColumns": {{
+    "table1": ["column1", "column2"],
+    "table2": ["column3", "column4"]
+  }},
+  "tableConfidence": <confidence_score_0_to_100>,
+  "reasoning": "<explanation_of_selections>"
+}}
+""")
+
+FUSED_LAYOUT = PromptLayout("""
+You are an expert SQL analyst. Given a user's request, a set of example SQL queries and database table metadata, prepare everything needed to write the SQL query in one pass.
+
+Available Example Queries:
+{example_queries_text}
+
+Available Tables and Columns:
+{metadata_text}
+
+Please analyze the user request below and:
+1. Rewrite it as a specific, unambiguous request for SQL generation
+2. Select the example query that best matches its intent, with a confidence score (0-100)
+3. Identify the tables and the specific columns from each table that are needed, with a confidence score (0-100)
+4. Explain your reasoning
+
+Respond in JSON format:
+{{
+  "refinedRequest": "<refined_request>",
+  "selectedQueryIndex": <example_number_of_selected_query>,
+  "queryConfidence": <confidence_score_0_to_100>,
+  "selectedTables": ["table1", "table2"],
+  "selectedColumns": {{
+    "table1": ["column1", "column2"],
+    "table2": ["column3", "column4"]
+  }},
+  "tableConfidence": <confidence_score_0_to_100>,
+  "reasoning": "<explanation_of_selections>"
+}}
+""", """
+User Request: "{user_prompt}"
+""", request_slots=['user_prompt'])
+
+# Fields every fused answer must carry, after key normalization
+RESPONSE_FIELDS = {
+    'refined_request': str,
+    'selected_query_index': int,
+    'query_confidence': (int, float),
+    'selected_tables': list,
+    'selected_columns': dict,
+    'table_confidence': (int, float),
+    'reasoning': str
+}
+
+
+class FusedSelector:
+    """Component that refines the input and selects the example query and tables in a single call.
+
+    The answer is split into the same refinement, query selection and table
+    selection results the staged components return, so everything downstream
+    of them works unchanged.
+    """
+
+    def __init__(
+        self,
+        query_selector: QuerySelector,
+        table_selector: TableSelector,
+        use_schema: bool = True,
+        profile: Optional[Dict[str, Any]] = None,
+        prompt_layout: str = PREFIX_FIRST_LAYOUT
+    ):
+        # Candidate retrieval and prompt sections are shared with the staged selectors
+        self.query_selector = query_selector
+        self.table_selector = table_selector
+        # Constrain the model's answer with a JSON schema limited to the candidate examples, tables and columns
+        self.use_schema = use_schema
+        # Model and generation options for this stage; anything unset falls back to OLLAMA_MODEL and DEFAULT_OPTIONS
+        self.model, self.options = split_profile(profile)
+        self.prompt = FUSED_LAYOUT if prompt_layout == PREFIX_FIRST_LAYOUT else FUSED_PROMPT
+
+    @staticmethod
+    def _response_schema(examples: List[int], tables: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """JSON schema for the fused answer, allowing only the candidate example numbers, tables and columns."""
+        return {
+            'type': 'object',
+            'properties': {
+                'refinedRequest': {'type': 'string'},
+                'selectedQueryIndex': {'type': 'integer', 'enum': [index + 1 for index in examples] or [0]},
+                'queryConfidence': {'type': 'integer', 'minimum': 0, 'maximum': 100},
+                'selectedTables': {'type': 'array', 'items': {'type': 'string', 'enum': list(tables)}},
+                'selectedColumns': {
+                    'type': 'object',
+                    'properties': {
+                        table_name: {'type': 'array', 'items': {'type': 'string', 'enum': [col['name'] for col in columns]}}
+                        for table_name, columns in tables.items()
+                    },
+                    'additionalProperties': False
+                },
+                'tableConfidence': {'type': 'integer', 'minimum': 0, 'maximum': 100},
+                'reasoning': {'type': 'string'}
+            },
+            'required': [
+                'refinedRequest', 'selectedQueryIndex', 'queryConfidence',
+                'selectedTables', 'selectedColumns', 'tableConfidence', 'reasoning'
+            ]
+        }
+
+    async def select(self, user_prompt: str) -> Dict[str, Any]:
+        """Refine the prompt and select its example query and tables; returns the three stage results."""
+        logger.info(f"Starting fused selection for prompt: '{user_prompt}'")
+
+        if not self.table_selector.table_metadata:
+            logger.warning("No table metadata available")
+            return {'success': False, 'error': "No table metadata available"}
+
+        (examples, example_queries_text), (tables, metadata_text) = await asyncio.gather(
+            self.query_selector.candidate_examples(user_prompt),
+            self.table_selector.candidate_tables(user_prompt)
+        )
+        logger.info(f"Analyzing {len(examples)} example queries and {len(tables)} tables in one call")
+
+        session = current_session()
+        whole_catalog = len(examples) == len(self.query_selector.example_queries) and self.table_selector.is_full_catalog(tables)
+        if session is not None and session.includes_catalog and whole_catalog:
+            example_queries_text = metadata_text = SESSION_CATALOG_REFERENCE
+
+        prompt = self.prompt.render(
+            user_prompt=user_prompt,
+            example_queries_text=example_queries_text or 'No example queries available',
+            metadata_text=metadata_text
+        )
+        logger.debug(f"Full prompt (length: {len(prompt)} chars): {prompt[:300]}...")
+
+        response = ''
+        try:
+            response = await call_ollama(
+                prompt,
+                model=self.model,
+                format=self._response_schema(examples, tables) if self.use_schema else None,
+                options=self.options
+            )
+            logger.info(f"Received response from Ollama (length: {len(response)} chars)")
+            logger.debug(f"Raw response: {response}")
+
+            result = parse_json_response(response, RESPONSE_FIELDS)
+            self.table_selector.restrict_to_candidates(result, tables)
+
+            if examples:
+                index = result['selected_query_index']
+                if index - 1 not in examples:
+                    raise OutputParseError(f"Selected query index {index} is not one of the candidate examples")
+                query_selection = {
+                    'selected_query': self.query_selector.example_queries[index - 1]['query'],
+                    'selected_query_index': index,
+                    'confidence': result['query_confidence'],
+                    'reasoning': result['reasoning'],
+                    'success': True
+                }
+            else:
+                query_selection = {
+                    'selected_query': None,
+                    'confidence': 0,
+                    'reasoning': "No example queries available"
+                }
+
+            final_result = {
+                'refinement': {
+                    'original': user_prompt,
+                    'refined': result['refined_request'].strip() or user_prompt,
+                    'success': True
+                },
+                'query_selection': query_selection,
+                'table_selection': {
+                    'selected_tables': result['selected_tables'],
+                    'selected_columns': result['selected_columns'],
+                    'reasoning': result['reasoning'],
+                    'confidence': result['table_confidence'],
+                    'success': True
+                },
+                'success': True
+            }
+
+            logger.info(f"Fused selection completed: example {query_selection.get('selected_query_index')}, tables {result['selected_tables']}")
+            logger.debug(f"Full result: {final_result}")
+
+            return final_result
+
+        except OutputParseError as parse_error:
+            logger.error(f"Response parsing failed: {str(parse_error)}")
+            logger.error(f"Raw response that failed parsing: {response[:500]}...")
+            return {'success': False, 'error': f"Response parse error: {str(parse_error)}"}
+
+        except Exception as error:
+            logger.error(f"General error in fused selection: {str(error)}")
+            logger.exception("Full exception details:")
+            return {'success': False, 'error': str(error)}
@@ -1,19 +1,12 @@
 import logging
-from typing import Dict, Any
-from ..utils.ollama_client import call_ollama
+from typing import Dict, Any, Optional
+from ..utils.ollama_client import call_ollama, split_profile
+from ..utils.prompt_templates import PromptTemplate, PromptLayout, PREFIX_FIRST_LAYOUT
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
-
-class InputRefinement:
-    """Component for refining user input queries."""
-    
-    async def refine_user_input(self, user_input: str) -> Dict[str, Any]:
-        """Refine user input to be more specific and clear for SQL generation."""
-        logger.info(f"Starting input refinement for: '{user_input}'")
-        
-        prompt = f"""
+REFINEMENT_PROMPT = PromptTemplate("""
 You are an AI assistant that refines user queries for SQL generation. 
 Your task is to take a user's natural language query and refine it to be more specific, clear, and suitable for SQL query generation.
 
@@ -26,13 +19,43 @@ Please refine this input by:
 4. Suggesting specific data types or ranges where appropriate
 
 Return only the refined query in a clear, concise format.
-"""
+""")
+
+REFINEMENT_LAYOUT = PromptLayout("""
+You are an AI assistant that refines user queries for SQL generation. 
+Your task is to take a user's natural language query and refine it to be more specific, clear, and suitable for SQL query generation.
+
+Please refine the user input below by:
+1. Clarifying any ambiguous terms
+2. Adding specific details that would be helpful for SQL generation
+3. Identifying the main intent (SELECT, UPDATE, DELETE, etc.)
+4. Suggesting specific data types or ranges where appropriate
+
+Return only the refined query in a clear, concise format.
+""", """
+User Input: "{user_input}"
+""", request_slots=['user_input'])
+
+
+class InputRefinement:
+    """Component for refining user input queries."""
+    
+    def __init__(self, profile: Optional[Dict[str, Any]] = None, prompt_layout: str = PREFIX_FIRST_LAYOUT):
+        # Model and generation options for this stage; anything unset falls back to OLLAMA_MODEL and DEFAULT_OPTIONS
+        self.model, self.options = split_profile(profile)
+        self.prompt = REFINEMENT_LAYOUT if prompt_layout == PREFIX_FIRST_LAYOUT else REFINEMENT_PROMPT
+    
+    async def refine_user_input(self, user_input: str) -> Dict[str, Any]:
+        """Refine user input to be more specific and clear for SQL generation."""
+        logger.info(f"Starting input refinement for: '{user_input}'")
+        
+        prompt = self.prompt.render(user_input=user_input)
         
         logger.info("Sending prompt to Ollama API for input refinement")
         logger.debug(f"Full prompt (length: {len(prompt)} chars): {prompt[:300]}...")
         
         try:
-            response = await call_ollama(prompt)
+            response = await call_ollama(prompt, model=self.model, options=self.options)
             logger.info(f"Received refinement response from Ollama (length: {len(response)} chars)")
             logger.info(f"Original input: '{user_input}' -> Refined: '{response.strip()}'")
             logger.debug(f"Full response: {response}")
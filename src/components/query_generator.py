@@ -1,23 +1,79 @@
 import re
+import time
 import logging
-from typing import Dict, Any, List, Optional
-from ..utils.ollama_client import call_ollama
+from typing import Dict, Any, List, Optional, Callable
+from ..utils.ollama_client import call_ollama, stream_ollama, split_profile
+from ..utils.prompt_templates import PromptTemplate, PromptLayout, PREFIX_FIRST_LAYOUT
+from ..utils.output_parsing import SQLStreamExtractor, extract_sql
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+GENERATION_PROMPT = PromptTemplate("""
+You are an expert Redshift SQL developer. Generate a complete, optimized Redshift SQL query based on the provided information.
+
+User Request: "{user_prompt}"
+
+Reference Query Pattern: {selected_query}
+
+Available Tables and Columns:
+{tables_info}
+
+Requirements:
+1. Generate a complete, syntactically correct Redshift SQL query
+2. Use appropriate Redshift-specific functions and optimizations where applicable
+3. Include proper JOINs if multiple tables are needed
+4. Add appropriate WHERE clauses based on the user request
+5. Use proper column aliases for readability
+6. Ensure the query follows Redshift best practices
+
+Respond with ONLY the SQL query, no additional text or formatting.
+""")
+
+GENERATION_LAYOUT = PromptLayout("""
+You are an expert Redshift SQL developer. Generate a complete, optimized Redshift SQL query based on the information provided below.
+
+Requirements:
+1. Generate a complete, syntactically correct Redshift SQL query
+2. Use appropriate Redshift-specific functions and optimizations where applicable
+3. Include proper JOINs if multiple tables are needed
+4. Add appropriate WHERE clauses based on the user request
+5. Use proper column aliases for readability
+6. Ensure the query follows Redshift best practices
+
+Respond with ONLY the SQL query, no additional text or formatting.
+""", """
+User Request: "{user_prompt}"
+
+Reference Query Pattern: {selected_query}
+
+Available Tables and Columns:
+{tables_info}
+""", request_slots=['user_prompt', 'selected_query', 'tables_info'])
+
 
 class QueryGenerator:
     """Component for generating and validating SQL queries."""
     
+    def __init__(self, profile: Optional[Dict[str, Any]] = None, prompt_layout: str = PREFIX_FIRST_LAYOUT):
+        # Model and generation options for this stage; anything unset falls back to OLLAMA_MODEL and DEFAULT_OPTIONS
+        self.model, self.options = split_profile(profile)
+        self.prompt = GENERATION_LAYOUT if prompt_layout == PREFIX_FIRST_LAYOUT else GENERATION_PROMPT
+    
     async def generate_redshift_query(
         self, 
         user_prompt: str, 
         selected_query: Optional[str], 
         selected_tables: List[str], 
-        selected_columns: Dict[str, List[str]]
+        selected_columns: Dict[str, List[str]],
+        on_token: Optional[Callable[[str], None]] = None
     ) -> Dict[str, Any]:
-        """Generate a Redshift SQL query based on the provided information."""
+        """Generate a Redshift SQL query based on the provided information.
+        
+        When on_token is given the response is streamed and the SQL statement is
+        passed to it piece by piece as it is decoded; prose and markdown fences
+        around it are held back, so the pieces join up to the returned query.
+        """
         logger.info(f"Starting SQL query generation for prompt: '{user_prompt}'")
         logger.info(f"Selected tables: {selected_tables}")
         logger.info(f"Selected columns: {selected_columns}")
@@ -30,41 +86,44 @@ class QueryGenerator:
         
         logger.debug(f"Generated tables info: {tables_info}")
         
-        prompt = f"""
-You are an expert Redshift SQL developer. Generate a complete, optimized Redshift SQL query based on the provided information.
-
-User Request: "{user_prompt}"
-
-Reference Query Pattern: {selected_query or 'No reference query provided'}
-
-Available Tables and Columns:
-{tables_info}
-
-Requirements:
-1. Generate a complete, syntactically correct Redshift SQL query
-2. Use appropriate Redshift-specific functions and optimizations where applicable
-3. Include proper JOINs if multiple tables are needed
-4. Add appropriate WHERE clauses based on the user request
-5. Use proper column aliases for readability
-6. Ensure the query follows Redshift best practices
-
-Respond with ONLY the SQL query, no additional text or formatting.
-"""
+        prompt = self.prompt.render(
+            user_prompt=user_prompt,
+            selected_query=selected_query or 'No reference query provided',
+            tables_info=tables_info
+        )
         
         logger.info("Sending prompt to Ollama API for SQL generation")
         logger.debug(f"Full prompt (length: {len(prompt)} chars): {prompt[:300]}...")
         
         try:
-            response = await call_ollama(prompt)
+            start_time = time.time()
+            time_to_first_token = None
+            if on_token is None:
+                response = await call_ollama(prompt, model=self.model, options=self.options)
+            else:
+                extractor = SQLStreamExtractor()
+                async for chunk in stream_ollama(prompt, model=self.model, options=self.options):
+                    if time_to_first_token is None:
+                        time_to_first_token = int((time.time() - start_time) * 1000)
+                        logger.info(f"First SQL token received after {time_to_first_token}ms")
+                    sql_chunk = extractor.feed(chunk)
+                    if sql_chunk:
+                        on_token(sql_chunk)
+                rest = extractor.finish()
+                if rest:
+                    on_token(rest)
+                response = extractor.text
             logger.info(f"Received SQL query response from Ollama (length: {len(response)} chars)")
             
-            generated_query = response.strip()
+            # Models often wrap the SQL in a markdown fence or add a sentence around it
+            generated_query = extract_sql(response)
             logger.info("SQL query generation completed successfully")
             logger.debug(f"Generated query: {generated_query}")
             
             result = {
                 'query': generated_query,
                 'success': True,
+                'time_to_first_token': time_to_first_token,
                 'metadata': {
                     'user_prompt': user_prompt,
                     'selected_query': selected_query,
@@ -1,26 +1,268 @@
-import json
-import re
+import time
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from ..utils.ollama_client import call_ollama
+from typing import List, Dict, Any, Optional, Tuple
+from ..utils.ollama_client import (
+    call_ollama, embed_texts, iter_embeddings, split_profile, current_session, OLLAMA_EMBED_RETRY_AFTER
+)
+from ..utils.embedding_index import EmbeddingIndex
+from ..utils.bm25_index import BM25Index
+from ..utils.prompt_templates import (
+    PromptTemplate, PromptLayout, VersionedPromptCache, SESSION_CATALOG_REFERENCE, PREFIX_FIRST_LAYOUT
+)
+from ..utils.output_parsing import OutputParseError, parse_json_response
+from ..utils.resilience import CircuitBreaker
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+EXAMPLE_TEMPLATE = PromptTemplate("""
+Example {number}:
+Description: {description}
+SQL Query: {query}
+""")
+
+SELECTION_PROMPT = PromptTemplate("""
+You are an expert SQL analyst. Given a user's request and a set of example SQL queries, select the most appropriate example query that best matches the user's intent.
+
+User Request: "{user_prompt}"
+
+Available Example Queries:
+{example_queries_text}
+
+Please analyze the user request and:
+1. Select the example query that best matches the user's intent
+2. Provide a confidence score (0-100)
+3. Explain your reasoning
+
+{response_format}""")
+
+SELECTION_LAYOUT = PromptLayout("""
+You are an expert SQL analyst. Given a user's request and a set of example SQL queries, select the most appropriate example query that best matches the user's intent.
+
+Available Example Queries:
+{example_queries_text}
+
+Please analyze the user request below and:
+1. Select the example query that best matches the user's intent
+2. Provide a confidence score (0-100)
+3. Explain your reasoning
+
+{response_format}""", """
+User Request: "{user_prompt}"
+""", request_slots=['user_prompt'])
+
+# Free-form response format; the model echoes the selected query back
+RESPONSE_FORMAT = """Respond in JSON format:
+{
+  "selectedQueryIndex": <index_of_selected_query>,
+  "selectedQuery": "<the_selected_sql_query>",
+  "confidence": <confidence_score>,
+  "reasoning": "<explanation_of_why_this_query_was_selected>"
+}
+"""
+
+# Schema-constrained response format; the query is looked up from the example number instead of decoded
+SCHEMA_RESPONSE_FORMAT = """Respond in JSON format:
+{
+  "selectedQueryIndex": <example_number_of_selected_query>,
+  "confidence": <confidence_score>,
+  "reasoning": "<explanation_of_why_this_query_was_selected>"
+}
+"""
+
+# Fields every selection answer must carry, after key normalization
+RESPONSE_FIELDS = {
+    'selected_query_index': int,
+    'confidence': (int, float),
+    'reasoning': str
+}
+
 
 class QuerySelector:
     """Component for selecting the best matching example query."""
     
-    def __init__(self, example_queries: List[Dict[str, str]] = None):
+    def __init__(
+        self,
+        example_queries: List[Dict[str, str]] = None,
+        top_k: int = 8,
+        embed_model: Optional[str] = None,
+        use_schema: bool = True,
+        profile: Optional[Dict[str, Any]] = None,
+        prompt_layout: str = PREFIX_FIRST_LAYOUT
+    ):
         self.example_queries = example_queries or []
-        logger.info(f"QuerySelector initialized with {len(self.example_queries)} example queries")
+        self.top_k = top_k
+        self.embed_model = embed_model
+        # Constrain the model's answer with a JSON schema whose example numbers are limited to the candidates
+        self.use_schema = use_schema
+        self.response_format = SCHEMA_RESPONSE_FORMAT if use_schema else RESPONSE_FORMAT
+        self.prompt = SELECTION_LAYOUT if prompt_layout == PREFIX_FIRST_LAYOUT else SELECTION_PROMPT
+        # Model and generation options for this stage; anything unset falls back to OLLAMA_MODEL and DEFAULT_OPTIONS
+        self.model, self.options = split_profile(profile)
+        # Embeddings of example_queries[:len(self.index)]; newer examples are embedded in the background
+        self.index = EmbeddingIndex()
+        self._index_lock = asyncio.Lock()
+        self._sync_task: Optional[asyncio.Task] = None
+        # Lexical index over the same documents, used while embeddings are missing or failing
+        self.bm25 = BM25Index()
+        # After an embedding failure, retrieval uses BM25 until OLLAMA_EMBED_RETRY_AFTER has passed
+        self._embed_breaker = CircuitBreaker('query_selector embeddings', failure_threshold=1, reset_timeout=OLLAMA_EMBED_RETRY_AFTER)
+        # Rendered example sections, reused until add_example_query bumps the version
+        self._example_texts: List[str] = []
+        self._prompt_cache = VersionedPromptCache()
+        logger.info(f"QuerySelector initialized with {len(self.example_queries)} example queries (top_k={top_k})")
     
     def add_example_query(self, query: str, description: str) -> None:
         """Add an example query with description."""
         logger.debug(f"Adding example query: {description}")
         self.example_queries.append({'query': query, 'description': description})
+        self._prompt_cache.bump()
         logger.info(f"Total example queries: {len(self.example_queries)}")
     
+    def _example_text(self, index: int) -> str:
+        """Rendered prompt section for one example, rendered once per example."""
+        while len(self._example_texts) <= index:
+            example = self.example_queries[len(self._example_texts)]
+            self._example_texts.append(EXAMPLE_TEMPLATE.render(
+                number=len(self._example_texts) + 1,
+                description=example['description'],
+                query=example['query']
+            ))
+        return self._example_texts[index]
+    
+    def _build_prompt(self, user_prompt: str, candidates: List[int]) -> str:
+        """Splice the user request into the selection prompt for the given candidate examples."""
+        if len(candidates) == len(self.example_queries):
+            session = current_session()
+            if session is not None and session.includes_catalog:
+                return self.prompt.render(
+                    user_prompt=user_prompt,
+                    example_queries_text=SESSION_CATALOG_REFERENCE,
+                    response_format=self.response_format
+                )
+            template = self._prompt_cache.get('all_examples')
+            if template is None:
+                logger.debug(f"Rendering static selection prompt for catalog version {self._prompt_cache.version}")
+                template = self._prompt_cache.set('all_examples', self.prompt.partial(
+                    example_queries_text='\n'.join(self._example_text(index) for index in candidates),
+                    response_format=self.response_format
+                ))
+            return template.render(user_prompt=user_prompt)
+        
+        return self.prompt.render(
+            user_prompt=user_prompt,
+            example_queries_text='\n'.join(self._example_text(index) for index in candidates),
+            response_format=self.response_format
+        )
+    
+    @staticmethod
+    def _response_schema(candidates: List[int]) -> Dict[str, Any]:
+        """JSON schema for the selection answer, allowing only the example numbers shown in the prompt."""
+        return {
+            'type': 'object',
+            'properties': {
+                'selectedQueryIndex': {'type': 'integer', 'enum': [index + 1 for index in candidates]},
+                'confidence': {'type': 'integer', 'minimum': 0, 'maximum': 100},
+                'reasoning': {'type': 'string'}
+            },
+            'required': ['selectedQueryIndex', 'confidence', 'reasoning']
+        }
+    
+    @staticmethod
+    def _example_document(example: Dict[str, str]) -> str:
+        return f"{example['description']}\n{example['query']}"
+    
+    async def _sync_index(self) -> None:
+        """Embed any example queries not yet in the retrieval index, keeping each batch as it arrives."""
+        async with self._index_lock:
+            pending = self.example_queries[len(self.index):]
+            if not pending:
+                return
+            
+            logger.info(f"Embedding {len(pending)} new example queries into the retrieval index")
+            async for vectors in iter_embeddings([self._example_document(example) for example in pending], model=self.embed_model):
+                self.index.add(vectors)
+    
+    async def build_index(self) -> bool:
+        """Embed any example queries not yet in the retrieval index; returns whether the index is complete.
+        
+        Run at agent start-up so requests never wait on embedding the examples.
+        """
+        if not self.uses_retrieval or len(self.index) == len(self.example_queries):
+            return True
+        if not self._embed_breaker.available():
+            return False
+        
+        self._embed_breaker.begin()
+        start_time = time.time()
+        try:
+            await self._sync_index()
+        except Exception as error:
+            self._embed_breaker.record_failure()
+            logger.warning(f"Example embedding index build failed after {len(self.index)} of {len(self.example_queries)} examples: {str(error)}")
+            return False
+        self._embed_breaker.record_success()
+        logger.info(f"Example embedding index built in {int((time.time() - start_time) * 1000)}ms")
+        return True
+    
+    def _schedule_index_build(self) -> None:
+        """Bring the embedding index up to date in the background, unless a build is already running."""
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.ensure_future(self.build_index())
+    
+    async def close(self) -> None:
+        """Cancel a background index build."""
+        if self._sync_task is not None and not self._sync_task.done():
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+    
+    def _lexical_candidates(self, user_prompt: str) -> List[int]:
+        """The top_k examples by BM25, or the first top_k if none shares a term with the prompt."""
+        for example in self.example_queries[len(self.bm25):]:
+            self.bm25.add(self._example_document(example))
+        matches = self.bm25.search(user_prompt, self.top_k)
+        if not matches:
+            return list(range(self.top_k))
+        logger.info(f"Retrieved {len(matches)} candidate examples with BM25")
+        return sorted(index for index, _ in matches)
+    
+    @property
+    def uses_retrieval(self) -> bool:
+        """Whether selection embeds the prompt to shortlist examples, i.e. there are more than top_k."""
+        return len(self.example_queries) > self.top_k
+    
+    async def _retrieve_candidates(self, user_prompt: str) -> List[int]:
+        """Return the indices of the top_k example queries most similar to the prompt."""
+        if not self.uses_retrieval:
+            return list(range(len(self.example_queries)))
+        
+        if len(self.index) < len(self.example_queries):
+            logger.info("Example embedding index is incomplete, retrieving with BM25")
+            self._schedule_index_build()
+        elif self._embed_breaker.available():
+            self._embed_breaker.begin()
+            try:
+                query_vector = (await embed_texts([user_prompt], model=self.embed_model))[0]
+                self._embed_breaker.record_success()
+                matches = self.index.search(query_vector, self.top_k)
+                logger.info(f"Retrieved {len(matches)} candidate examples, best similarity: {matches[0][1]:.3f}")
+                return sorted(index for index, _ in matches)
+            except Exception as error:
+                self._embed_breaker.record_failure()
+                logger.warning(f"Example embedding retrieval failed, falling back to BM25: {str(error)}")
+        
+        return self._lexical_candidates(user_prompt)
+    
+    def catalog_text(self) -> str:
+        """Rendered prompt section listing every example."""
+        return '\n'.join(self._example_text(index) for index in range(len(self.example_queries)))
+    
+    async def candidate_examples(self, user_prompt: str) -> Tuple[List[int], str]:
+        """Indices of the examples to show the model for a prompt, and their rendered prompt section."""
+        candidates = await self._retrieve_candidates(user_prompt)
+        return candidates, '\n'.join(self._example_text(index) for index in candidates)
+    
     async def select_best_query(self, user_prompt: str) -> Dict[str, Any]:
         """Select the best matching example query for the user prompt."""
         logger.info(f"Starting query selection for prompt: '{user_prompt}'")
@@ -33,98 +275,60 @@ class QuerySelector:
                 'reasoning': "No example queries available"
             }
         
-        logger.info(f"Analyzing {len(self.example_queries)} example queries")
-        
-        example_queries_text = '\n'.join([
-            f"""
-Example {index + 1}:
-Description: {example['description']}
-SQL Query: {example['query']}
-"""
-            for index, example in enumerate(self.example_queries)
-        ])
-        
-        logger.debug(f"Generated example queries text (length: {len(example_queries_text)} chars)")
-        logger.debug(f"Example queries preview: {example_queries_text[:300]}...")
+        candidates = await self._retrieve_candidates(user_prompt)
+        logger.info(f"Analyzing {len(candidates)} of {len(self.example_queries)} example queries")
         
-        prompt = f"""
-You are an expert SQL analyst. Given a user's request and a set of example SQL queries, select the most appropriate example query that best matches the user's intent.
-
-User Request: "{user_prompt}"
-
-Available Example Queries:
-{example_queries_text}
-
-Please analyze the user request and:
-1. Select the example query that best matches the user's intent
-2. Provide a confidence score (0-100)
-3. Explain your reasoning
-
-Respond in JSON format:
-{{
-  "selectedQueryIndex": <index_of_selected_query>,
-  "selectedQuery": "<the_selected_sql_query>",
-  "confidence": <confidence_score>,
-  "reasoning": "<explanation_of_why_this_query_was_selected>"
-}}
-"""
+        prompt = self._build_prompt(user_prompt, candidates)
         
         logger.info("Sending prompt to Ollama API for query selection")
         logger.debug(f"Full prompt (length: {len(prompt)} chars): {prompt[:300]}...")
         
         try:
-            response = await call_ollama(prompt)
+            response = await call_ollama(
+                prompt,
+                model=self.model,
+                format=self._response_schema(candidates) if self.use_schema else None,
+                options=self.options
+            )
             logger.info(f"Received response from Ollama (length: {len(response)} chars)")
             logger.debug(f"Raw response: {response}")
             
-            # Extract JSON from response (handle extra text before/after JSON)
-            logger.info("Extracting JSON from response")
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if not json_match:
-                logger.error("No JSON object found in response")
-                raise ValueError("No JSON object found in response")
-            
-            json_str = json_match.group(0)
-            logger.info(f"Extracted JSON string (length: {len(json_str)} chars)")
-            logger.debug(f"JSON string: {json_str}")
-            
-            logger.info("Parsing JSON")
-            result = json.loads(json_str)
-            logger.info("JSON parsed successfully")
+            # Extract the first complete JSON object, ignoring any commentary around it
+            logger.info("Parsing JSON from response")
+            fields = dict(RESPONSE_FIELDS) if self.use_schema else {**RESPONSE_FIELDS, 'selected_query': str}
+            result = parse_json_response(response, fields)
+            logger.info("JSON parsed and validated successfully")
             logger.debug(f"Parsed result: {result}")
             
-            # Validate required keys
-            logger.info("Validating required keys")
-            required_keys = ['selectedQueryIndex', 'selectedQuery', 'confidence', 'reasoning']
-            missing_keys = [key for key in required_keys if key not in result]
-            if missing_keys:
-                logger.error(f"Missing required keys: {missing_keys}")
-                raise ValueError(f"Missing required keys in response: {missing_keys}")
-            
-            logger.info("All required keys found in response")
+            if self.use_schema:
+                # The schema only carries the example number; the query text comes from the catalog
+                index = result['selected_query_index']
+                if index - 1 not in candidates:
+                    raise OutputParseError(f"Selected query index {index} is not one of the candidate examples")
+                result['selected_query'] = self.example_queries[index - 1]['query']
             
             final_result = {
-                'selected_query': result['selectedQuery'],
-                'selected_query_index': result['selectedQueryIndex'],
+                'selected_query': result['selected_query'],
+                'selected_query_index': result['selected_query_index'],
                 'confidence': result['confidence'],
                 'reasoning': result['reasoning'],
                 'success': True
             }
             
-            logger.info(f"Query selection completed successfully. Selected query index: {result['selectedQueryIndex']}, confidence: {result['confidence']}%")
+            logger.info(f"Query selection completed successfully. Selected query index: {result['selected_query_index']}, confidence: {result['confidence']}%")
             logger.debug(f"Full result: {final_result}")
             
             return final_result
             
-        except json.JSONDecodeError as json_error:
-            logger.error(f"JSON parsing failed: {str(json_error)}")
+        except OutputParseError as parse_error:
+            logger.error(f"Response parsing failed: {str(parse_error)}")
             logger.error(f"Raw response that failed parsing: {response[:500]}...")
             error_result = {
                 'selected_query': None,
                 'confidence': 0,
-                'reasoning': f"JSON parsing error: {str(json_error)}. Raw response: {response[:200]}...",
+                'reasoning': f"JSON parsing error: {str(parse_error)}. Raw response: {response[:200]}...",
                 'success': False,
-                'error': f"JSON decode error: {str(json_error)}"
+                'error': f"Response parse error: {str(parse_error)}"
             }
             logger.debug(f"Returning error result: {error_result}")
             return error_result
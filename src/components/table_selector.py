@@ -1,52 +1,32 @@
-import json
-import re
+import time
+import asyncio
 import logging
-from typing import Dict, Any, List
-from ..utils.ollama_client import call_ollama
+from typing import Dict, Any, List, Optional, Tuple
+from ..utils.ollama_client import (
+    call_ollama, embed_texts, iter_embeddings, split_profile, current_session, OLLAMA_EMBED_RETRY_AFTER
+)
+from ..utils.embedding_index import EmbeddingIndex
+from ..utils.bm25_index import BM25Index
+from ..utils.prompt_templates import (
+    PromptTemplate, PromptLayout, VersionedPromptCache, SESSION_CATALOG_REFERENCE, PREFIX_FIRST_LAYOUT
+)
+from ..utils.output_parsing import OutputParseError, parse_json_response
+from ..utils.resilience import CircuitBreaker
 
 # Set up logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-
-class TableSelector:
-    """Component for selecting relevant tables and columns."""
-    
-    def __init__(self, table_metadata: Dict[str, Any] = None):
-        self.table_metadata = table_metadata or {}
-    
-    def add_table_metadata(self, table_name: str, metadata: Dict[str, Any]) -> None:
-        """Add metadata for a table."""
-        self.table_metadata[table_name] = metadata
-    
-    async def select_tables_and_columns(self, user_prompt: str) -> Dict[str, Any]:
-        """Select relevant tables and columns for the user prompt."""
-        logger.info(f"Starting table selection for prompt: '{user_prompt}'")
-        
-        if not self.table_metadata:
-            logger.warning("No table metadata available")
-            return {
-                'selected_tables': [],
-                'selected_columns': {},
-                'reasoning': "No table metadata available"
-            }
-        
-        logger.info(f"Processing metadata for {len(self.table_metadata)} tables: {list(self.table_metadata.keys())}")
-        
-        metadata_text = '\n'.join([
-            f"""
+TABLE_TEMPLATE = PromptTemplate("""
 Table: {table_name}
-Description: {metadata.get('description', 'No description available')}
+Description: {description}
 Columns:
-{chr(10).join([f"  - {col['name']} ({col['type']}): {col.get('description', 'No description')}" for col in metadata['columns']])}
-"""
-            for table_name, metadata in self.table_metadata.items()
-        ])
-        
-        logger.debug(f"Generated metadata text (length: {len(metadata_text)} chars)")
-        logger.debug(f"Metadata preview: {metadata_text[:200]}...")
-        
-        prompt = f"""
+{columns_text}
+""")
+
+COLUMN_TEMPLATE = PromptTemplate("  - {name} ({type}): {description}")
+
+TABLE_SELECTION_PROMPT = PromptTemplate("""
 You are a database expert. Given a user's request and database table metadata, identify the most relevant tables and columns needed to fulfill the request.
 
 User Request: "{user_prompt}"
@@ -69,45 +49,382 @@ Respond in JSON format:
   "reasoning": "<explanation_of_selections>",
   "confidence": <confidence_score_0_to_100>
 }}
-"""
+""")
+
+TABLE_SELECTION_LAYOUT = PromptLayout("""
+You are a database expert. Given a user's request and database table metadata, identify the most relevant tables and columns needed to fulfill the request.
+
+Available Tables and Columns:
+{metadata_text}
+
+Please analyze the user request below and:
+1. Identify which tables are needed
+2. Identify which specific columns from each table are required
+3. Explain your reasoning
+
+Respond in JSON format:
+{{
+  "selectedTables": ["table1", "table2"],
+  "selectedColumns": {{
+    "table1": ["column1", "column2"],
+    "table2": ["column3", "column4"]
+  }},
+  "reasoning": "<explanation_of_selections>",
+  "confidence": <confidence_score_0_to_100>
+}}
+""", """
+User Request: "{user_prompt}"
+""", request_slots=['user_prompt'])
+
+# Fields every selection answer must carry, after key normalization
+RESPONSE_FIELDS = {
+    'selected_tables': list,
+    'selected_columns': dict,
+    'reasoning': str,
+    'confidence': (int, float)
+}
+
+
+class TableSelector:
+    """Component for selecting relevant tables and columns."""
+    
+    def __init__(
+        self,
+        table_metadata: Dict[str, Any] = None,
+        max_tables: int = 20,
+        max_columns_per_table: int = 30,
+        embed_model: Optional[str] = None,
+        use_schema: bool = True,
+        profile: Optional[Dict[str, Any]] = None,
+        prompt_layout: str = PREFIX_FIRST_LAYOUT
+    ):
+        self.table_metadata = table_metadata or {}
+        self.max_tables = max_tables
+        self.max_columns_per_table = max_columns_per_table
+        self.embed_model = embed_model
+        # Constrain the model's answer with a JSON schema whose table and column names are limited to the candidates
+        self.use_schema = use_schema
+        # Model and generation options for this stage; anything unset falls back to OLLAMA_MODEL and DEFAULT_OPTIONS
+        self.model, self.options = split_profile(profile)
+        self.prompt = TABLE_SELECTION_LAYOUT if prompt_layout == PREFIX_FIRST_LAYOUT else TABLE_SELECTION_PROMPT
+        
+        # Two-level retrieval index: one document per table and one per column.
+        # Rows are append-only; re-adding a table supersedes its earlier rows.
+        self._table_rows: List[str] = []
+        self._column_rows: List[Tuple[str, str]] = []
+        self._current_table_row: Dict[str, int] = {}
+        self._current_column_rows: Dict[str, range] = {}
+        self._table_documents: List[str] = []
+        self._column_documents: List[str] = []
+        self.table_bm25 = BM25Index()
+        self.column_bm25 = BM25Index()
+        self.table_embeddings = EmbeddingIndex()
+        self.column_embeddings = EmbeddingIndex()
+        self._index_lock = asyncio.Lock()
+        self._sync_task: Optional[asyncio.Task] = None
+        # After an embedding failure, retrieval uses BM25 until OLLAMA_EMBED_RETRY_AFTER has passed
+        self._embed_breaker = CircuitBreaker('table_selector embeddings', failure_threshold=1, reset_timeout=OLLAMA_EMBED_RETRY_AFTER)
+        
+        # Rendered table sections, reused until add_table_metadata replaces the table
+        self._table_texts: Dict[str, str] = {}
+        self._prompt_cache = VersionedPromptCache()
+        
+        for table_name, metadata in self.table_metadata.items():
+            self._index_table(table_name, metadata)
+    
+    def add_table_metadata(self, table_name: str, metadata: Dict[str, Any]) -> None:
+        """Add metadata for a table."""
+        self.table_metadata[table_name] = metadata
+        self._table_texts.pop(table_name, None)
+        self._prompt_cache.bump()
+        self._index_table(table_name, metadata)
+    
+    def _table_text(self, table_name: str, columns: List[Dict[str, Any]]) -> str:
+        """Rendered prompt section for a table; full tables are rendered once and reused."""
+        metadata = self.table_metadata[table_name]
+        is_full_table = columns is metadata['columns']
+        if is_full_table and table_name in self._table_texts:
+            return self._table_texts[table_name]
+        
+        text = TABLE_TEMPLATE.render(
+            table_name=table_name,
+            description=metadata.get('description', 'No description available'),
+            columns_text='\n'.join(
+                COLUMN_TEMPLATE.render(name=col['name'], type=col['type'], description=col.get('description', 'No description'))
+                for col in columns
+            )
+        )
+        if is_full_table:
+            self._table_texts[table_name] = text
+        return text
+    
+    def is_full_catalog(self, candidates: Dict[str, List[Dict[str, Any]]]) -> bool:
+        """Whether the candidates are every table with all of its columns."""
+        return len(candidates) == len(self.table_metadata) and all(
+            columns is self.table_metadata[table_name]['columns'] for table_name, columns in candidates.items()
+        )
+    
+    def catalog_text(self) -> str:
+        """Rendered prompt section listing every table with all of its columns."""
+        return '\n'.join(self._table_text(name, metadata['columns']) for name, metadata in self.table_metadata.items())
+    
+    def _build_prompt(self, user_prompt: str, candidates: Dict[str, List[Dict[str, Any]]]) -> str:
+        """Splice the user request into the table selection prompt for the given candidates."""
+        if self.is_full_catalog(candidates):
+            session = current_session()
+            if session is not None and session.includes_catalog:
+                return self.prompt.render(user_prompt=user_prompt, metadata_text=SESSION_CATALOG_REFERENCE)
+            
+            template = self._prompt_cache.get('full_catalog')
+            if template is None:
+                logger.debug(f"Rendering static table selection prompt for catalog version {self._prompt_cache.version}")
+                template = self._prompt_cache.set('full_catalog', self.prompt.partial(
+                    metadata_text='\n'.join(self._table_text(name, columns) for name, columns in candidates.items())
+                ))
+            return template.render(user_prompt=user_prompt)
+        
+        return self.prompt.render(
+            user_prompt=user_prompt,
+            metadata_text='\n'.join(self._table_text(name, columns) for name, columns in candidates.items())
+        )
+    
+    @staticmethod
+    def _response_schema(candidates: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """JSON schema for the selection answer, allowing only the candidate table and column names."""
+        return {
+            'type': 'object',
+            'properties': {
+                'selectedTables': {'type': 'array', 'items': {'type': 'string', 'enum': list(candidates)}},
+                'selectedColumns': {
+                    'type': 'object',
+                    'properties': {
+                        table_name: {'type': 'array', 'items': {'type': 'string', 'enum': [col['name'] for col in columns]}}
+                        for table_name, columns in candidates.items()
+                    },
+                    'additionalProperties': False
+                },
+                'reasoning': {'type': 'string'},
+                'confidence': {'type': 'integer', 'minimum': 0, 'maximum': 100}
+            },
+            'required': ['selectedTables', 'selectedColumns', 'reasoning', 'confidence']
+        }
+    
+    @staticmethod
+    def restrict_to_candidates(result: Dict[str, Any], candidates: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Drop any table or column names outside the candidates, for servers that only support plain JSON mode."""
+        tables = [name for name in result['selected_tables'] if name in candidates]
+        columns = {}
+        for table_name, names in result['selected_columns'].items():
+            if table_name in candidates:
+                allowed = {col['name'] for col in candidates[table_name]}
+                columns[table_name] = [name for name in names if name in allowed]
+        dropped = set(result['selected_tables']) - set(tables)
+        if dropped:
+            logger.warning(f"Ignoring selected tables outside the catalog: {sorted(dropped)}")
+        result['selected_tables'] = tables
+        result['selected_columns'] = columns
+    
+    def _index_table(self, table_name: str, metadata: Dict[str, Any]) -> None:
+        """Add a table and its columns to the lexical index and queue them for embedding."""
+        columns = metadata.get('columns', [])
+        table_document = f"{table_name} {metadata.get('description', '')} {' '.join(col['name'] for col in columns)}"
+        
+        self._current_table_row[table_name] = len(self._table_rows)
+        self._table_rows.append(table_name)
+        self._table_documents.append(table_document)
+        self.table_bm25.add(table_document)
+        
+        first_column_row = len(self._column_rows)
+        for col in columns:
+            column_document = f"{table_name} {col['name']} {col.get('description', '')}"
+            self._column_rows.append((table_name, col['name']))
+            self._column_documents.append(column_document)
+            self.column_bm25.add(column_document)
+        self._current_column_rows[table_name] = range(first_column_row, len(self._column_rows))
+    
+    async def _sync_embeddings(self) -> None:
+        """Embed table and column documents added since the last sync, keeping each batch as it arrives."""
+        async with self._index_lock:
+            for index, documents in (
+                (self.table_embeddings, self._table_documents),
+                (self.column_embeddings, self._column_documents)
+            ):
+                pending = documents[len(index):]
+                if pending:
+                    logger.info(f"Embedding {len(pending)} new schema documents into the retrieval index")
+                    async for vectors in iter_embeddings(pending, model=self.embed_model):
+                        index.add(vectors)
+    
+    def _embeddings_complete(self) -> bool:
+        """Whether every table and column document is in the embedding index."""
+        return (
+            len(self.table_embeddings) == len(self._table_documents)
+            and len(self.column_embeddings) == len(self._column_documents)
+        )
+    
+    async def build_index(self) -> bool:
+        """Embed any catalog documents not yet in the retrieval index; returns whether the index is complete.
+        
+        Run at agent start-up so requests never wait on embedding the catalog. A
+        failed build keeps the batches that finished and resumes from there.
+        """
+        if not self.uses_retrieval or self._embeddings_complete():
+            return True
+        if not self._embed_breaker.available():
+            return False
+        
+        self._embed_breaker.begin()
+        start_time = time.time()
+        try:
+            await self._sync_embeddings()
+        except Exception as error:
+            self._embed_breaker.record_failure()
+            logger.warning(f"Schema embedding index build failed after {len(self.column_embeddings)} of {len(self._column_documents)} columns: {str(error)}")
+            return False
+        self._embed_breaker.record_success()
+        logger.info(f"Schema embedding index built in {int((time.time() - start_time) * 1000)}ms")
+        return True
+    
+    def _schedule_index_build(self) -> None:
+        """Bring the embedding index up to date in the background, unless a build is already running."""
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.ensure_future(self.build_index())
+    
+    async def close(self) -> None:
+        """Cancel a background index build."""
+        if self._sync_task is not None and not self._sync_task.done():
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+    
+    async def _score_schema(self, user_prompt: str) -> Tuple[List[Tuple[int, float]], List[Tuple[int, float]]]:
+        """Score table and column rows by embedding similarity, falling back to BM25.
+        
+        While the embedding index is incomplete, or for a while after an embedding
+        failure, rows are scored with BM25 and the index is built in the background.
+        """
+        table_limit = self.max_tables * 2
+        column_limit = self.max_tables * self.max_columns_per_table
+        
+        if self._embeddings_complete() and self._embed_breaker.available():
+            self._embed_breaker.begin()
+            try:
+                query_vector = (await embed_texts([user_prompt], model=self.embed_model))[0]
+                self._embed_breaker.record_success()
+                return (
+                    self.table_embeddings.search(query_vector, table_limit),
+                    self.column_embeddings.search(query_vector, column_limit)
+                )
+            except Exception as error:
+                self._embed_breaker.record_failure()
+                logger.warning(f"Schema embedding retrieval failed, falling back to BM25: {str(error)}")
+        elif not self._embeddings_complete():
+            logger.info("Schema embedding index is incomplete, scoring with BM25")
+            self._schedule_index_build()
+        
+        return (
+            self.table_bm25.search(user_prompt, table_limit),
+            self.column_bm25.search(user_prompt, column_limit)
+        )
+    
+    def _fits_budget(self) -> bool:
+        """Whether the whole catalog fits in one prompt without retrieval."""
+        return len(self.table_metadata) <= self.max_tables and all(
+            len(metadata.get('columns', [])) <= self.max_columns_per_table
+            for metadata in self.table_metadata.values()
+        )
+    
+    @property
+    def uses_retrieval(self) -> bool:
+        """Whether selection embeds the prompt to shortlist tables and columns."""
+        return not self._fits_budget()
+    
+    async def _retrieve_candidates(self, user_prompt: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Pick the candidate tables and columns to show the model, within the configured budget."""
+        if self._fits_budget():
+            return {name: metadata['columns'] for name, metadata in self.table_metadata.items()}
+        
+        table_hits, column_hits = await self._score_schema(user_prompt)
+        
+        # A table scores by its own document plus its best matching column
+        table_scores: Dict[str, float] = {}
+        for row, score in table_hits:
+            table_name = self._table_rows[row]
+            if self._current_table_row.get(table_name) == row:
+                table_scores[table_name] = table_scores.get(table_name, 0.0) + score
+        
+        column_scores: Dict[str, Dict[str, float]] = {}
+        for row, score in column_hits:
+            table_name, column_name = self._column_rows[row]
+            if row in self._current_column_rows.get(table_name, range(0)):
+                column_scores.setdefault(table_name, {})[column_name] = score
+        for table_name, scores in column_scores.items():
+            table_scores[table_name] = table_scores.get(table_name, 0.0) + max(scores.values())
+        
+        selected = sorted(table_scores, key=table_scores.get, reverse=True)[:self.max_tables]
+        if not selected:
+            # Nothing in the catalog shares a term with the prompt; show the model the first max_tables tables instead of none
+            logger.info("No table matched the prompt, falling back to the first tables in the catalog")
+            selected = list(self.table_metadata)[:self.max_tables]
+        logger.info(f"Retrieved {len(selected)} candidate tables out of {len(self.table_metadata)}")
+        
+        candidates = {}
+        for table_name in selected:
+            columns = self.table_metadata[table_name]['columns']
+            if len(columns) > self.max_columns_per_table:
+                scores = column_scores.get(table_name, {})
+                ranked = sorted(range(len(columns)), key=lambda i: scores.get(columns[i]['name'], float('-inf')), reverse=True)
+                keep = set(ranked[:self.max_columns_per_table])
+                columns = [col for i, col in enumerate(columns) if i in keep]
+            candidates[table_name] = columns
+        return candidates
+    
+    async def candidate_tables(self, user_prompt: str) -> Tuple[Dict[str, List[Dict[str, Any]]], str]:
+        """Tables and columns to show the model for a prompt, and their rendered prompt section."""
+        candidates = await self._retrieve_candidates(user_prompt)
+        return candidates, '\n'.join(self._table_text(name, columns) for name, columns in candidates.items())
+    
+    async def select_tables_and_columns(self, user_prompt: str) -> Dict[str, Any]:
+        """Select relevant tables and columns for the user prompt."""
+        logger.info(f"Starting table selection for prompt: '{user_prompt}'")
+        
+        if not self.table_metadata:
+            logger.warning("No table metadata available")
+            return {
+                'selected_tables': [],
+                'selected_columns': {},
+                'reasoning': "No table metadata available"
+            }
+        
+        candidates = await self._retrieve_candidates(user_prompt)
+        logger.info(f"Processing metadata for {len(candidates)} of {len(self.table_metadata)} tables: {list(candidates.keys())}")
+        
+        prompt = self._build_prompt(user_prompt, candidates)
         
         logger.info("Sending prompt to Ollama API")
         logger.debug(f"Full prompt (length: {len(prompt)} chars): {prompt[:300]}...")
         
         try:
-            response = await call_ollama(prompt)
+            response = await call_ollama(
+                prompt,
+                model=self.model,
+                format=self._response_schema(candidates) if self.use_schema else None,
+                options=self.options
+            )
             logger.info(f"Received response from Ollama (length: {len(response)} chars)")
             logger.debug(f"Raw response: {response}")
             
-            # Extract JSON from response (handle extra text before/after JSON)
-            logger.info("Extracting JSON from response")
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if not json_match:
-                logger.error("No JSON object found in response")
-                raise ValueError("No JSON object found in response")
-            
-            json_str = json_match.group(0)
-            logger.info(f"Extracted JSON string (length: {len(json_str)} chars)")
-            logger.debug(f"JSON string: {json_str}")
-            
-            logger.info("Parsing JSON")
-            result = json.loads(json_str)
-            logger.info("JSON parsed successfully")
+            # Extract the first complete JSON object, ignoring any commentary around it
+            logger.info("Parsing JSON from response")
+            result = parse_json_response(response, RESPONSE_FIELDS)
+            logger.info("JSON parsed and validated successfully")
             logger.debug(f"Parsed result: {result}")
             
-            # Validate required keys
-            logger.info("Validating required keys")
-            required_keys = ['selectedTables', 'selectedColumns', 'reasoning', 'confidence']
-            missing_keys = [key for key in required_keys if key not in result]
-            if missing_keys:
-                logger.error(f"Missing required keys: {missing_keys}")
-                raise ValueError(f"Missing required keys in response: {missing_keys}")
-            
-            logger.info("All required keys found in response")
+            if self.use_schema:
+                self.restrict_to_candidates(result, candidates)
             
             final_result = {
-                'selected_tables': result['selectedTables'],
-                'selected_columns': result['selectedColumns'],
+                'selected_tables': result['selected_tables'],
+                'selected_columns': result['selected_columns'],
                 'reasoning': result['reasoning'],
                 'confidence': result['confidence'],
                 'success': True
@@ -120,16 +437,16 @@ Respond in JSON format:
             
             return final_result
             
-        except json.JSONDecodeError as json_error:
-            logger.error(f"JSON parsing failed: {str(json_error)}")
+        except OutputParseError as parse_error:
+            logger.error(f"Response parsing failed: {str(parse_error)}")
             logger.error(f"Raw response that failed parsing: {response[:500]}...")
             error_result = {
                 'selected_tables': [],
                 'selected_columns': {},
-                'reasoning': f"JSON parsing error: {str(json_error)}. Raw response: {response[:200]}...",
+                'reasoning': f"JSON parsing error: {str(parse_error)}. Raw response: {response[:200]}...",
                 'confidence': 0,
                 'success': False,
-                'error': f"JSON decode error: {str(json_error)}"
+                'error': f"Response parse error: {str(parse_error)}"
             }
             logger.debug(f"Returning error result: {error_result}")
             return error_result
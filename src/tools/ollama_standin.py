@@ -0,0 +1,587 @@
+"""Local stand-in for an Ollama server with scripted responses and injected latency, errors and stalls.
+
+Usage: python -m src.tools.ollama_standin --port 11435 --latency-ms 150 --token-rate 40
+"""
+import os
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSION = 64
+CHARS_PER_TOKEN = 4
+DEFAULT_KEEP_ALIVE_SECONDS = 300.0
+# Share of a prompt a slot's cached prefix must cover to be reused, as llama.cpp's slot prompt similarity
+SLOT_PROMPT_SIMILARITY = 0.5
+
+STAGE_MARKERS = [
+    ('fused_selection', 'prepare everything needed'),
+    ('refinement', 'refines user queries'),
+    ('query_selection', 'set of example SQL queries'),
+    ('table_selection', 'database table metadata'),
+    ('query_generation', 'Redshift SQL developer')
+]
+
+
+class StandInConfig:
+    """Latency, throughput and fault injection settings for the stand-in server."""
+
+    def __init__(
+        self,
+        latency_distribution: str = 'constant',
+        latency_ms: float = 50.0,
+        latency_jitter_ms: float = 0.0,
+        token_rate: float = 0.0,
+        prompt_rate: float = 0.0,
+        error_rate: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_seconds: float = 30.0,
+        load_ms: float = 0.0,
+        cold_load_ms: float = 0.0,
+        prefix_cache_slots: int = 0,
+        reject_schema_formats: bool = False,
+        models: Optional[List[str]] = None,
+        model_speedups: Optional[Dict[str, float]] = None,
+        responses: Optional[Dict[str, str]] = None,
+        seed: Optional[int] = None
+    ):
+        self.latency_distribution = latency_distribution
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.token_rate = token_rate
+        self.prompt_rate = prompt_rate
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.load_ms = load_ms
+        # Time to load a model that is not in memory; loaded models stay until their keep_alive runs out
+        self.cold_load_ms = cold_load_ms
+        # Prompt cache slots per model; a prompt that starts with a slot's text only evaluates the rest
+        self.prefix_cache_slots = prefix_cache_slots
+        # Answer a JSON schema format with 400, as Ollama servers before 0.5 do
+        self.reject_schema_formats = reject_schema_formats
+        self.models = models or ['llama3.1', 'nomic-embed-text']
+        # Models that evaluate prompts and decode this many times faster than the base rates, e.g. a smaller model
+        self.model_speedups = model_speedups or {}
+        self.responses = responses or {}
+        self.random = random.Random(seed)
+
+    def sample_latency(self) -> float:
+        """Seconds of fixed per-request overhead drawn from the configured distribution."""
+        base, jitter = self.latency_ms, self.latency_jitter_ms
+        if self.latency_distribution == 'uniform':
+            value = self.random.uniform(base - jitter, base + jitter)
+        elif self.latency_distribution == 'exponential':
+            value = self.random.expovariate(1 / base) if base > 0 else 0.0
+        elif self.latency_distribution == 'lognormal':
+            # latency_ms is the median, latency_jitter_ms / latency_ms the log-space sigma
+            sigma = jitter / base if base > 0 else 0.0
+            value = self.random.lognormvariate(math.log(base), sigma) if base > 0 else 0.0
+        else:
+            value = base
+        return max(value, 0.0) / 1000
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _words(text: str) -> set:
+    words = set()
+    for word in re.findall(r'[a-z0-9_]+', text.lower()):
+        words.add(word)
+        words.update(part for part in word.split('_') if part)
+        if word.endswith('s'):
+            words.add(word[:-1])
+    return words
+
+
+def _user_request(prompt: str) -> str:
+    match = re.search(r'User (?:Request|Input): "(.*?)"', prompt, re.DOTALL)
+    return match.group(1) if match else prompt[-500:]
+
+
+def detect_stage(prompt: str) -> Optional[str]:
+    """Which pipeline stage a prompt belongs to, judged from its instructions."""
+    for stage, marker in STAGE_MARKERS:
+        if marker in prompt:
+            return stage
+    return None
+
+
+def _parse_tables(prompt: str) -> List[Tuple[str, List[str]]]:
+    """(table, columns) pairs from a catalog section of a prompt."""
+    tables = []
+    for block in re.split(r'\n(?=Table: )', prompt):
+        match = re.match(r'Table: (\S+)', block.strip())
+        if not match:
+            continue
+        columns = re.findall(r'^\s+- (\S+) \(', block, re.MULTILINE)
+        if not columns:
+            listed = re.search(r'^Columns: (.+)$', block, re.MULTILINE)
+            columns = [col.strip() for col in listed.group(1).split(',')] if listed else []
+        tables.append((match.group(1), [col for col in columns if col]))
+    return tables
+
+
+def respond_refinement(prompt: str) -> str:
+    request = _user_request(prompt)
+    return f"Retrieve {request.rstrip('?.!')}, returning the relevant columns with explicit filters and ordering."
+
+
+def respond_query_selection(prompt: str) -> str:
+    request_words = _words(_user_request(prompt))
+    examples = re.findall(r'Example (\d+):\nDescription: (.*?)\nSQL Query: (.*?)\n', prompt)
+    if not examples:
+        return json.dumps({'selectedQueryIndex': 0, 'selectedQuery': None, 'confidence': 0, 'reasoning': 'No examples'})
+
+    number, _, query = max(examples, key=lambda example: len(request_words & _words(example[1] + ' ' + example[2])))
+    overlap = len(request_words & _words(query))
+    return json.dumps({
+        'selectedQueryIndex': int(number),
+        'selectedQuery': query,
+        'confidence': min(95, 40 + 10 * overlap),
+        'reasoning': 'Closest lexical match between the request and the example description.'
+    }, indent=2)
+
+
+def respond_table_selection(prompt: str) -> str:
+    request_words = _words(_user_request(prompt))
+    scored = []
+    for table, columns in _parse_tables(prompt):
+        matched = [col for col in columns if _words(col) & request_words]
+        score = len(_words(table) & request_words) * 2 + len(matched)
+        scored.append((score, table, matched or columns[:3]))
+
+    scored.sort(key=lambda item: item[0], reverse=True)
+    chosen = [item for item in scored if item[0] > 0][:3] or scored[:1]
+    return json.dumps({
+        'selectedTables': [table for _, table, _ in chosen],
+        'selectedColumns': {table: columns for _, table, columns in chosen},
+        'reasoning': 'Tables and columns whose names overlap the request.',
+        'confidence': 85 if chosen and chosen[0][0] > 0 else 30
+    }, indent=2)
+
+
+def respond_fused_selection(prompt: str) -> str:
+    query_selection = json.loads(respond_query_selection(prompt))
+    table_selection = json.loads(respond_table_selection(prompt))
+    return json.dumps({
+        'refinedRequest': respond_refinement(prompt),
+        'selectedQueryIndex': query_selection['selectedQueryIndex'],
+        'queryConfidence': query_selection['confidence'],
+        'selectedTables': table_selection['selectedTables'],
+        'selectedColumns': table_selection['selectedColumns'],
+        'tableConfidence': table_selection['confidence'],
+        'reasoning': f"{query_selection['reasoning']} {table_selection['reasoning']}"
+    }, indent=2)
+
+
+def respond_query_generation(prompt: str) -> str:
+    tables = _parse_tables(prompt)
+    if not tables:
+        return 'SELECT 1;'
+    table, columns = tables[0]
+    column_list = ', '.join(columns) if columns else '*'
+    return f"SELECT {column_list}\nFROM {table}\nLIMIT 100;"
+
+
+RESPONDERS = {
+    'refinement': respond_refinement,
+    'query_selection': respond_query_selection,
+    'table_selection': respond_table_selection,
+    'query_generation': respond_query_generation,
+    'fused_selection': respond_fused_selection
+}
+
+
+def apply_format(text: str, schema: Dict[str, Any]) -> str:
+    """Imitate schema-constrained decoding: compact JSON carrying only the schema's properties."""
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        return text
+    properties = schema.get('properties')
+    if isinstance(value, dict) and properties:
+        value = {key: item for key, item in value.items() if key in properties}
+    return json.dumps(value, separators=(',', ':'))
+
+
+def parse_keep_alive(value: Any) -> float:
+    """Seconds a model stays loaded for Ollama's keep_alive (seconds or a duration like '5m'); negative means forever."""
+    if value is None or value == '':
+        return DEFAULT_KEEP_ALIVE_SECONDS
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    parts = re.findall(r'(-?\d+(?:\.\d+)?)(ms|s|m|h)', str(value))
+    return sum(float(amount) * units[unit] for amount, unit in parts) if parts else DEFAULT_KEEP_ALIVE_SECONDS
+
+
+def embed(text: str) -> List[float]:
+    """Deterministic hashed bag-of-words embedding, so lexically similar texts are close."""
+    vector = [0.0] * EMBEDDING_DIMENSION
+    for word in _words(text):
+        digest = hashlib.md5(word.encode('utf-8')).digest()
+        vector[digest[0] % EMBEDDING_DIMENSION] += 1.0 if digest[1] % 2 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class OllamaStandIn:
+    """Asyncio HTTP server imitating Ollama's API."""
+
+    def __init__(self, config: Optional[StandInConfig] = None, host: str = '127.0.0.1', port: int = 0):
+        self.config = config or StandInConfig()
+        self.host = host
+        self.port = port
+        self.stats = {'requests': 0, 'errors': 0, 'stalls': 0, 'connections': 0, 'cold_loads': 0, 'prefix_cache_tokens': 0}
+        self._loaded_until: Dict[str, float] = {}
+        self._prefix_cache: Dict[str, List[Dict[str, Any]]] = {}
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> str:
+        """Start listening and return the base URL."""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Ollama stand-in listening on {self.url}")
+        return self.url
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> 'OllamaStandIn':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+
+    def scripted_response(self, prompt: str) -> Optional[str]:
+        """First scripted response whose key occurs in the prompt."""
+        for needle, response in self.config.responses.items():
+            if needle in prompt:
+                return response
+        return None
+
+    def generate_text(self, prompt: str, system: str = '') -> str:
+        scripted = self.scripted_response(prompt)
+        if scripted is not None:
+            return scripted
+        stage = detect_stage(prompt)
+        responder = RESPONDERS.get(stage)
+        if responder is None:
+            return 'OK'
+        # Selection turns of a chat session refer to the catalog in the system message
+        return responder(f"{system}\n{prompt}" if system and stage != 'query_generation' else prompt)
+
+    def acquire_slot(self, model: str, prompt_text: str) -> Optional[Dict[str, Any]]:
+        """Take the free prompt cache slot sharing the longest prefix with the prompt, or else the least recently used.
+
+        Like Ollama's parallel slots, a slot serves one request at a time and afterwards holds
+        that request's prompt and response. A slot is only reused for its prefix when that covers
+        SLOT_PROMPT_SIMILARITY of the prompt, so prompts sharing a short opening line do not keep
+        evicting each other.
+        """
+        if self.config.prefix_cache_slots <= 0:
+            return None
+        slots = self._prefix_cache.setdefault(model, [
+            {'text': '', 'busy': False, 'used': 0.0} for _ in range(self.config.prefix_cache_slots)
+        ])
+        free = [slot for slot in slots if not slot['busy']] or slots
+        slot = max(free, key=lambda slot: (len(os.path.commonprefix([slot['text'], prompt_text])), -slot['used']))
+        if len(os.path.commonprefix([slot['text'], prompt_text])) < SLOT_PROMPT_SIMILARITY * len(prompt_text):
+            slot = min(free, key=lambda slot: slot['used'])
+        slot['busy'] = True
+        return slot
+
+    @staticmethod
+    def cached_prefix_tokens(slot: Optional[Dict[str, Any]], prompt_text: str) -> int:
+        """Tokens at the start of a prompt already held in its prompt cache slot."""
+        return len(os.path.commonprefix([slot['text'], prompt_text])) // CHARS_PER_TOKEN if slot else 0
+
+    @staticmethod
+    def release_slot(slot: Optional[Dict[str, Any]]) -> None:
+        if slot is None:
+            return
+        slot['busy'] = False
+        slot['used'] = time.monotonic()
+
+    def loaded_models(self) -> List[str]:
+        if self.config.cold_load_ms <= 0:
+            return self.config.models
+        now = time.monotonic()
+        return [model for model, until in self._loaded_until.items() if until > now]
+
+    async def ensure_loaded(self, model: str, keep_alive: Any) -> float:
+        """Seconds spent loading the model for this request, then keep it loaded for keep_alive."""
+        if self.config.cold_load_ms <= 0:
+            return 0.0
+        load_seconds = 0.0
+        async with self._load_locks.setdefault(model, asyncio.Lock()):
+            if self._loaded_until.get(model, 0.0) <= time.monotonic():
+                self.stats['cold_loads'] += 1
+                self._prefix_cache.pop(model, None)
+                load_seconds = self.config.cold_load_ms / 1000
+                await asyncio.sleep(load_seconds)
+            seconds = parse_keep_alive(keep_alive)
+            self._loaded_until[model] = math.inf if seconds < 0 else time.monotonic() + seconds
+        return load_seconds
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.stats['connections'] += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', '0'))
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                await self._dispatch(method, path, body, writer)
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+            pass
+        except Exception as error:
+            logger.error(f"Stand-in connection error: {str(error)}")
+        finally:
+            writer.close()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, payload: Any, status: int = 200) -> None:
+        data = json.dumps(payload).encode('utf-8')
+        reason = 'OK' if status == 200 else 'Error'
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode('latin-1') + data
+        )
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, body: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        self.stats['requests'] += 1
+        path = path.split('?', 1)[0]
+
+        if path == '/api/tags':
+            await self._send_json(writer, {'models': [{'name': model, 'model': model} for model in self.config.models]})
+        elif path == '/api/ps':
+            await self._send_json(writer, {'models': [{'name': model, 'model': model} for model in self.loaded_models()]})
+        elif path == '/api/embeddings':
+            await self.ensure_loaded(body.get('model', ''), body.get('keep_alive'))
+            await self._send_json(writer, {'embedding': embed(body.get('prompt', ''))})
+        elif path == '/api/embed':
+            await self.ensure_loaded(body.get('model', ''), body.get('keep_alive'))
+            inputs = body.get('input', '')
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            await self._send_json(writer, {'model': body.get('model'), 'embeddings': [embed(text) for text in inputs]})
+        elif path in ('/api/chat', '/api/generate'):
+            await self._completion(path, body, writer)
+        elif path == '/':
+            await self._send_json(writer, 'Ollama is running')
+        else:
+            await self._send_json(writer, {'error': f'unknown endpoint {path}'}, status=404)
+
+    async def _completion(self, path: str, body: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        config = self.config
+        start = time.perf_counter()
+        is_chat = path == '/api/chat'
+        if is_chat:
+            messages = body.get('messages') or []
+            prompt = messages[-1]['content'] if messages else ''
+            system = '\n'.join(message.get('content', '') for message in messages[:-1] if message.get('role') == 'system')
+            prompt_text = ''.join(message.get('content', '') for message in messages)
+        else:
+            prompt = prompt_text = body.get('prompt', '')
+            system = body.get('system', '')
+
+        if config.random.random() < config.stall_rate:
+            self.stats['stalls'] += 1
+            await asyncio.sleep(config.stall_seconds)
+        if config.random.random() < config.error_rate:
+            self.stats['errors'] += 1
+            await self._send_json(writer, {'error': 'injected stand-in failure'}, status=500)
+            return
+
+        if config.reject_schema_formats and isinstance(body.get('format'), dict):
+            await self._send_json(writer, {'error': 'invalid format'}, status=400)
+            return
+
+        model = body.get('model', config.models[0])
+        load_seconds = await self.ensure_loaded(model, body.get('keep_alive')) + config.load_ms / 1000
+        if not prompt_text:
+            # An empty prompt only loads the model, as with Ollama
+            payload = {'model': model, 'created_at': datetime.now(timezone.utc).isoformat(), 'done': True, 'done_reason': 'load'}
+            payload.update({'message': {'role': 'assistant', 'content': ''}} if is_chat else {'response': ''})
+            payload['load_duration'] = int(load_seconds * 1e9)
+            await self._send_json(writer, payload)
+            return
+
+        slot = self.acquire_slot(model, prompt_text)
+        try:
+            options = body.get('options') or {}
+            speedup = config.model_speedups.get(model, 1.0)
+            cached_tokens = self.cached_prefix_tokens(slot, prompt_text)
+            self.stats['prefix_cache_tokens'] += cached_tokens
+            # Like Ollama, only the tokens past the cached prefix are evaluated and counted
+            prompt_tokens = max(1, _tokens(prompt_text) - cached_tokens)
+            prompt_eval_seconds = prompt_tokens / (config.prompt_rate * speedup) if config.prompt_rate > 0 else 0.0
+            await asyncio.sleep(config.sample_latency() + prompt_eval_seconds + config.load_ms / 1000)
+
+            text = self.generate_text(prompt, system)
+            if isinstance(body.get('format'), dict):
+                text = apply_format(text, body['format'])
+            stops = options.get('stop') or []
+            for stop in [stops] if isinstance(stops, str) else stops:
+                if stop and stop in text:
+                    text = text[:text.index(stop)]
+            pieces = re.findall(r'.{1,%d}' % CHARS_PER_TOKEN, text, re.DOTALL) or ['']
+            if options.get('num_predict', -1) >= 0:
+                pieces = pieces[:options['num_predict']] or ['']
+            if slot is not None:
+                slot['text'] = prompt_text + ''.join(pieces)
+            seconds_per_token = 1 / (config.token_rate * speedup) if config.token_rate > 0 else 0.0
+
+            def part(content: str, done: bool) -> Dict[str, Any]:
+                payload = {'model': model, 'created_at': datetime.now(timezone.utc).isoformat(), 'done': done}
+                if is_chat:
+                    payload['message'] = {'role': 'assistant', 'content': content}
+                else:
+                    payload['response'] = content
+                if done:
+                    total = time.perf_counter() - start
+                    payload.update({
+                        'done_reason': 'stop',
+                        'total_duration': int(total * 1e9),
+                        'load_duration': int(load_seconds * 1e9),
+                        'prompt_eval_count': prompt_tokens,
+                        'prompt_eval_duration': int(prompt_eval_seconds * 1e9),
+                        'eval_count': len(pieces),
+                        'eval_duration': int(len(pieces) * seconds_per_token * 1e9)
+                    })
+                    if not is_chat:
+                        payload['context'] = list(range(prompt_tokens + len(pieces)))
+                return payload
+
+            if not body.get('stream', True):
+                await asyncio.sleep(len(pieces) * seconds_per_token)
+                await self._send_json(writer, part(''.join(pieces), True))
+                return
+
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+            for piece in pieces:
+                if seconds_per_token:
+                    await asyncio.sleep(seconds_per_token)
+                self._write_chunk(writer, part(piece, False))
+                await writer.drain()
+            self._write_chunk(writer, part('', True))
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            self.release_slot(slot)
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, payload: Dict[str, Any]) -> None:
+        line = json.dumps(payload).encode('utf-8') + b'\n'
+        writer.write(f"{len(line):x}\r\n".encode('latin-1') + line + b"\r\n")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Local Ollama stand-in server for load and regression testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--latency-distribution', choices=['constant', 'uniform', 'exponential', 'lognormal'], default='constant')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Per-request overhead (median for lognormal)')
+    parser.add_argument('--latency-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--token-rate', type=float, default=0.0, help='Decode speed in tokens/s (0 = instant)')
+    parser.add_argument('--prompt-rate', type=float, default=0.0, help='Prompt evaluation speed in tokens/s (0 = instant)')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--stall-rate', type=float, default=0.0)
+    parser.add_argument('--stall-seconds', type=float, default=30.0)
+    parser.add_argument('--load-ms', type=float, default=0.0, help='Reported model load time per request')
+    parser.add_argument('--cold-load-ms', type=float, default=0.0,
+                        help='Load time for a model that is not in memory; loaded models stay for their keep_alive')
+    parser.add_argument('--prefix-cache-slots', type=int, default=0,
+                        help='Prompt cache slots per model; prompts sharing a cached prefix only evaluate the rest (0 = off)')
+    parser.add_argument('--reject-schema-formats', action='store_true',
+                        help='Answer JSON schema formats with 400, like Ollama before 0.5')
+    parser.add_argument('--models', nargs='*', default=None)
+    parser.add_argument('--model-speed', action='append', default=[], metavar='MODEL=FACTOR',
+                        help='Make a model evaluate and decode FACTOR times faster (repeatable)')
+    parser.add_argument('--responses', help='JSON file mapping prompt substrings to scripted responses')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser
+
+
+def config_from_args(args: argparse.Namespace) -> StandInConfig:
+    responses = None
+    if args.responses:
+        with open(args.responses) as handle:
+            responses = json.load(handle)
+    model_speedups = {}
+    for entry in args.model_speed:
+        model, _, factor = entry.partition('=')
+        model_speedups[model] = float(factor)
+    return StandInConfig(
+        latency_distribution=args.latency_distribution,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        token_rate=args.token_rate,
+        prompt_rate=args.prompt_rate,
+        error_rate=args.error_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        load_ms=args.load_ms,
+        cold_load_ms=args.cold_load_ms,
+        prefix_cache_slots=args.prefix_cache_slots,
+        reject_schema_formats=args.reject_schema_formats,
+        models=args.models,
+        model_speedups=model_speedups,
+        responses=responses,
+        seed=args.seed
+    )
+
+
+async def serve(args: argparse.Namespace) -> None:
+    server = OllamaStandIn(config_from_args(args), host=args.host, port=args.port)
+    await server.start()
+    print(f'🧪 Ollama stand-in listening on {server.url}', flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(serve(build_arg_parser().parse_args()))
+    except KeyboardInterrupt:
+        pass
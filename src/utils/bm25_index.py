@@ -0,0 +1,65 @@
+import re
+import math
+import logging
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens, splitting snake_case identifiers into their parts as well."""
+    tokens = []
+    for word in re.findall(r'[a-z0-9_]+', text.lower()):
+        tokens.append(word)
+        if '_' in word:
+            tokens.extend(part for part in word.split('_') if part)
+    return tokens
+
+
+class BM25Index:
+    """Incrementally updatable Okapi BM25 index over short documents."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: List[int] = []
+        self._total_length = 0
+
+    def add(self, text: str) -> int:
+        """Index a document and return its row number."""
+        row = len(self._lengths)
+        counts = Counter(tokenize(text))
+        for term, frequency in counts.items():
+            self._postings.setdefault(term, {})[row] = frequency
+
+        length = sum(counts.values())
+        self._lengths.append(length)
+        self._total_length += length
+        return row
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Return up to k (row, score) pairs with a positive score, best first."""
+        if not self._lengths:
+            return []
+
+        document_count = len(self._lengths)
+        average_length = self._total_length / document_count or 1.0
+        scores: Dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[row] / average_length)
+                scores[row] = scores.get(row, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def __len__(self) -> int:
+        return len(self._lengths)
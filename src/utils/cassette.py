@@ -0,0 +1,130 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# Ollama response fields kept with each recording so replayed calls report the same token counts and durations
+RECORDED_STATS = [
+    'total_duration', 'load_duration', 'prompt_eval_count', 'prompt_eval_duration', 'eval_count', 'eval_duration'
+]
+
+
+class CassetteMissError(Exception):
+    """Raised in replay mode when no recording exists for a request."""
+
+
+class Cassette:
+    """Append-only JSON-lines file of Ollama responses keyed by (model, options, prompt), for record and replay."""
+
+    def __init__(self, path: str, mode: str = REPLAY, reproduce_latency: bool = False, latency_scale: float = 1.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.reproduce_latency = reproduce_latency
+        self.latency_scale = latency_scale
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._positions: Dict[str, int] = {}
+        self._handle = None
+        self.stats = {'recorded': 0, 'replayed': 0, 'misses': 0}
+        self._load()
+        logger.info(f"Cassette {path} opened in {mode} mode with {sum(len(v) for v in self._entries.values())} recordings")
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            if self.replaying:
+                raise FileNotFoundError(f"Cassette file not found: {self.path}")
+            return
+
+        with open(self.path) as handle:
+            for line_number, line in enumerate(handle, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A partially written last line from an interrupted recording is skipped
+                    logger.warning(f"Skipping unreadable cassette line {line_number} in {self.path}")
+                    continue
+                self._entries.setdefault(entry['k'], []).append(entry)
+
+    def record(
+        self,
+        key: str,
+        model: str,
+        content: str,
+        wall_ms: float,
+        response: Optional[Dict[str, Any]] = None,
+        first_token_ms: Optional[float] = None
+    ) -> None:
+        """Append one response with its original timing."""
+        if not self.recording:
+            return
+
+        entry = {
+            'k': key,
+            'm': model,
+            'c': content,
+            't': round(wall_ms, 1),
+            's': {field: response[field] for field in RECORDED_STATS if response and field in response}
+        }
+        if first_token_ms is not None:
+            entry['f'] = round(first_token_ms, 1)
+
+        if self._handle is None:
+            self._handle = open(self.path, 'a')
+        self._handle.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self._handle.flush()
+        self._entries.setdefault(key, []).append(entry)
+        self.stats['recorded'] += 1
+
+    def lookup(self, key: str) -> Dict[str, Any]:
+        """Next recording for a key, cycling through repeated recordings of the same request."""
+        entries = self._entries.get(key)
+        if not entries:
+            self.stats['misses'] += 1
+            raise CassetteMissError(f"No recorded response in {self.path} for request {key[:12]}")
+
+        position = self._positions.get(key, 0)
+        self._positions[key] = position + 1
+        self.stats['replayed'] += 1
+        return entries[position % len(entries)]
+
+    async def replay(self, key: str) -> Dict[str, Any]:
+        """Return the recording for a key, first sleeping for its recorded latency if configured."""
+        entry = self.lookup(key)
+        if self.reproduce_latency:
+            await asyncio.sleep(entry['t'] * self.latency_scale / 1000)
+        return entry
+
+    async def replay_stream(self, entry: Dict[str, Any], chunk_chars: int = 16) -> AsyncIterator[str]:
+        """Yield a looked-up recording in chunks, paced to its recorded first-token and total times if configured."""
+        content = entry['c']
+        chunks = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)] or ['']
+
+        first_token_delay = entry.get('f', entry['t']) * self.latency_scale / 1000
+        remaining = max(entry['t'] * self.latency_scale / 1000 - first_token_delay, 0.0)
+        for index, chunk in enumerate(chunks):
+            if self.reproduce_latency:
+                await asyncio.sleep(first_token_delay if index == 0 else remaining / max(len(chunks) - 1, 1))
+            yield chunk
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
@@ -0,0 +1,63 @@
+import logging
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingIndex:
+    """Top-k cosine similarity search over a contiguous matrix of normalized embeddings."""
+
+    def __init__(self, initial_capacity: int = 64):
+        self.initial_capacity = initial_capacity
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+
+    def add(self, vectors: Sequence[Sequence[float]]) -> None:
+        """Append vectors, growing the backing matrix geometrically instead of rebuilding it."""
+        if not vectors:
+            return
+
+        rows = np.asarray(vectors, dtype=np.float32)
+        if rows.ndim != 2:
+            raise ValueError(f"Expected a 2-D batch of vectors, got shape {rows.shape}")
+
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        rows = rows / np.where(norms == 0, 1.0, norms)
+
+        if self._matrix is None:
+            capacity = max(self.initial_capacity, len(rows))
+            self._matrix = np.zeros((capacity, rows.shape[1]), dtype=np.float32)
+        elif rows.shape[1] != self._matrix.shape[1]:
+            raise ValueError(f"Embedding dimension {rows.shape[1]} does not match index dimension {self._matrix.shape[1]}")
+
+        required = self._size + len(rows)
+        if required > len(self._matrix):
+            capacity = max(required, len(self._matrix) * 2)
+            logger.debug(f"Growing embedding index capacity to {capacity}")
+            grown = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+
+        self._matrix[self._size:required] = rows
+        self._size = required
+
+    def search(self, vector: Sequence[float], k: int) -> List[Tuple[int, float]]:
+        """Return up to k (row, cosine similarity) pairs, best first."""
+        if self._size == 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+
+        scores = self._matrix[:self._size] @ (query / norm)
+        k = min(k, self._size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,202 @@
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Iterable, Iterator
+from .resilience import CircuitBreaker, CircuitOpenError, classify_error
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+
+class HostRouter:
+    """Chooses the Ollama replica for each call.
+
+    Replicas that already have the model loaded are preferred, then the one with
+    the fewest requests in flight, then the lowest latency EWMA. Requests that
+    share a prompt prefix stick to the replica that last served that prefix, so
+    its KV cache can be reused, unless that replica is busier than the others.
+    Hosts whose circuit breaker is open are skipped; a background prober per
+    host keeps the breakers and loaded-model lists current.
+    """
+
+    def __init__(
+        self,
+        hosts: List[str],
+        fetch_loaded_models: Optional[Callable[[str], Awaitable[List[str]]]] = None,
+        ewma_alpha: float = 0.2,
+        sticky_prefix_chars: int = 512,
+        sticky_slack: int = 1,
+        max_sticky_entries: int = 4096,
+        loaded_models_ttl: float = 30.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10.0
+    ):
+        if not hosts:
+            raise ValueError("HostRouter needs at least one host")
+        self.hosts = list(dict.fromkeys(hosts))
+        self.fetch_loaded_models = fetch_loaded_models
+        self.ewma_alpha = ewma_alpha
+        self.sticky_prefix_chars = sticky_prefix_chars
+        self.sticky_slack = sticky_slack
+        self.max_sticky_entries = max_sticky_entries
+        self.loaded_models_ttl = loaded_models_ttl
+        self._state: Dict[str, Dict[str, Any]] = {
+            host: {'in_flight': 0, 'ewma_ms': None, 'loaded_models': set(), 'requests': 0, 'errors': 0, 'sticky_hits': 0}
+            for host in self.hosts
+        }
+        self.breakers = {host: CircuitBreaker(host, failure_threshold, reset_timeout) for host in self.hosts}
+        self._sticky: 'OrderedDict[str, str]' = OrderedDict()
+        self._models_checked_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._probe_tasks: Dict[str, asyncio.Task] = {}
+        logger.info(f"HostRouter initialized with {len(self.hosts)} hosts: {self.hosts}")
+
+    def _prefix_key(self, model: str, prompt: str) -> str:
+        return hashlib.sha1(f"{model}\n{prompt[:self.sticky_prefix_chars]}".encode('utf-8')).hexdigest()
+
+    def choose(self, model: Optional[str] = None, prompt: Optional[str] = None, exclude: Iterable[str] = ()) -> str:
+        """Pick the replica for a call, avoiding excluded hosts unless no other host is left.
+
+        Raises CircuitOpenError when every host's breaker is open.
+        """
+        available = [host for host in self.hosts if self.breakers[host].available()]
+        if not available:
+            raise CircuitOpenError(f"Ollama API call failed: circuit open for every host ({', '.join(self.hosts)})")
+        if len(available) == 1:
+            return available[0]
+
+        excluded = set(exclude)
+        candidates = [host for host in available if host not in excluded] or available
+        if model:
+            warm = [host for host in candidates if model in self._state[host]['loaded_models']]
+            candidates = warm or candidates
+
+        least_busy = min(self._state[host]['in_flight'] for host in candidates)
+        prefix_key = self._prefix_key(model or '', prompt) if prompt else None
+        if prefix_key is not None:
+            sticky_host = self._sticky.get(prefix_key)
+            if sticky_host in candidates and self._state[sticky_host]['in_flight'] <= least_busy + self.sticky_slack:
+                self._sticky.move_to_end(prefix_key)
+                self._state[sticky_host]['sticky_hits'] += 1
+                return sticky_host
+
+        host = min(candidates, key=lambda candidate: (
+            self._state[candidate]['in_flight'],
+            self._state[candidate]['ewma_ms'] or 0.0
+        ))
+        if prefix_key is not None:
+            self._sticky[prefix_key] = host
+            self._sticky.move_to_end(prefix_key)
+            if len(self._sticky) > self.max_sticky_entries:
+                self._sticky.popitem(last=False)
+        return host
+
+    @contextmanager
+    def track(self, host: str, model: Optional[str] = None) -> Iterator[None]:
+        """Count a call as in flight on a host and fold its latency into the host's EWMA when it succeeds."""
+        state = self._state.get(host)
+        if state is None:
+            yield
+            return
+
+        breaker = self.breakers[host]
+        breaker.begin()
+        state['in_flight'] += 1
+        state['requests'] += 1
+        start_time = time.time()
+        try:
+            yield
+        except Exception as error:
+            state['errors'] += 1
+            # Only failures that point at the host, not at the request, count towards opening its breaker
+            if classify_error(error).retryable:
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            wall_ms = (time.time() - start_time) * 1000
+            state['ewma_ms'] = wall_ms if state['ewma_ms'] is None else (
+                self.ewma_alpha * wall_ms + (1 - self.ewma_alpha) * state['ewma_ms']
+            )
+            if model:
+                state['loaded_models'].add(model)
+        finally:
+            state['in_flight'] -= 1
+
+    async def probe(self, host: str, timeout: float = 2.0) -> bool:
+        """Health-check a host by listing its loaded models (Ollama's /api/ps) and update its breaker."""
+        try:
+            models = await asyncio.wait_for(self.fetch_loaded_models(host), timeout)
+        except Exception as error:
+            logger.warning(f"Health probe of {host} failed: {str(error) or type(error).__name__}")
+            self.breakers[host].record_failure()
+            return False
+        self._state[host]['loaded_models'] = set(models)
+        self.breakers[host].record_success()
+        return True
+
+    async def refresh(self) -> None:
+        """Probe every host once."""
+        if self.fetch_loaded_models is None:
+            return
+        self._models_checked_at = time.time()
+        await asyncio.gather(*[self.probe(host) for host in self.hosts])
+        logger.debug(f"Loaded models per host: {({host: sorted(self._state[host]['loaded_models']) for host in self.hosts})}")
+
+    async def _probe_loop(self, host: str, interval: float, timeout: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.probe(host, timeout)
+
+    def start_probing(self, interval: float = 5.0, timeout: float = 2.0) -> None:
+        """Start a background health prober per host."""
+        if self.fetch_loaded_models is None:
+            return
+        for host in self.hosts:
+            task = self._probe_tasks.get(host)
+            if task is None or task.done():
+                self._probe_tasks[host] = asyncio.ensure_future(self._probe_loop(host, interval, timeout))
+        logger.info(f"Health probing {len(self.hosts)} Ollama hosts every {interval}s")
+
+    async def stop_probing(self) -> None:
+        """Stop the background health probers."""
+        tasks = list(self._probe_tasks.values())
+        self._probe_tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def schedule_refresh(self) -> None:
+        """Refresh loaded models in the background once the last refresh is older than loaded_models_ttl."""
+        if len(self.hosts) == 1 or self.fetch_loaded_models is None or self._probe_tasks:
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        if time.time() - self._models_checked_at < self.loaded_models_ttl:
+            return
+        self._models_checked_at = time.time()
+        self._refresh_task = asyncio.ensure_future(self.refresh())
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host routing state: in-flight and total requests, errors, latency EWMA, loaded models and breaker state."""
+        return {
+            host: {
+                'in_flight': state['in_flight'],
+                'requests': state['requests'],
+                'errors': state['errors'],
+                'sticky_hits': state['sticky_hits'],
+                'ewma_ms': state['ewma_ms'],
+                'loaded_models': sorted(state['loaded_models']),
+                'breaker': self.breakers[host].state,
+                'consecutive_failures': self.breakers[host].failures
+            }
+            for host, state in self._state.items()
+        }
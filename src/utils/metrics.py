@@ -0,0 +1,345 @@
+import os
+import time
+import bisect
+import logging
+import contextvars
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms or tokens) shared by every histogram
+DEFAULT_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+# Fields summed per stage from the individual call records
+CALL_TOTAL_FIELDS = [
+    'wall_ms', 'queue_ms', 'prompt_chars', 'prompt_tokens', 'prompt_tokens_cached', 'output_tokens',
+    'eval_duration_ms', 'prompt_eval_duration_ms', 'load_duration_ms', 'retries', 'hedged'
+]
+
+# A call that spent at least this long loading its model found the model evicted (a cold load)
+COLD_LOAD_THRESHOLD_MS = 500.0
+
+
+class RequestTrace:
+    """Per-request record of stage timings and every Ollama call made while serving it."""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.calls: List[Dict[str, Any]] = []
+
+    def record_stage(self, stage: str, wall_ms: float) -> None:
+        self.stages.setdefault(stage, {})['wall_ms'] = wall_ms
+
+    def record_call(self, call: Dict[str, Any]) -> None:
+        self.calls.append(call)
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-stage totals over the calls made in each stage, plus the raw call records."""
+        stages: Dict[str, Dict[str, Any]] = {
+            name: {'wall_ms': timing['wall_ms'], 'llm_calls': 0, 'cache_hits': 0, 'totals': {}}
+            for name, timing in self.stages.items()
+        }
+        for call in self.calls:
+            stage = stages.setdefault(call['stage'] or 'unscoped', {'wall_ms': None, 'llm_calls': 0, 'cache_hits': 0, 'totals': {}})
+            stage['llm_calls'] += 1
+            stage['cache_hits'] += int(call['cache_hit'])
+            for field in CALL_TOTAL_FIELDS:
+                stage['totals'][field] = stage['totals'].get(field, 0) + (call.get(field) or 0)
+        return {'stages': stages, 'calls': list(self.calls)}
+
+
+class MetricsSink(ABC):
+    """Receives metric observations; subclasses decide how to aggregate or export them."""
+
+    @abstractmethod
+    def observe(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        """Record one sample of a histogram."""
+
+    @abstractmethod
+    def increment(self, name: str, labels: Dict[str, str], amount: float = 1) -> None:
+        """Add to a counter."""
+
+    def gauge(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        """Set a point-in-time value; sinks that do not track gauges ignore it."""
+
+
+class HistogramSink(MetricsSink):
+    """In-process histograms and counters with percentile queries over a window of recent samples."""
+
+    def __init__(self, buckets: Optional[List[float]] = None, window: int = 2048):
+        self.buckets = buckets or DEFAULT_BUCKETS
+        self.window = window
+        self._histograms: Dict[Tuple[str, Tuple], Dict[str, Any]] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._gauges: Dict[Tuple[str, Tuple], float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Optional[Dict[str, str]]) -> Tuple[str, Tuple]:
+        return name, tuple(sorted((labels or {}).items()))
+
+    def observe(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        histogram = self._histograms.setdefault(self._key(name, labels), {
+            'count': 0,
+            'sum': 0.0,
+            'bucket_counts': [0] * (len(self.buckets) + 1),
+            'samples': deque(maxlen=self.window)
+        })
+        histogram['count'] += 1
+        histogram['sum'] += value
+        histogram['bucket_counts'][bisect.bisect_left(self.buckets, value)] += 1
+        histogram['samples'].append(value)
+
+    def increment(self, name: str, labels: Dict[str, str], amount: float = 1) -> None:
+        key = self._key(name, labels)
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        self._gauges[self._key(name, labels)] = value
+
+    def percentile(self, name: str, q: float, labels: Optional[Dict[str, str]] = None) -> Optional[float]:
+        """The q-th percentile (0-100) of the recent samples of a histogram, or None if empty."""
+        histogram = self._histograms.get(self._key(name, labels))
+        if not histogram or not histogram['samples']:
+            return None
+        samples = sorted(histogram['samples'])
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+    def get_histogram(self, name: str, labels: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """Count, sum, bucket counts and p50/p95/p99 of a histogram."""
+        histogram = self._histograms.get(self._key(name, labels))
+        if histogram is None:
+            return None
+        return {
+            'count': histogram['count'],
+            'sum': histogram['sum'],
+            'buckets': dict(zip(self.buckets + [float('inf')], histogram['bucket_counts'])),
+            'p50': self.percentile(name, 50, labels),
+            'p95': self.percentile(name, 95, labels),
+            'p99': self.percentile(name, 99, labels)
+        }
+
+    def get_counter(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        return self._counters.get(self._key(name, labels), 0)
+
+    def get_gauge(self, name: str, labels: Optional[Dict[str, str]] = None) -> Optional[float]:
+        return self._gauges.get(self._key(name, labels))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Every histogram, counter and gauge, keyed by name and label set."""
+        return {
+            'histograms': {
+                f"{name}{dict(labels)}": self.get_histogram(name, dict(labels))
+                for name, labels in self._histograms
+            },
+            'counters': {
+                f"{name}{dict(labels)}": value
+                for (name, labels), value in self._counters.items()
+            },
+            'gauges': {
+                f"{name}{dict(labels)}": value
+                for (name, labels), value in self._gauges.items()
+            }
+        }
+
+
+class PrometheusTextSink(HistogramSink):
+    """Histogram sink that can render and write its state in the Prometheus text exposition format."""
+
+    def __init__(self, path: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    @staticmethod
+    def _format_labels(labels: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+    def render(self) -> str:
+        lines = []
+        for name in sorted({name for name, _ in self._histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (histogram_name, labels), histogram in self._histograms.items():
+                if histogram_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + ['+Inf'], histogram['bucket_counts']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._format_labels(labels, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {histogram['count']}")
+        for name in sorted({name for name, _ in self._counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (counter_name, labels), value in self._counters.items():
+                if counter_name == name:
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+        for name in sorted({name for name, _ in self._gauges}):
+            lines.append(f"# TYPE {name} gauge")
+            for (gauge_name, labels), value in self._gauges.items():
+                if gauge_name == name:
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: Optional[str] = None) -> None:
+        """Write the exposition text to a file, e.g. for node_exporter's textfile collector."""
+        path = path or self.path
+        if not path:
+            raise ValueError("No path configured for Prometheus text output")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as handle:
+            handle.write(self.render())
+        os.replace(temp_path, path)
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar('current_trace', default=None)
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('current_stage', default=None)
+_sinks: List[MetricsSink] = []
+
+
+def add_metrics_sink(sink: MetricsSink) -> MetricsSink:
+    """Register a sink to receive every stage and Ollama call observation."""
+    _sinks.append(sink)
+    return sink
+
+
+def remove_metrics_sink(sink: MetricsSink) -> None:
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def get_metrics_sinks() -> List[MetricsSink]:
+    return list(_sinks)
+
+
+def current_stage() -> Optional[str]:
+    return _current_stage.get()
+
+
+@contextmanager
+def trace_request() -> Iterator[RequestTrace]:
+    """Collect stage and call metrics for everything run inside the block, including tasks it spawns."""
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def stage_scope(stage: str) -> Iterator[None]:
+    """Attribute Ollama calls made inside the block to a pipeline stage and time the stage."""
+    token = _current_stage.set(stage)
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+        wall_ms = (time.time() - start_time) * 1000
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.record_stage(stage, wall_ms)
+        for sink in _sinks:
+            sink.observe('pipeline_stage_duration_ms', wall_ms, {'stage': stage})
+
+
+def _nanoseconds_to_ms(value: Optional[int]) -> Optional[float]:
+    return value / 1e6 if value is not None else None
+
+
+def record_ollama_call(
+    model: str,
+    wall_ms: float,
+    queue_ms: float = 0.0,
+    prompt_chars: int = 0,
+    response: Optional[Dict[str, Any]] = None,
+    cache_hit: bool = False,
+    retries: int = 0,
+    error: Optional[str] = None,
+    hedged: bool = False,
+    host: Optional[str] = None,
+    prompt_tokens_cached: Optional[int] = None
+) -> Dict[str, Any]:
+    """Record one Ollama call against the current request trace and every registered sink.
+
+    prompt_tokens_cached is given for chat session turns: the tokens of the
+    earlier turns, which the server already holds in its prompt cache.
+    """
+    response = response or {}
+    call = {
+        'stage': _current_stage.get(),
+        'model': model,
+        'host': host,
+        'wall_ms': wall_ms,
+        'queue_ms': queue_ms,
+        'prompt_chars': prompt_chars,
+        'prompt_tokens': response.get('prompt_eval_count'),
+        'prompt_tokens_cached': prompt_tokens_cached,
+        'output_tokens': response.get('eval_count'),
+        'eval_duration_ms': _nanoseconds_to_ms(response.get('eval_duration')),
+        'prompt_eval_duration_ms': _nanoseconds_to_ms(response.get('prompt_eval_duration')),
+        'load_duration_ms': _nanoseconds_to_ms(response.get('load_duration')),
+        'cache_hit': cache_hit,
+        'retries': retries,
+        'hedged': hedged,
+        'error': error
+    }
+
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record_call(call)
+
+    labels = {'stage': call['stage'] or 'unscoped', 'model': model}
+    for sink in _sinks:
+        sink.increment('ollama_calls_total', labels)
+        if cache_hit:
+            sink.increment('ollama_cache_hits_total', labels)
+        if retries:
+            sink.increment('ollama_retries_total', labels, retries)
+        if hedged:
+            sink.increment('ollama_hedges_total', labels)
+        if error:
+            sink.increment('ollama_errors_total', labels)
+        if (call['load_duration_ms'] or 0) >= COLD_LOAD_THRESHOLD_MS:
+            sink.increment('ollama_cold_loads_total', labels)
+        if call['prompt_tokens_cached']:
+            sink.increment('ollama_prompt_tokens_cached_total', labels, call['prompt_tokens_cached'])
+        for field in ('wall_ms', 'queue_ms', 'prompt_chars', 'prompt_tokens', 'prompt_tokens_cached', 'output_tokens', 'eval_duration_ms', 'prompt_eval_duration_ms', 'load_duration_ms'):
+            if call[field] is not None and not cache_hit:
+                sink.observe(f'ollama_call_{field}', call[field], labels)
+
+    return call
+
+
+def record_model_load(model: str, host: str, load_ms: float) -> None:
+    """Record the load time reported for a warm-up request that loaded (or re-pinned) a model on a host."""
+    labels = {'stage': 'warmup', 'model': model}
+    for sink in _sinks:
+        sink.observe('ollama_model_load_ms', load_ms, {**labels, 'host': host})
+        if load_ms >= COLD_LOAD_THRESHOLD_MS:
+            sink.increment('ollama_cold_loads_total', labels)
+
+
+def record_stage_skip(stage: str, saved_ms: Optional[float] = None) -> None:
+    """Record that a pipeline stage's LLM call was skipped, with the estimated time it would have taken."""
+    labels = {'stage': stage}
+    for sink in _sinks:
+        sink.increment('pipeline_stage_skips_total', labels)
+        if saved_ms is not None:
+            sink.observe('pipeline_stage_saved_ms', saved_ms, labels)
+
+
+# Numeric encoding of circuit breaker states for the ollama_breaker_state gauge
+BREAKER_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+def record_breaker_state(host: str, state: str) -> None:
+    """Report a circuit breaker transition for an Ollama host to every registered sink."""
+    for sink in _sinks:
+        sink.gauge('ollama_breaker_state', BREAKER_STATE_VALUES[state], {'host': host})
+        sink.increment('ollama_breaker_transitions_total', {'host': host, 'state': state})
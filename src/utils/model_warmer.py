@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Iterable
+from . import ollama_client
+from .ollama_client import preload_model, get_router, OLLAMA_KEEP_ALIVE, OLLAMA_KEEP_ALIVE_REFRESH
+from .resilience import CircuitBreaker
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+
+class ModelWarmer:
+    """Loads the pipeline's models on every Ollama replica ahead of traffic and keeps them resident.
+
+    warm() preloads every model concurrently with the configured keep_alive.
+    While requests keep arriving, a background task re-pins the models every
+    refresh_interval, so a model that some replica has not served for a while
+    is not evicted between bursts. Once traffic stops the refresher stops
+    re-pinning and Ollama unloads the models when their keep_alive runs out.
+    """
+
+    def __init__(
+        self,
+        models: Iterable[Optional[str]],
+        embed_models: Iterable[Optional[str]] = (),
+        keep_alive: Optional[str] = None,
+        refresh_interval: float = OLLAMA_KEEP_ALIVE_REFRESH
+    ):
+        # None stands for the default chat or embedding model, resolved when warming
+        self.models = list(models)
+        self.embed_models = list(embed_models)
+        self.keep_alive = keep_alive or OLLAMA_KEEP_ALIVE
+        self.refresh_interval = refresh_interval
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._requests_seen = 0
+
+    async def _preload(self, model: str, host: str, embedding: bool) -> None:
+        stats = self._stats.setdefault(host, {})
+        try:
+            load_ms = await preload_model(model, host, self.keep_alive, embedding)
+        except Exception as error:
+            logger.warning(str(error))
+            stats[model] = {'loaded': False, 'error': str(error)}
+            return
+        logger.info(f"Model {model} ready on {host} (load {load_ms:.0f}ms, keep_alive={self.keep_alive})")
+        stats[model] = {'loaded': True, 'load_ms': load_ms}
+
+    async def warm(self) -> Dict[str, Dict[str, Any]]:
+        """Preload every model on every replica whose circuit breaker is not open; returns per-host load results."""
+        router = get_router()
+        hosts = [host for host in router.hosts if router.breakers[host].state != CircuitBreaker.OPEN]
+        models = dict.fromkeys(model or ollama_client.OLLAMA_MODEL for model in self.models)
+        embed_models = dict.fromkeys(model or ollama_client.OLLAMA_EMBED_MODEL for model in self.embed_models)
+        await asyncio.gather(
+            *[self._preload(model, host, False) for host in hosts for model in models],
+            *[self._preload(model, host, True) for host in hosts for model in embed_models]
+        )
+        return self.get_stats()
+
+    def _total_requests(self) -> int:
+        return sum(state['requests'] for state in get_router().get_stats().values())
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            requests = self._total_requests()
+            if requests == self._requests_seen:
+                continue
+            self._requests_seen = requests
+            logger.debug(f"Refreshing keep_alive of {len(self.models) + len(self.embed_models)} models")
+            await self.warm()
+
+    def start(self) -> None:
+        """Start re-pinning the models in the background while traffic flows."""
+        if self.refresh_interval <= 0 or (self._refresh_task is not None and not self._refresh_task.done()):
+            return
+        self._requests_seen = self._total_requests()
+        self._refresh_task = asyncio.ensure_future(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """Stop the background refresher."""
+        if self._refresh_task is None:
+            return
+        self._refresh_task.cancel()
+        await asyncio.gather(self._refresh_task, return_exceptions=True)
+        self._refresh_task = None
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Last preload result per host and model."""
+        return {host: dict(models) for host, models in self._stats.items()}
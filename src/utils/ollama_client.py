@@ -1,62 +1,833 @@
 import os
+import time
+import asyncio
 import logging
-from typing import List, Optional
+import weakref
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Any, List, Optional, AsyncIterator, Iterator, Tuple, Set
+import httpx
 import ollama
 from dotenv import load_dotenv
+from .response_cache import ResponseCache
+from .cassette import Cassette, REPLAY
+from .resilience import RetryPolicy, HedgePolicy, classify_error
+from .host_router import HostRouter
+from .metrics import record_ollama_call, record_model_load
 
 load_dotenv()
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+# Connection settings are read once at import time instead of on every call
+# OLLAMA_HOST may list several replicas separated by commas; the first one serves one-off admin calls
+OLLAMA_HOSTS = [host.strip() for host in os.getenv('OLLAMA_HOST', 'http://localhost:11434').split(',') if host.strip()]
+OLLAMA_HOST = OLLAMA_HOSTS[0]
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.1')
+# Optional smaller model for the short-answer stages (refinement and selection); unset means OLLAMA_MODEL
+OLLAMA_FAST_MODEL = os.getenv('OLLAMA_FAST_MODEL')
+OLLAMA_EMBED_MODEL = os.getenv('OLLAMA_EMBED_MODEL', 'nomic-embed-text')
+# Texts sent per batched /api/embed request
+OLLAMA_EMBED_BATCH_SIZE = int(os.getenv('OLLAMA_EMBED_BATCH_SIZE', '256'))
+# Seconds retrieval waits after an embedding failure before trying embeddings again
+OLLAMA_EMBED_RETRY_AFTER = float(os.getenv('OLLAMA_EMBED_RETRY_AFTER', '60'))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv('OLLAMA_MAX_CONNECTIONS', '10'))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv('OLLAMA_KEEPALIVE_EXPIRY', '60'))
 
-async def call_ollama(prompt: str, model: Optional[str] = None) -> str:
-    """Call Ollama API with the given prompt and model."""
-    host = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
-    model_name = model or os.getenv('OLLAMA_MODEL', 'llama3.1')
-    
-    logger.info(f"Making Ollama API call to {host} with model {model_name}")
+# Response cache settings; the cache is off unless enabled, and the on-disk tier also needs a path
+OLLAMA_CACHE_ENABLED = os.getenv('OLLAMA_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+OLLAMA_CACHE_MAX_ENTRIES = int(os.getenv('OLLAMA_CACHE_MAX_ENTRIES', '1024'))
+OLLAMA_CACHE_TTL = float(os.getenv('OLLAMA_CACHE_TTL', '86400'))
+OLLAMA_CACHE_PATH = os.getenv('OLLAMA_CACHE_PATH')
+OLLAMA_CACHE_DISK_MAX_ENTRIES = int(os.getenv('OLLAMA_CACHE_DISK_MAX_ENTRIES', '100000'))
+
+# Record/replay settings; a cassette path turns on recording or replaying of chat calls
+OLLAMA_CASSETTE = os.getenv('OLLAMA_CASSETTE')
+OLLAMA_CASSETTE_MODE = os.getenv('OLLAMA_CASSETTE_MODE', REPLAY)
+OLLAMA_CASSETTE_LATENCY = os.getenv('OLLAMA_CASSETTE_LATENCY', 'false').lower() in ('1', 'true', 'yes')
+
+# Retry and hedging settings; hedging is off unless a latency percentile is given
+OLLAMA_REQUEST_TIMEOUT = float(os.getenv('OLLAMA_REQUEST_TIMEOUT', '120'))
+OLLAMA_MAX_RETRIES = int(os.getenv('OLLAMA_MAX_RETRIES', '2'))
+OLLAMA_RETRY_BASE_DELAY = float(os.getenv('OLLAMA_RETRY_BASE_DELAY', '0.25'))
+OLLAMA_RETRY_MAX_DELAY = float(os.getenv('OLLAMA_RETRY_MAX_DELAY', '4'))
+OLLAMA_HEDGE_PERCENTILE = float(os.getenv('OLLAMA_HEDGE_PERCENTILE', '0'))
+
+# Circuit breaker and health probe settings per host
+OLLAMA_BREAKER_FAILURES = int(os.getenv('OLLAMA_BREAKER_FAILURES', '5'))
+OLLAMA_BREAKER_RESET = float(os.getenv('OLLAMA_BREAKER_RESET', '10'))
+OLLAMA_HEALTH_INTERVAL = float(os.getenv('OLLAMA_HEALTH_INTERVAL', '5'))
+
+# How long Ollama keeps a model in memory after each request (a duration such as '30m', or seconds; -1 pins it)
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+OLLAMA_KEEP_ALIVE_REFRESH = float(os.getenv('OLLAMA_KEEP_ALIVE_REFRESH', '60'))
+
+DEFAULT_OPTIONS = {
+    'temperature': 0.1,
+    'num_predict': 2000
+}
+
+
+class OllamaClientPool:
+    """Registry of long-lived Ollama clients keyed by host, each with a keep-alive connection pool."""
+
+    def __init__(self, max_connections: int = OLLAMA_MAX_CONNECTIONS, keepalive_expiry: float = OLLAMA_KEEPALIVE_EXPIRY):
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._clients: Dict[str, ollama.AsyncClient] = {}
+        self._transports: Dict[str, httpx.AsyncHTTPTransport] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        logger.info(f"OllamaClientPool initialized (max_connections={max_connections}, keepalive_expiry={keepalive_expiry}s)")
+
+    def get_client(self, host: Optional[str] = None) -> ollama.AsyncClient:
+        """Return the pooled client for a host, creating it on first use."""
+        host = host or OLLAMA_HOST
+        client = self._get_or_create(host)
+        self._stats[host]['requests'] += 1
+        return client
+
+    @asynccontextmanager
+    async def acquire(self, host: Optional[str] = None) -> AsyncIterator[Tuple[ollama.AsyncClient, float]]:
+        """Hold one of the host's max_connections request slots; yields the client and the ms spent queueing."""
+        host = host or OLLAMA_HOST
+        slot = self._slots.setdefault(host, asyncio.Semaphore(self.max_connections))
+        queue_start = time.time()
+        async with slot:
+            queue_ms = (time.time() - queue_start) * 1000
+            if queue_ms > 1:
+                logger.debug(f"Waited {queue_ms:.1f}ms for a connection slot to {host}")
+            yield self.get_client(host), queue_ms
+        self.record_connections(host)
+
+    def _get_or_create(self, host: str) -> ollama.AsyncClient:
+        """Look up or lazily build the client for a host."""
+        stats = self._stats.setdefault(host, {
+            'clients_created': 0,
+            'requests': 0,
+            'connections_opened': 0,
+            'seen_connections': weakref.WeakSet()
+        })
+
+        client = self._clients.get(host)
+        if client is None:
+            logger.info(f"Creating pooled Ollama client for {host}")
+            transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ))
+            client = ollama.AsyncClient(host=host, transport=transport)
+            self._clients[host] = client
+            self._transports[host] = transport
+            stats['clients_created'] += 1
+
+        return client
+
+    def record_connections(self, host: Optional[str] = None) -> None:
+        """Note which pooled connections a host currently holds so reuse can be reported."""
+        host = host or OLLAMA_HOST
+        transport = self._transports.get(host)
+        if transport is None:
+            return
+
+        # httpcore exposes the live connections of its pool; any we have not seen before were newly opened
+        stats = self._stats[host]
+        pool = getattr(transport, '_pool', None)
+        for connection in getattr(pool, 'connections', []):
+            if connection not in stats['seen_connections']:
+                stats['seen_connections'].add(connection)
+                stats['connections_opened'] += 1
+
+    async def open(self, hosts: Optional[List[str]] = None) -> None:
+        """Eagerly create clients for the given hosts."""
+        for host in hosts or OLLAMA_HOSTS:
+            self._get_or_create(host)
+        logger.info(f"Opened Ollama client pool for hosts: {list(self._clients.keys())}")
+
+    async def close(self) -> None:
+        """Close all pooled clients and their connections."""
+        for host, transport in self._transports.items():
+            logger.info(f"Closing pooled Ollama client for {host}")
+            try:
+                await transport.aclose()
+            except Exception as error:
+                logger.warning(f"Failed to close Ollama client for {host}: {str(error)}")
+        self._clients.clear()
+        self._transports.clear()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Report per-host request counts and connection reuse."""
+        report = {}
+        for host, stats in self._stats.items():
+            report[host] = {
+                'clients_created': stats['clients_created'],
+                'requests': stats['requests'],
+                'connections_opened': stats['connections_opened'],
+                'connection_reuses': max(stats['requests'] - stats['connections_opened'], 0),
+                'active': host in self._clients
+            }
+        return report
+
+
+_client_pool = OllamaClientPool()
+
+
+def get_client_pool() -> OllamaClientPool:
+    """Return the process-wide Ollama client pool."""
+    return _client_pool
+
+
+async def _fetch_loaded_models(host: str) -> List[str]:
+    """Names of the models a host currently holds in memory, with and without the ':latest' tag."""
+    response = await _client_pool.get_client(host).ps()
+    names = []
+    for model in response.get('models', []):
+        names.append(model['name'])
+        if model['name'].endswith(':latest'):
+            names.append(model['name'][:-len(':latest')])
+    return names
+
+
+def _build_router(hosts: List[str]) -> HostRouter:
+    return HostRouter(
+        hosts,
+        _fetch_loaded_models,
+        failure_threshold=OLLAMA_BREAKER_FAILURES,
+        reset_timeout=OLLAMA_BREAKER_RESET
+    )
+
+
+_router = _build_router(OLLAMA_HOSTS)
+
+
+def get_router() -> HostRouter:
+    """Return the router that spreads calls over the configured Ollama replicas."""
+    return _router
+
+
+_response_cache: Optional[ResponseCache] = None
+if OLLAMA_CACHE_ENABLED:
+    _response_cache = ResponseCache(
+        max_entries=OLLAMA_CACHE_MAX_ENTRIES,
+        ttl=OLLAMA_CACHE_TTL,
+        disk_path=OLLAMA_CACHE_PATH,
+        disk_max_entries=OLLAMA_CACHE_DISK_MAX_ENTRIES
+    )
+
+
+_cassette: Optional[Cassette] = None
+if OLLAMA_CASSETTE:
+    _cassette = Cassette(OLLAMA_CASSETTE, mode=OLLAMA_CASSETTE_MODE, reproduce_latency=OLLAMA_CASSETTE_LATENCY)
+
+
+_retry_policy = RetryPolicy(
+    max_retries=OLLAMA_MAX_RETRIES,
+    base_delay=OLLAMA_RETRY_BASE_DELAY,
+    max_delay=OLLAMA_RETRY_MAX_DELAY,
+    timeout=OLLAMA_REQUEST_TIMEOUT
+)
+_hedge_policy: Optional[HedgePolicy] = HedgePolicy(percentile=OLLAMA_HEDGE_PERCENTILE) if OLLAMA_HEDGE_PERCENTILE > 0 else None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the process-wide response cache, or None when caching is disabled."""
+    return _response_cache
+
+
+def configure_ollama(host: Optional[str] = None, model: Optional[str] = None) -> None:
+    """Override the Ollama host(s, comma-separated) and default model read from the environment at import time."""
+    global OLLAMA_HOSTS, OLLAMA_HOST, OLLAMA_MODEL, _router
+    if host:
+        OLLAMA_HOSTS = [entry.strip() for entry in host.split(',') if entry.strip()]
+        OLLAMA_HOST = OLLAMA_HOSTS[0]
+        _router = _build_router(OLLAMA_HOSTS)
+    if model:
+        OLLAMA_MODEL = model
+    logger.info(f"Ollama configured with hosts {OLLAMA_HOSTS} and model {OLLAMA_MODEL}")
+
+
+def configure_response_cache(cache: Optional[ResponseCache]) -> None:
+    """Replace the process-wide response cache; pass None to disable caching."""
+    global _response_cache
+    _response_cache = cache
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Return the active record/replay cassette, or None when calls go to Ollama normally."""
+    return _cassette
+
+
+def configure_cassette(cassette: Optional[Cassette]) -> None:
+    """Replace the active cassette; pass None to stop recording or replaying."""
+    global _cassette
+    if _cassette is not None and _cassette is not cassette:
+        _cassette.close()
+    _cassette = cassette
+
+
+def configure_retries(policy: RetryPolicy) -> None:
+    """Replace the timeout and retry policy applied to every chat call."""
+    global _retry_policy
+    _retry_policy = policy
+
+
+def configure_hedging(policy: Optional[HedgePolicy]) -> None:
+    """Replace the hedging policy for chat calls; pass None to disable hedging."""
+    global _hedge_policy
+    _hedge_policy = policy
+
+
+class ChatSession:
+    """One request's LLM calls sent as successive turns of a single chat on one replica.
+
+    The system message carries the static catalog and each call's prompt is
+    sent after the previous turns, so every call starts with the conversation
+    the replica already holds in its prompt (KV) cache and only the new
+    message has to be evaluated. Turns run one at a time so each extends the
+    conversation the previous one left in the cache, and they stay on the
+    replica that served the first turn while it is healthy.
+
+    Running turns one at a time trades latency for cache reuse: stages that
+    would otherwise call the model concurrently, such as query and table
+    selection, wait for each other.
+    """
+
+    def __init__(self, system_prompt: str, includes_catalog: bool = True):
+        self.system_prompt = system_prompt
+        # Whether prompts may refer to the catalog in the system message instead of repeating it
+        self.includes_catalog = includes_catalog
+        self.host: Optional[str] = None
+        self.turns: List[Dict[str, str]] = []
+        self.lock = asyncio.Lock()
+        # Tokens of the conversation the host last evaluated (prompt and answer), as the host reported them
+        self.context_tokens = 0
+
+    def messages(self, prompt: str) -> List[Dict[str, str]]:
+        """The chat messages for a new turn: system message, earlier turns, then the prompt."""
+        return [{'role': 'system', 'content': self.system_prompt}, *self.turns, {'role': 'user', 'content': prompt}]
+
+    def add_turn(self, prompt: str, response: str) -> None:
+        self.turns.append({'role': 'user', 'content': prompt})
+        self.turns.append({'role': 'assistant', 'content': response})
+
+    def cached_tokens(self, host: str, response: Dict[str, Any]) -> int:
+        """Prompt tokens of a turn the host served from its prompt cache.
+
+        The host may still hold the conversation it last evaluated. Ollama's
+        prompt_eval_count only counts the tokens it evaluated, so a count below
+        that conversation's length shows the host reused it; otherwise the turn
+        counts as a cache miss. A reused conversation shorter than the new
+        message is also reported as a miss, so the figure errs low.
+        """
+        evaluated = response.get('prompt_eval_count')
+        if host != self.host or evaluated is None or evaluated >= self.context_tokens:
+            return 0
+        return self.context_tokens
+
+    def record_usage(self, host: str, response: Dict[str, Any]) -> None:
+        """Note the conversation a host now holds after answering a turn, from the token counts it reported."""
+        cached = self.cached_tokens(host, response)
+        self.host = host
+        self.context_tokens = cached + (response.get('prompt_eval_count') or 0) + (response.get('eval_count') or 0)
+
+
+_current_session: contextvars.ContextVar[Optional[ChatSession]] = contextvars.ContextVar('current_session', default=None)
+
+
+@contextmanager
+def chat_session(session: Optional[ChatSession]) -> Iterator[Optional[ChatSession]]:
+    """Send the chat calls made inside the block, including tasks it spawns, as turns of a session; None opts out."""
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
+
+
+def current_session() -> Optional[ChatSession]:
+    return _current_session.get()
+
+
+def _messages(prompt: str, session: Optional[ChatSession]) -> List[Dict[str, str]]:
+    return session.messages(prompt) if session is not None else [{'role': 'user', 'content': prompt}]
+
+
+def _transcript(messages: List[Dict[str, str]]) -> str:
+    """Cache and cassette key text for a chat; a lone user message keys on its prompt alone."""
+    if len(messages) == 1:
+        return messages[0]['content']
+    return '\n'.join(f"{message['role']}: {message['content']}" for message in messages)
+
+
+def _choose_host(model_name: str, prompt: str, failed_hosts: set, session: Optional[ChatSession]) -> str:
+    """The session's replica while it is healthy and has not failed this call, else the router's choice."""
+    if session is not None and session.host is not None and session.host not in failed_hosts:
+        breaker = _router.breakers.get(session.host)
+        if breaker is not None and breaker.available():
+            return session.host
+    return _router.choose(model_name, prompt, exclude=failed_hosts)
+
+
+def _keep_alive(keep_alive: Optional[str] = None) -> Optional[Any]:
+    """keep_alive as Ollama expects it: numbers in seconds, anything else as a duration string."""
+    value = keep_alive or OLLAMA_KEEP_ALIVE
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def split_profile(profile: Optional[Dict[str, Any]]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """Split a generation profile into its model and the Ollama options (temperature, num_predict, num_ctx, stop, ...)."""
+    profile = dict(profile or {})
+    return profile.pop('model', None), profile
+
+
+def _request_options(options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """DEFAULT_OPTIONS overridden by the per-call options."""
+    return {**DEFAULT_OPTIONS, **options} if options else DEFAULT_OPTIONS
+
+
+# Hosts that answered a JSON schema format with 400, as Ollama servers before 0.5 do; they get plain JSON mode
+_schema_rejecting_hosts: Set[str] = set()
+
+
+def _wire_format(host: str, format: Optional[Dict[str, Any]]) -> Any:
+    """The format parameter to send to a host: the JSON schema, or 'json' if the host rejected schemas before."""
+    if not format:
+        return ''
+    return 'json' if host in _schema_rejecting_hosts else format
+
+
+def _schema_rejected(host: str, sent_format: Any, error: BaseException) -> bool:
+    """Whether a host rejected the JSON schema it was sent; if so it is sent plain JSON mode from now on."""
+    if not isinstance(sent_format, dict):
+        return False
+    if not (isinstance(error, ollama.ResponseError) and error.status_code == 400):
+        return False
+    if host not in _schema_rejecting_hosts:
+        logger.warning(f"{host} rejected a JSON schema format ({str(error)}); falling back to plain JSON mode (schemas need Ollama 0.5+)")
+        _schema_rejecting_hosts.add(host)
+    return True
+
+
+def _request_key(
+    model_name: str,
+    prompt: str,
+    format: Optional[Dict[str, Any]] = None,
+    options: Optional[Dict[str, Any]] = None
+) -> str:
+    """Response cache and cassette key for a chat request; a JSON schema counts as one of its options."""
+    options = _request_options(options)
+    if format:
+        options = {**options, 'format': format}
+    return ResponseCache.make_key(model_name, options, prompt)
+
+
+def _uses_response_cache(bypass_cache: bool) -> bool:
+    """Whether a call may be served from and stored in the response cache; calls being recorded always reach Ollama."""
+    return _response_cache is not None and not bypass_cache and not (_cassette is not None and _cassette.recording)
+
+
+async def call_ollama(
+    prompt: str,
+    model: Optional[str] = None,
+    bypass_cache: bool = False,
+    format: Optional[Dict[str, Any]] = None,
+    options: Optional[Dict[str, Any]] = None
+) -> str:
+    """Call Ollama API with the given prompt and model.
+
+    Responses are served from the response cache when an identical
+    (model, options, prompt) was answered before, unless bypass_cache is set.
+    With a cassette configured, calls are recorded to it or replayed from it; while
+    recording, the response cache is skipped so every call ends up in the cassette.
+    A JSON schema passed as format constrains the model's output to match it. Ollama
+    servers before 0.5 reject schemas with a 400; those hosts are retried, and from
+    then on sent, plain JSON mode, so callers must still check the answer's fields.
+    Options such as num_predict, num_ctx or stop override DEFAULT_OPTIONS for this call.
+    Each attempt is routed to a replica by the host router; retries avoid hosts that already failed.
+    Inside a chat_session block the prompt is sent as the session's next turn.
+    """
+    session = _current_session.get()
+    if session is None:
+        return await _call_ollama(prompt, model, bypass_cache, format, options, None)
+    async with session.lock:
+        response = await _call_ollama(prompt, model, bypass_cache, format, options, session)
+        session.add_turn(prompt, response)
+        return response
+
+
+async def _call_ollama(
+    prompt: str,
+    model: Optional[str],
+    bypass_cache: bool,
+    format: Optional[Dict[str, Any]],
+    options: Optional[Dict[str, Any]],
+    session: Optional[ChatSession]
+) -> str:
+    model_name = model or OLLAMA_MODEL
+    messages = _messages(prompt, session)
+    key_prompt = _transcript(messages)
+    prompt_chars = len(key_prompt)
+
+    logger.info(f"Making Ollama API call with model {model_name}")
     logger.debug(f"Prompt length: {len(prompt)} characters")
     logger.debug(f"Prompt preview: {prompt[:200]}...")
-    
+
+    cache_key = None
+    if _uses_response_cache(bypass_cache):
+        cache_key = _request_key(model_name, key_prompt, format, options)
+        cached = await _response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Serving Ollama response from cache (length: {len(cached)} characters)")
+            record_ollama_call(model_name, 0.0, prompt_chars=prompt_chars, cache_hit=True)
+            return cached
+
+    start_time = time.time()
+    if _cassette is not None and _cassette.replaying:
+        entry = await _cassette.replay(_request_key(model_name, key_prompt, format, options))
+        logger.info(f"Replaying Ollama response from cassette (length: {len(entry['c'])} characters)")
+        record_ollama_call(model_name, (time.time() - start_time) * 1000, prompt_chars=prompt_chars, response=entry['s'])
+        return entry['c']
+
+    _router.schedule_refresh()
+    failed_hosts = set()
+    host = None
+    queue_ms = 0.0
+    retries = 0
     try:
-        client = ollama.AsyncClient(host=host)
-        
-        logger.debug("Sending chat request to Ollama")
-        response = await client.chat(
-            model=model_name,
-            messages=[
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ],
-            options={
-                'temperature': 0.1,
-                'num_predict': 2000
-            }
-        )
-        
+        while True:
+            attempt_start = time.time()
+            host = _choose_host(model_name, prompt, failed_hosts, session)
+            logger.info(f"Sending Ollama API call to {host}")
+            try:
+                response, queue_ms, host, hedged = await _hedged_chat(host, model_name, messages, format, options, _retry_policy.attempt_timeout())
+                break
+            except Exception as error:
+                error = classify_error(error)
+                delay = _retry_policy.backoff(retries, error)
+                if delay is None:
+                    raise error
+                failed_hosts.add(host)
+                retries += 1
+                logger.warning(f"Ollama call failed ({str(error)}), retry {retries}/{_retry_policy.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
         response_content = response['message']['content']
         logger.info(f"Received response from Ollama (length: {len(response_content)} characters)")
         logger.debug(f"Response content: {response_content}")
-        
+        wall_ms = (time.time() - start_time) * 1000
+        record_ollama_call(
+            model_name, wall_ms, queue_ms, prompt_chars, response, retries=retries, hedged=hedged, host=host,
+            prompt_tokens_cached=session.cached_tokens(host, response) if session is not None else None
+        )
+        if _hedge_policy is not None:
+            _hedge_policy.record(model_name, (time.time() - attempt_start) * 1000)
+
+        if _cassette is not None and _cassette.recording:
+            _cassette.record(_request_key(model_name, key_prompt, format, options), model_name, response_content, wall_ms, response)
+
+        if cache_key is not None:
+            await _response_cache.set(cache_key, response_content)
+        if session is not None:
+            session.record_usage(host, response)
+
         return response_content
-        
+
     except Exception as error:
+        record_ollama_call(model_name, (time.time() - start_time) * 1000, queue_ms, prompt_chars, retries=retries, error=str(error), host=host)
         logger.error(f"Ollama API call failed: {str(error)}")
         print(f'Ollama API Error: {error}')
-        raise Exception(f'Ollama API call failed: {str(error)}')
+        raise classify_error(error)
+
+
+async def _chat(
+    host: str,
+    model_name: str,
+    messages: List[Dict[str, str]],
+    format: Optional[Dict[str, Any]],
+    options: Optional[Dict[str, Any]],
+    timeout: Optional[float]
+) -> Tuple[Dict[str, Any], float, str]:
+    """One chat request on a pooled connection; returns the response, the ms spent queueing for a slot and the host."""
+    with _router.track(host, model_name):
+        async with _client_pool.acquire(host) as (client, queue_ms):
+            logger.debug(f"Sending chat request to {host}")
+            while True:
+                wire_format = _wire_format(host, format)
+                try:
+                    response = await asyncio.wait_for(client.chat(
+                        model=model_name,
+                        messages=messages,
+                        options=_request_options(options),
+                        format=wire_format,
+                        keep_alive=_keep_alive()
+                    ), timeout)
+                    break
+                except ollama.ResponseError as error:
+                    # A host that rejects the schema is asked once more in plain JSON mode
+                    if not _schema_rejected(host, wire_format, error):
+                        raise
+    return response, queue_ms, host
+
+
+async def _hedged_chat(
+    host: str,
+    model_name: str,
+    messages: List[Dict[str, str]],
+    format: Optional[Dict[str, Any]],
+    options: Optional[Dict[str, Any]],
+    timeout: Optional[float]
+) -> Tuple[Dict[str, Any], float, str, bool]:
+    """Run a chat request, racing a second copy against it if it outlives the hedge delay.
+
+    Returns the first successful response, its queue time, the host that served it and
+    whether a hedge was sent; the slower request is cancelled.
+    """
+    delay_ms = _hedge_policy.delay_ms(model_name) if _hedge_policy is not None else None
+    if delay_ms is None or (timeout is not None and delay_ms / 1000 >= timeout):
+        response, queue_ms, host = await _chat(host, model_name, messages, format, options, timeout)
+        return response, queue_ms, host, False
+
+    primary = asyncio.ensure_future(_chat(host, model_name, messages, format, options, timeout))
+    pending = {primary}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay_ms / 1000)
+        if done:
+            response, queue_ms, host = primary.result()
+            return response, queue_ms, host, False
+
+        # Prefer another replica; with a single host the hedge still gets past a stalled parallel slot
+        hedge_host = _router.choose(model_name, exclude={host})
+        logger.info(f"Ollama call to {host} exceeded {delay_ms:.0f}ms, sending hedged request to {hedge_host}")
+        hedge_timeout = None if timeout is None else timeout - delay_ms / 1000
+        pending.add(asyncio.ensure_future(_chat(hedge_host, model_name, messages, format, options, hedge_timeout)))
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    response, queue_ms, host = task.result()
+                    return response, queue_ms, host, True
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def stream_ollama(
+    prompt: str,
+    model: Optional[str] = None,
+    bypass_cache: bool = False,
+    format: Optional[Dict[str, Any]] = None,
+    options: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """Stream the model's response to a prompt as it is decoded, one content chunk at a time.
+
+    A cached response is yielded as a single chunk; a completed stream is stored in the cache.
+    Failures are retried, on another replica where possible, only until the first chunk has been yielded.
+    Inside a chat_session block the prompt is sent as the session's next turn.
+    """
+    session = _current_session.get()
+    if session is None:
+        async for chunk in _stream_ollama(prompt, model, bypass_cache, format, options, None):
+            yield chunk
+        return
+    async with session.lock:
+        chunks = []
+        async for chunk in _stream_ollama(prompt, model, bypass_cache, format, options, session):
+            chunks.append(chunk)
+            yield chunk
+        session.add_turn(prompt, ''.join(chunks))
+
+
+async def _stream_ollama(
+    prompt: str,
+    model: Optional[str],
+    bypass_cache: bool,
+    format: Optional[Dict[str, Any]],
+    options: Optional[Dict[str, Any]],
+    session: Optional[ChatSession]
+) -> AsyncIterator[str]:
+    model_name = model or OLLAMA_MODEL
+    messages = _messages(prompt, session)
+    key_prompt = _transcript(messages)
+    prompt_chars = len(key_prompt)
+
+    logger.info(f"Making streaming Ollama API call with model {model_name}")
+    logger.debug(f"Prompt length: {len(prompt)} characters")
+
+    cache_key = None
+    if _uses_response_cache(bypass_cache):
+        cache_key = _request_key(model_name, key_prompt, format, options)
+        cached = await _response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Serving Ollama response from cache (length: {len(cached)} characters)")
+            record_ollama_call(model_name, 0.0, prompt_chars=prompt_chars, cache_hit=True)
+            yield cached
+            return
+
+    chunks = []
+    final_part: Dict[str, Any] = {}
+    start_time = time.time()
+    if _cassette is not None and _cassette.replaying:
+        entry = _cassette.lookup(_request_key(model_name, key_prompt, format, options))
+        async for content in _cassette.replay_stream(entry):
+            yield content
+        logger.info(f"Replayed streamed Ollama response from cassette (length: {len(entry['c'])} characters)")
+        record_ollama_call(model_name, (time.time() - start_time) * 1000, prompt_chars=prompt_chars, response=entry['s'])
+        return
+
+    _router.schedule_refresh()
+    failed_hosts = set()
+    host = None
+    first_token_ms = None
+    queue_ms = 0.0
+    retries = 0
+    try:
+        while True:
+            host = _choose_host(model_name, prompt, failed_hosts, session)
+            wire_format = _wire_format(host, format)
+            logger.info(f"Sending streaming Ollama API call to {host}")
+            try:
+                with _router.track(host, model_name):
+                    async with _client_pool.acquire(host) as (client, queue_ms):
+                        stream = await client.chat(
+                            model=model_name,
+                            messages=messages,
+                            options=_request_options(options),
+                            format=wire_format,
+                            stream=True,
+                            keep_alive=_keep_alive()
+                        )
+                        # The timeout applies to the wait for each chunk, so a stalled stream is cut off
+                        while True:
+                            try:
+                                part = await asyncio.wait_for(stream.__anext__(), _retry_policy.attempt_timeout())
+                            except StopAsyncIteration:
+                                break
+                            content = part['message']['content']
+                            if content:
+                                if first_token_ms is None:
+                                    first_token_ms = (time.time() - start_time) * 1000
+                                chunks.append(content)
+                                yield content
+                            if part.get('done'):
+                                final_part = part
+                    break
+            except Exception as error:
+                if not chunks and _schema_rejected(host, wire_format, error):
+                    # Same host again, now in plain JSON mode; this does not count as a retry
+                    continue
+                error = classify_error(error)
+                delay = None if chunks else _retry_policy.backoff(retries, error)
+                if delay is None:
+                    raise error
+                failed_hosts.add(host)
+                retries += 1
+                logger.warning(f"Streaming Ollama call failed ({str(error)}), retry {retries}/{_retry_policy.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+    except Exception as error:
+        record_ollama_call(model_name, (time.time() - start_time) * 1000, queue_ms, prompt_chars, retries=retries, error=str(error), host=host)
+        logger.error(f"Streaming Ollama API call failed: {str(error)}")
+        raise classify_error(error)
+
+    response_content = ''.join(chunks)
+    logger.info(f"Finished streaming response from Ollama (length: {len(response_content)} characters)")
+    wall_ms = (time.time() - start_time) * 1000
+    record_ollama_call(
+        model_name, wall_ms, queue_ms, prompt_chars, final_part, retries=retries, host=host,
+        prompt_tokens_cached=session.cached_tokens(host, final_part) if session is not None else None
+    )
+    if _cassette is not None and _cassette.recording:
+        _cassette.record(_request_key(model_name, key_prompt, format, options), model_name, response_content, wall_ms, final_part, first_token_ms)
+    if cache_key is not None:
+        await _response_cache.set(cache_key, response_content)
+    if session is not None:
+        session.record_usage(host, final_part)
+
+
+async def iter_embeddings(
+    texts: List[str],
+    model: Optional[str] = None,
+    batch_size: int = OLLAMA_EMBED_BATCH_SIZE
+) -> AsyncIterator[List[List[float]]]:
+    """Embed texts in batches of batch_size with Ollama's /api/embed endpoint, yielding each batch's vectors.
+
+    Batches are sent one after another, so a caller that keeps each batch as it
+    arrives loses only the failed batch when a request fails.
+    """
+    model_name = model or OLLAMA_EMBED_MODEL
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        host = _router.choose(model_name)
+        logger.info(f"Embedding texts {start + 1}-{start + len(batch)} of {len(texts)} on {host} with model {model_name}")
+        try:
+            client = _client_pool.get_client(host)
+            with _router.track(host, model_name):
+                response = await client.embed(model=model_name, input=batch, keep_alive=_keep_alive())
+            _client_pool.record_connections(host)
+        except Exception as error:
+            logger.error(f"Ollama embedding call failed: {str(error)}")
+            raise Exception(f'Ollama embedding call failed: {str(error)}')
+        yield response['embeddings']
+
+
+async def embed_texts(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    """Compute embeddings for each text, in batched /api/embed requests."""
+    vectors: List[List[float]] = []
+    async for batch in iter_embeddings(texts, model):
+        vectors.extend(batch)
+    return vectors
+
+
+async def preload_model(
+    model: Optional[str] = None,
+    host: Optional[str] = None,
+    keep_alive: Optional[str] = None,
+    embedding: bool = False
+) -> float:
+    """Load a model into memory on a host, or extend its keep_alive if it is already loaded; returns the load time in ms.
+
+    Ollama loads a model without generating anything when sent an empty prompt.
+    """
+    model_name = model or (OLLAMA_EMBED_MODEL if embedding else OLLAMA_MODEL)
+    host = host or OLLAMA_HOST
+    logger.debug(f"Preloading {model_name} on {host} (keep_alive={_keep_alive(keep_alive)})")
+
+    try:
+        client = _client_pool.get_client(host)
+        if embedding:
+            start_time = time.time()
+            await client.embeddings(model=model_name, prompt='', keep_alive=_keep_alive(keep_alive))
+            # The embeddings endpoint reports no timings; the wall time is an upper bound on the load
+            load_ms = (time.time() - start_time) * 1000
+        else:
+            response = await client.generate(model=model_name, prompt='', keep_alive=_keep_alive(keep_alive))
+            load_ms = (response.get('load_duration') or 0) / 1e6
+        _client_pool.record_connections(host)
+    except Exception as error:
+        raise classify_error(error, f'Preloading {model_name} on {host} failed')
+
+    record_model_load(model_name, host, load_ms)
+    return load_ms
 
 
 async def list_ollama_models() -> List[str]:
     """List available Ollama models."""
-    host = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+    host = OLLAMA_HOST
     logger.info(f"Listing available Ollama models from {host}")
-    
+
     try:
-        client = ollama.AsyncClient(host=host)
+        client = _client_pool.get_client(host)
         models = await client.list()
+        _client_pool.record_connections(host)
         model_names = [model['name'] for model in models['models']]
         logger.info(f"Found {len(model_names)} available models: {model_names}")
         return model_names
@@ -66,16 +837,17 @@ async def list_ollama_models() -> List[str]:
         raise Exception(f'Failed to list Ollama models: {str(error)}')
 
 
-async def check_ollama_connection() -> bool:
+async def check_ollama_connection(host: Optional[str] = None) -> bool:
     """Check if Ollama connection is working."""
-    host = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+    host = host or OLLAMA_HOST
     logger.info(f"Checking Ollama connection to {host}")
-    
+
     try:
-        client = ollama.AsyncClient(host=host)
+        client = _client_pool.get_client(host)
         await client.list()
+        _client_pool.record_connections(host)
         logger.info("Ollama connection successful")
         return True
     except Exception as error:
         logger.warning(f"Ollama connection failed: {str(error)}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,258 @@
+import re
+import json
+import logging
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+CODE_FENCE_PATTERN = re.compile(r'```[ \t]*[\w+-]*[ \t]*\n(.*?)(?:```|$)', re.DOTALL)
+# An uppercase statement keyword followed by SQL syntax, so prose such as "Select the top customers:" is not taken for SQL
+SQL_START_PATTERN = re.compile(
+    r'^\s*(WITH\s+(?:RECURSIVE\s+)?[\w"]+\s*(?:\([^)]*\)\s*)?AS\s*\('
+    r'|SELECT\s+(?:\*|DISTINCT\b|TOP\b|[\w"`(])'
+    r'|INSERT\s+INTO\b|UPDATE\s+[\w"]+\s+SET\b|DELETE\s+FROM\b'
+    r'|(?:CREATE|ALTER|DROP)\s+(?:OR\s+REPLACE\s+)?(?:TEMP(?:ORARY)?\s+)?(?:TABLE|VIEW|MATERIALIZED\s+VIEW|SCHEMA|INDEX|FUNCTION|PROCEDURE)\b'
+    r'|MERGE\s+INTO\b|UNLOAD\s*\(|COPY\s+[\w"]+)',
+    re.MULTILINE
+)
+CAMEL_BOUNDARY_PATTERN = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+
+
+class OutputParseError(ValueError):
+    """Raised when model output does not contain the expected structure."""
+
+
+class JSONStreamExtractor:
+    """Finds the first complete top-level JSON object in text that arrives in chunks.
+
+    Braces are matched while skipping over string literals, so prose or
+    commentary around the object, including braces inside it, is ignored.
+    feed() returns the parsed object as soon as its closing brace arrives;
+    finish() is called once the output is complete, so that an opening brace
+    in prose that never closed does not hide the object after it.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.result: Optional[Dict[str, Any]] = None
+        self._position = 0
+        self._start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """Add more output; returns the object once it is complete, else None."""
+        if self.done:
+            return self.result
+        self.text += chunk
+
+        while self._position < len(self.text):
+            char = self.text[self._position]
+            self._position += 1
+
+            if self._start is None:
+                if char == '{':
+                    self._start = self._position - 1
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self.text[self._start:self._position]
+                    try:
+                        value = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        # Not JSON after all (e.g. a brace in prose); resume scanning just past its opening brace
+                        logger.debug(f"Skipping unparseable braced text: {candidate[:80]}")
+                        self._position = self._start + 1
+                        self._start = None
+                        continue
+                    if isinstance(value, dict):
+                        self.result = value
+                        return value
+                    self._start = None
+
+        return None
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """Treat any still-open brace as prose, rescan just past it, and return the object if one is found."""
+        while self.result is None and self._start is not None:
+            logger.debug(f"Skipping unclosed brace at offset {self._start}")
+            self._position = self._start + 1
+            self._start = None
+            self._in_string = False
+            self._escaped = False
+            self.feed('')
+        return self.result
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """The first complete JSON object in the text."""
+    extractor = JSONStreamExtractor()
+    extractor.feed(text)
+    result = extractor.finish()
+    if result is None:
+        raise OutputParseError("No JSON object found in response")
+    return result
+
+
+def to_snake_case(key: str) -> str:
+    return CAMEL_BOUNDARY_PATTERN.sub('_', key).replace('-', '_').lower()
+
+
+def normalize_keys(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Rename top-level camelCase keys to snake_case; nested keys such as table names are left alone."""
+    return {to_snake_case(key): value for key, value in data.items()}
+
+
+def _coerce(value: Any, types: Tuple[type, ...]) -> Tuple[bool, Any]:
+    """Whether a value fits one of the types, and the value converted where a numeric string stands in for a number."""
+    if isinstance(value, bool):
+        return bool in types, value
+    if isinstance(value, types):
+        return True, value
+    if isinstance(value, int) and float in types:
+        return True, value
+    if isinstance(value, str) and (int in types or float in types):
+        try:
+            number = float(value.strip().rstrip('%'))
+        except ValueError:
+            return False, value
+        return True, int(number) if int in types and number.is_integer() else number
+    return False, value
+
+
+def validate_fields(data: Dict[str, Any], fields: Dict[str, Union[type, Tuple[type, ...]]]) -> Dict[str, Any]:
+    """Check that every field is present with the expected type, coercing numeric strings where a number is expected."""
+    missing_keys = [key for key in fields if key not in data]
+    if missing_keys:
+        raise OutputParseError(f"Missing required keys in response: {missing_keys}")
+
+    problems = []
+    for key, expected in fields.items():
+        types = expected if isinstance(expected, tuple) else (expected,)
+        valid, data[key] = _coerce(data[key], types)
+        if not valid:
+            problems.append(f"{key} should be {'/'.join(t.__name__ for t in types)}, got {type(data[key]).__name__}")
+
+    if problems:
+        raise OutputParseError(f"Invalid fields in response: {problems}")
+    return data
+
+
+def parse_json_response(text: str, fields: Dict[str, Union[type, Tuple[type, ...]]]) -> Dict[str, Any]:
+    """Extract, normalize and validate the JSON object in a model response."""
+    return validate_fields(normalize_keys(extract_json_object(text)), fields)
+
+
+def _split_statements(sql: str) -> List[str]:
+    """Split on semicolons that are outside quotes and comments; each statement keeps its semicolon."""
+    statements = []
+    start = 0
+    index = 0
+    quote = None
+    while index < len(sql):
+        char = sql[index]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif sql.startswith('--', index):
+            newline = sql.find('\n', index)
+            index = len(sql) if newline == -1 else newline
+            continue
+        elif sql.startswith('/*', index):
+            end = sql.find('*/', index + 2)
+            index = len(sql) if end == -1 else end + 2
+            continue
+        elif char == ';':
+            statements.append(sql[start:index + 1])
+            start = index + 1
+        index += 1
+
+    if sql[start:].strip():
+        statements.append(sql[start:])
+    return [statement.strip() for statement in statements if statement.strip().rstrip(';').strip()]
+
+
+def _sql_section(text: str) -> Tuple[str, Optional[re.Match]]:
+    """The part of a response that holds the SQL, and where in it the first statement starts, if anywhere."""
+    fences = [match.group(1) for match in CODE_FENCE_PATTERN.finditer(text)]
+    sql = next((fence for fence in fences if SQL_START_PATTERN.search(fence)), fences[0] if fences else text)
+    return sql, SQL_START_PATTERN.search(sql)
+
+
+def extract_sql(text: str) -> str:
+    """The first SQL statement in a response, unwrapping markdown code fences and skipping leading prose.
+
+    A fenced block that starts a statement is preferred over any other fence or
+    the surrounding prose.
+    """
+    sql, start = _sql_section(text)
+    if start:
+        sql = sql[start.start(1):]
+
+    statements = _split_statements(sql)
+    return statements[0] if statements else text.strip()
+
+
+class SQLStreamExtractor:
+    """Passes on only the SQL statement that extract_sql will return, as the response streams in.
+
+    Prose and code fences are held back. feed() returns the text the statement
+    has grown by; finish() returns whatever extract_sql adds on the complete
+    response, so the pieces join up to its result. If a later chunk changes
+    which statement is picked (e.g. a fenced block after SQL in prose), nothing
+    more is emitted, since text already passed on cannot be taken back.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.emitted = ''
+        self._diverged = False
+
+    def _advance(self, sql: str) -> str:
+        if self._diverged:
+            return ''
+        if not sql.startswith(self.emitted):
+            logger.debug("Streamed SQL no longer matches the extracted statement; holding back the rest")
+            self._diverged = True
+            return ''
+        delta = sql[len(self.emitted):]
+        self.emitted = sql
+        return delta
+
+    def feed(self, chunk: str) -> str:
+        """Add more output; returns the newly available part of the SQL statement, possibly ''."""
+        self.text += chunk
+        sql, start = _sql_section(self.text)
+        if not start:
+            return ''
+        statements = _split_statements(sql[start.start(1):])
+        if not statements:
+            return ''
+        # A trailing backtick may be the start of the closing fence
+        return self._advance(statements[0].rstrip('`').rstrip())
+
+    def finish(self) -> str:
+        """The rest of extract_sql's result on the complete output."""
+        return self._advance(extract_sql(self.text))
@@ -0,0 +1,118 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+from .metrics import stage_scope
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+
+class PipelineStageError(Exception):
+    """Raised when a fatal pipeline stage fails."""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+
+class PipelineStage:
+    """A named pipeline step together with the stages whose results it needs."""
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        depends_on: Optional[List[str]] = None,
+        fatal: bool = True,
+        description: Optional[str] = None
+    ):
+        self.name = name
+        self.run = run
+        self.depends_on = depends_on or []
+        self.fatal = fatal
+        self.description = description or name
+
+
+class Pipeline:
+    """Dependency graph of stages; stages whose dependencies are satisfied run concurrently."""
+
+    def __init__(self, stages: List[PipelineStage]):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = self._topological_order(stages)
+        logger.debug(f"Pipeline initialized with stage order: {self.order}")
+
+    def _topological_order(self, stages: List[PipelineStage]) -> List[str]:
+        """Order stages so every stage comes after its dependencies."""
+        order = []
+        visiting = set()
+
+        def visit(name: str) -> None:
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a dependency cycle at stage: {name}")
+            if name not in self.stages:
+                raise ValueError(f"Unknown pipeline stage: {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for stage in stages:
+            visit(stage.name)
+        return order
+
+    async def run(self, result: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run every stage, storing each stage's output and timing in result['steps'].
+
+        Stages are called with the result dict and a per-request context dict
+        for options that should not appear in the result.
+
+        A fatal stage that fails cancels every stage still running or waiting and
+        raises PipelineStageError.
+        """
+        context = context if context is not None else {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: PipelineStage) -> Dict[str, Any]:
+            if stage.depends_on:
+                await asyncio.gather(*[tasks[dependency] for dependency in stage.depends_on])
+
+            logger.debug(f"Running pipeline stage: {stage.name}")
+            stage_start = time.time()
+            try:
+                with stage_scope(stage.name):
+                    stage_result = await stage.run(result, context)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                stage_result = {'success': False, 'error': str(error)}
+
+            stage_result['duration_ms'] = int((time.time() - stage_start) * 1000)
+            result['steps'][stage.name] = stage_result
+            logger.debug(f"Pipeline stage {stage.name} finished in {stage_result['duration_ms']}ms")
+
+            if stage.fatal and not stage_result.get('success', True):
+                raise PipelineStageError(stage.name, f"{stage.description} failed: {stage_result.get('error')}")
+
+            return stage_result
+
+        for name in self.order:
+            tasks[name] = asyncio.create_task(run_stage(self.stages[name]))
+
+        try:
+            done, _ = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+            errors = [task.exception() for task in done if task.exception() is not None]
+            if errors:
+                raise errors[0]
+        finally:
+            pending = [task for task in tasks.values() if not task.done()]
+            if pending:
+                logger.warning(f"Cancelling {len(pending)} pending pipeline stages")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        return result
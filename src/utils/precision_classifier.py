@@ -0,0 +1,177 @@
+import re
+import time
+import logging
+from typing import Dict, Any, List, Set, Tuple
+from .bm25_index import tokenize
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    'a', 'an', 'the', 'of', 'in', 'on', 'at', 'to', 'for', 'from', 'with', 'by', 'per', 'and', 'or', 'but', 'not',
+    'no', 'is', 'are', 'was', 'were', 'be', 'been', 'has', 'have', 'had', 'do', 'does', 'did', 'that', 'which',
+    'who', 'whose', 'what', 'where', 'when', 'how', 'many', 'much', 'me', 'my', 'our', 'we', 'i', 'you', 'all',
+    'each', 'every', 'any', 'than', 'as', 'into', 'their', 'there', 'this', 'these', 'those', 'it', 'its', 'still'
+}
+
+# Words that state what to compute rather than what data to use
+INTENT_WORDS = {
+    'show', 'list', 'get', 'find', 'give', 'return', 'select', 'display', 'count', 'number', 'sum', 'total',
+    'average', 'avg', 'mean', 'median', 'min', 'minimum', 'max', 'maximum', 'top', 'bottom', 'first', 'last',
+    'group', 'grouped', 'order', 'ordered', 'sort', 'sorted', 'rank', 'distinct', 'unique', 'between', 'before',
+    'after', 'since', 'until', 'during', 'over', 'under', 'above', 'below', 'greater', 'less', 'more', 'fewer',
+    'equal', 'least', 'most', 'only', 'never', 'without', 'ascending', 'descending', 'asc', 'desc', 'limit'
+}
+
+TIME_WORDS = {
+    'day', 'days', 'week', 'weeks', 'month', 'months', 'quarter', 'quarters', 'year', 'years', 'daily', 'weekly',
+    'monthly', 'quarterly', 'yearly', 'annual', 'today', 'yesterday', 'ytd', 'mtd', 'q1', 'q2', 'q3', 'q4',
+    'january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+    'november', 'december', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec'
+}
+
+# Relative or subjective terms that need a threshold or definition the question does not give
+VAGUE_WORDS = {
+    'stuff', 'thing', 'things', 'something', 'anything', 'various', 'etc', 'interesting', 'important', 'relevant',
+    'good', 'bad', 'well', 'poor', 'high', 'low', 'big', 'small', 'large', 'popular', 'best', 'worst', 'recent',
+    'recently', 'lately', 'soon', 'often', 'usually', 'typical', 'normal', 'unusual', 'weird', 'some', 'several'
+}
+
+KNOWN_WORDS = STOPWORDS | INTENT_WORDS | TIME_WORDS | VAGUE_WORDS
+
+EXPLICIT_TIME_PATTERN = re.compile(
+    r'\b(?:(?:19|20)\d{2}(?:-\d{2}(?:-\d{2})?)?'
+    r'|(?:last|past|previous|next)\s+(?:\d+\s+)?(?:day|week|month|quarter|year)s?'
+    r'|this\s+(?:day|week|month|quarter|year)'
+    r'|today|yesterday|ytd|mtd|q[1-4])\b',
+    re.IGNORECASE
+)
+NUMBER_PATTERN = re.compile(r'\b\d+(?:\.\d+)?%?\b')
+
+
+def _stem(word: str) -> str:
+    """Crude plural folding so 'customers' matches the 'customer' in 'customer_id'."""
+    if len(word) > 3 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def _phrase(words: List[str]) -> str:
+    return ' ' + ' '.join(_stem(word) for word in words) + ' '
+
+
+class PrecisionClassifier:
+    """Decides locally whether a question is precise enough to skip LLM input refinement.
+
+    A question counts as precise when it names at least min_tables catalog
+    tables and min_columns of their columns, leaves at most max_unknown_terms
+    content words unexplained by the catalog, uses no vague terms without a
+    number to anchor them, has a reasonable length, and states any time range
+    explicitly. Everything is set lookups over the catalog vocabulary.
+    """
+
+    def __init__(
+        self,
+        table_metadata: Dict[str, Any] = None,
+        min_tables: int = 1,
+        min_columns: int = 1,
+        max_unknown_terms: int = 1,
+        min_words: int = 4,
+        max_words: int = 40
+    ):
+        self.min_tables = min_tables
+        self.min_columns = min_columns
+        self.max_unknown_terms = max_unknown_terms
+        self.min_words = min_words
+        self.max_words = max_words
+        self._table_phrases: Dict[str, str] = {}
+        self._column_phrases: Dict[str, Dict[str, str]] = {}
+        self._vocabulary: Set[str] = set()
+        for table_name, metadata in (table_metadata or {}).items():
+            self.add_table(table_name, metadata)
+
+    def add_table(self, table_name: str, metadata: Dict[str, Any]) -> None:
+        """Add (or replace) a table's names and descriptions in the catalog vocabulary."""
+        self._table_phrases[table_name] = _phrase(table_name.lower().split('_'))
+        self._column_phrases[table_name] = {}
+        texts = [table_name, metadata.get('description', '')]
+        for column in metadata.get('columns', []):
+            name = column['name'] if isinstance(column, dict) else str(column)
+            self._column_phrases[table_name][_phrase(name.lower().split('_'))] = name
+            texts.extend([name, column.get('description', '') if isinstance(column, dict) else ''])
+        self._vocabulary.update(_stem(token) for text in texts for token in tokenize(text))
+
+    def _mentions(self, text: str) -> Tuple[List[str], List[str]]:
+        """Catalog tables and columns a text names."""
+        phrase = _phrase(tokenize(text))
+        tables = sorted(table for table, table_phrase in self._table_phrases.items() if table_phrase in phrase)
+        columns = sorted({
+            name
+            for phrases in self._column_phrases.values()
+            for column_phrase, name in phrases.items() if column_phrase in phrase
+        })
+        return tables, columns
+
+    def assess(self, question: str) -> Dict[str, Any]:
+        """Classify a question; returns whether it is precise, the reasons if not, and the features used."""
+        start_time = time.perf_counter()
+        words = re.findall(r'[a-z0-9_]+', question.lower())
+        tables, columns = self._mentions(question)
+        has_number = bool(NUMBER_PATTERN.search(question))
+        explicit_time = bool(EXPLICIT_TIME_PATTERN.search(question))
+        mentions_time = explicit_time or any(word in TIME_WORDS for word in words)
+        vague_terms = sorted({word for word in words if word in VAGUE_WORDS})
+        unknown_terms = sorted({
+            word for word in words
+            if '_' not in word and not word.isdigit() and word not in KNOWN_WORDS and _stem(word) not in self._vocabulary
+        })
+
+        reasons = []
+        if len(words) < self.min_words:
+            reasons.append('too short')
+        if len(words) > self.max_words:
+            reasons.append('too long')
+        if len(tables) < self.min_tables:
+            reasons.append('names no catalog table')
+        if len(columns) < self.min_columns:
+            reasons.append('names no catalog column')
+        if len(unknown_terms) > self.max_unknown_terms:
+            reasons.append(f"terms outside the catalog: {', '.join(unknown_terms)}")
+        if vague_terms and not has_number:
+            reasons.append(f"vague terms: {', '.join(vague_terms)}")
+        if mentions_time and not explicit_time:
+            reasons.append('time range not explicit')
+
+        logger.debug(f"Precision check of '{question}': {'precise' if not reasons else reasons}")
+        return {
+            'precise': not reasons,
+            'reasons': reasons,
+            'tables': tables,
+            'columns': columns,
+            'unknown_terms': unknown_terms,
+            'vague_terms': vague_terms,
+            'explicit_time': explicit_time,
+            'words': len(words),
+            'elapsed_ms': (time.perf_counter() - start_time) * 1000
+        }
+
+    def compare(self, original: str, refined: str) -> Dict[str, Any]:
+        """How far a refinement moved from the original question.
+
+        similarity is the share of the original's content words that the
+        refinement kept; new_tables and new_columns are the catalog entities the
+        refinement names that the original did not.
+        """
+        start_time = time.perf_counter()
+        original_terms = {_stem(word) for word in re.findall(r'[a-z0-9_]+', original.lower()) if word not in STOPWORDS}
+        refined_terms = {_stem(token) for token in tokenize(refined)}
+        original_tables, original_columns = self._mentions(original)
+        refined_tables, refined_columns = self._mentions(refined)
+        return {
+            'similarity': len(original_terms & refined_terms) / len(original_terms) if original_terms else 1.0,
+            'new_tables': sorted(set(refined_tables) - set(original_tables)),
+            'new_columns': sorted(set(refined_columns) - set(original_columns)),
+            'elapsed_ms': (time.perf_counter() - start_time) * 1000
+        }
@@ -0,0 +1,126 @@
+import string
+import logging
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# Takes the place of a catalog section in prompts sent as turns of a chat session whose system message lists the catalog
+SESSION_CATALOG_REFERENCE = "(listed in the system message)"
+
+# Prompt layouts: the static instructions and catalog first so servers can cache them across requests,
+# or the original order with the user's request near the top
+PREFIX_FIRST_LAYOUT = 'prefix_first'
+LEGACY_LAYOUT = 'legacy'
+PROMPT_LAYOUTS = (PREFIX_FIRST_LAYOUT, LEGACY_LAYOUT)
+
+
+class PromptTemplate:
+    """Prompt text with {slot} placeholders, parsed once and rendered by joining literal parts and slot values.
+
+    Uses str.format syntax, so literal braces are written as {{ and }}.
+    """
+
+    def __init__(self, template: str):
+        parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, _, _ in string.Formatter().parse(template):
+            parts.append((literal, field))
+        self._parts = self._merge(parts)
+
+    @staticmethod
+    def _merge(parts: List[Tuple[str, Optional[str]]]) -> List[Tuple[str, Optional[str]]]:
+        """Collapse adjacent literal-only parts into one."""
+        merged: List[Tuple[str, Optional[str]]] = []
+        for literal, field in parts:
+            if merged and merged[-1][1] is None:
+                merged[-1] = (merged[-1][0] + literal, field)
+            else:
+                merged.append((literal, field))
+        return merged
+
+    @property
+    def slots(self) -> List[str]:
+        """Names of the placeholders still to be filled."""
+        return [field for _, field in self._parts if field is not None]
+
+    def render(self, **values: Any) -> str:
+        """Fill every slot and return the prompt text."""
+        pieces = []
+        for literal, field in self._parts:
+            pieces.append(literal)
+            if field is not None:
+                pieces.append(str(values[field]))
+        return ''.join(pieces)
+
+    def partial(self, **values: Any) -> 'PromptTemplate':
+        """Return a template with the given slots filled in now, leaving the others open."""
+        parts = []
+        for literal, field in self._parts:
+            if field is not None and field in values:
+                parts.append((literal + str(values[field]), None))
+            else:
+                parts.append((literal, field))
+
+        template = PromptTemplate.__new__(PromptTemplate)
+        template._parts = self._merge(parts)
+        return template
+
+
+class VersionedPromptCache:
+    """Holds partially rendered templates keyed by name, valid only for the catalog version they were built from."""
+
+    def __init__(self):
+        self.version = 0
+        self._entries: Dict[str, Tuple[int, PromptTemplate]] = {}
+
+    def bump(self) -> None:
+        """Mark every cached rendering as stale after a catalog change."""
+        self.version += 1
+
+    def get(self, name: str) -> Optional[PromptTemplate]:
+        """Return the cached template if it was built for the current version."""
+        entry = self._entries.get(name)
+        if entry is None or entry[0] != self.version:
+            return None
+        return entry[1]
+
+    def set(self, name: str, template: PromptTemplate) -> PromptTemplate:
+        """Store a template for the current version and return it."""
+        self._entries[name] = (self.version, template)
+        return template
+
+
+class PromptLayout:
+    """A prompt split into a static prefix and a per-request suffix.
+
+    The prefix carries the instructions, catalog and examples, which are the
+    same for every request, so it renders to the same bytes each time and an
+    inference server's prompt cache can reuse it across requests. Slots named
+    in request_slots may only appear in the suffix. Renders like a
+    PromptTemplate, so either can be used where a prompt is built.
+    """
+
+    def __init__(self, prefix: str, suffix: str, request_slots: Iterable[str]):
+        self.prefix = PromptTemplate(prefix)
+        self.suffix = PromptTemplate(suffix)
+        self.request_slots = set(request_slots)
+        leaked = self.request_slots & set(self.prefix.slots)
+        if leaked:
+            raise ValueError(f"Per-request slots in the static prompt prefix: {sorted(leaked)}")
+
+    @property
+    def slots(self) -> List[str]:
+        """Names of the placeholders still to be filled."""
+        return self.prefix.slots + self.suffix.slots
+
+    def render(self, **values: Any) -> str:
+        """Fill every slot and return the prompt text, static prefix first."""
+        return self.prefix.render(**values) + self.suffix.render(**values)
+
+    def partial(self, **values: Any) -> 'PromptLayout':
+        """Return a layout with the given slots filled in now, leaving the others open."""
+        layout = PromptLayout.__new__(PromptLayout)
+        layout.prefix = self.prefix.partial(**values)
+        layout.suffix = self.suffix.partial(**values)
+        layout.request_slots = self.request_slots
+        return layout
@@ -0,0 +1,200 @@
+import time
+import random
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional, Iterator
+import httpx
+import ollama
+from .metrics import record_breaker_state
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: overload and transient server-side failures
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class OllamaError(Exception):
+    """Base class for failed Ollama calls; retryable tells whether another attempt may succeed."""
+    retryable = False
+
+
+class OllamaTimeoutError(OllamaError):
+    """The call did not finish within its per-attempt timeout."""
+    retryable = True
+
+
+class OllamaUnavailableError(OllamaError):
+    """The host could not be reached, dropped the connection, or reported overload or a server error."""
+    retryable = True
+
+
+class OllamaRequestError(OllamaError):
+    """The host rejected the request, e.g. an unknown model or a malformed request."""
+
+
+class DeadlineExceededError(OllamaError):
+    """The request's overall deadline ran out before the call could complete."""
+
+
+class CircuitOpenError(OllamaError):
+    """Every host's circuit breaker is open, so the call fails fast instead of waiting on a dead host."""
+
+
+def classify_error(error: BaseException, message: str = 'Ollama API call failed') -> OllamaError:
+    """Wrap a raw client error in the OllamaError subclass that says whether it is worth retrying."""
+    if isinstance(error, OllamaError):
+        return error
+
+    detail = str(error) or type(error).__name__
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)):
+        wrapped: OllamaError = OllamaTimeoutError(f'{message}: timed out ({detail})')
+    elif isinstance(error, httpx.TransportError):
+        wrapped = OllamaUnavailableError(f'{message}: {detail}')
+    elif isinstance(error, ollama.ResponseError):
+        if error.status_code in RETRYABLE_STATUS_CODES:
+            wrapped = OllamaUnavailableError(f'{message}: {detail}')
+        else:
+            wrapped = OllamaRequestError(f'{message}: {detail}')
+    else:
+        wrapped = OllamaError(f'{message}: {detail}')
+    wrapped.__cause__ = error
+    return wrapped
+
+
+class RetryPolicy:
+    """Per-attempt timeout and jittered exponential backoff between attempts."""
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.25, max_delay: float = 4.0, timeout: Optional[float] = 120.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+    def attempt_timeout(self) -> Optional[float]:
+        """Seconds allowed for the next attempt: the per-attempt timeout capped by the request deadline."""
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceededError('Ollama API call failed: request deadline exceeded')
+        if self.timeout is None:
+            return remaining
+        return self.timeout if remaining is None else min(self.timeout, remaining)
+
+    def backoff(self, retries: int, error: BaseException) -> Optional[float]:
+        """Seconds to wait before retry number retries + 1, or None if the error should be raised instead."""
+        if not getattr(error, 'retryable', False) or retries >= self.max_retries:
+            return None
+
+        # Full jitter keeps concurrent callers that failed together from retrying in lockstep
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retries)))
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """Per-host breaker: opens after consecutive failures, lets a trial through after reset_timeout, closes on success."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker for {self.host}: {self.state} -> {state}")
+        self.state = state
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+        record_breaker_state(self.host, state)
+
+    def available(self) -> bool:
+        """Whether a request may be sent to the host now; after reset_timeout one trial request is allowed."""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            return not self._trial_in_flight
+        return self.state == self.CLOSED
+
+    def begin(self) -> None:
+        """Note that a request was sent; in the half-open state it is the single trial."""
+        if self.state == self.HALF_OPEN:
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._trial_in_flight = False
+        self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._transition(self.OPEN)
+
+    def release(self) -> None:
+        """End a request that neither succeeded nor failed, e.g. a cancelled hedge."""
+        self._trial_in_flight = False
+
+
+class HedgePolicy:
+    """Sends a second, hedged request when a call runs longer than a percentile of recent latencies."""
+
+    def __init__(self, percentile: float = 95.0, min_samples: int = 20, window: int = 256, min_delay_ms: float = 50.0):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay_ms = min_delay_ms
+        self._latencies: Dict[str, deque] = {}
+
+    def record(self, model: str, wall_ms: float) -> None:
+        self._latencies.setdefault(model, deque(maxlen=self.window)).append(wall_ms)
+
+    def delay_ms(self, model: str) -> Optional[float]:
+        """How long to wait before hedging a call to the model, or None until enough latencies are known."""
+        samples = self._latencies.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return max(self.min_delay_ms, ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))])
+
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('deadline', default=None)
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]) -> Iterator[None]:
+    """Give everything run inside the block, including tasks it spawns, at most timeout seconds in total.
+
+    A nested scope can only shorten an enclosing deadline, never extend it.
+    """
+    if timeout is None:
+        yield
+        return
+
+    deadline = time.monotonic() + timeout
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current deadline, or None when no deadline is set."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
@@ -0,0 +1,208 @@
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """In-memory LRU cache with an optional time-to-live per entry."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, stored_at = entry
+        if self.ttl is not None and time.time() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entries beyond the size limit."""
+        self._entries[key] = (value, stored_at or time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheStore:
+    """On-disk cache tier backed by a single SQLite table.
+
+    Methods block on disk I/O; ResponseCache calls them from worker threads, so
+    a lock serializes access to the shared connection.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._connection.commit()
+        self._size = self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        logger.info(f"Opened on-disk response cache at {path} with {self._size} entries")
+
+    def get(self, key: str) -> Optional[tuple]:
+        """Return (value, stored_at) for a key, or None if missing or expired."""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: str) -> Optional[tuple]:
+        row = self._connection.execute(
+            'SELECT value, stored_at FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        value, stored_at = row
+        now = time.time()
+        if self.ttl is not None and now - stored_at > self.ttl:
+            self._connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._connection.commit()
+            self._size -= 1
+            return None
+
+        self._connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        self._connection.commit()
+        return value, stored_at
+
+    def set(self, key: str, value: str) -> None:
+        """Store a value, evicting the least recently accessed rows beyond the size limit."""
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key: str, value: str) -> None:
+        now = time.time()
+        # INSERT OR REPLACE reports one row either way, so check whether the key is new before counting it
+        exists = self._connection.execute('SELECT 1 FROM responses WHERE key = ?', (key,)).fetchone() is not None
+        self._connection.execute(
+            'INSERT OR REPLACE INTO responses (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, value, now, now)
+        )
+        if not exists:
+            self._size += 1
+
+        if self._size > self.max_entries:
+            self._connection.execute(
+                'DELETE FROM responses WHERE key IN '
+                '(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)',
+                (self._size - self.max_entries,)
+            )
+            self._size = self._connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        self._connection.commit()
+
+    def clear(self) -> None:
+        """Remove every row."""
+        with self._lock:
+            self._connection.execute('DELETE FROM responses')
+            self._connection.commit()
+            self._size = 0
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class ResponseCache:
+    """Content-addressed cache of model responses with an in-memory LRU tier and an optional SQLite tier.
+
+    The SQLite tier is read and written in a worker thread so disk I/O does not
+    stall other requests on the event loop.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        disk_path: Optional[str] = None,
+        disk_max_entries: int = 100000
+    ):
+        self.memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.disk = SQLiteCacheStore(disk_path, max_entries=disk_max_entries, ttl=ttl) if disk_path else None
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+        logger.info(f"ResponseCache initialized (max_entries={max_entries}, ttl={ttl}, disk_path={disk_path})")
+
+    @staticmethod
+    def make_key(model: str, options: Dict[str, Any], prompt: str) -> str:
+        """Build the cache key from the model, generation options and a hash of the prompt."""
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        material = json.dumps({'model': model, 'options': options, 'prompt': prompt_hash}, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look a key up in memory, then on disk, promoting disk hits into memory."""
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats['memory_hits'] += 1
+            return value
+
+        if self.disk is not None:
+            row = await asyncio.to_thread(self.disk.get, key)
+            if row is not None:
+                value, stored_at = row
+                self.memory.set(key, value, stored_at=stored_at)
+                self.stats['disk_hits'] += 1
+                return value
+
+        self.stats['misses'] += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        """Store a response in every tier."""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+        self.stats['stores'] += 1
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Report hit/miss counters and tier sizes."""
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        lookups = hits + self.stats['misses']
+        return {
+            **self.stats,
+            'hits': hits,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'memory_entries': len(self.memory),
+            'disk_entries': len(self.disk) if self.disk is not None else 0
+        }
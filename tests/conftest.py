@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from src.utils import ollama_client
+from src.tools.ollama_standin import OllamaStandIn, StandInConfig
+
+# Module state that configure_ollama and the configure_* helpers replace
+CLIENT_GLOBALS = (
+    'OLLAMA_HOSTS', 'OLLAMA_HOST', 'OLLAMA_MODEL', '_router', '_response_cache', '_cassette', '_retry_policy', '_hedge_policy'
+)
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    """Runs a scenario coroutine against in-process Ollama stand-ins, restoring the client's settings afterwards.
+
+    Call as standin(scenario, config=..., replicas=...); config may be a list with one
+    entry per replica. The scenario receives the started servers and the client is
+    pointed at all of them.
+    """
+    for name in CLIENT_GLOBALS:
+        monkeypatch.setattr(ollama_client, name, getattr(ollama_client, name))
+    monkeypatch.setattr(ollama_client, '_schema_rejecting_hosts', set())
+    ollama_client.configure_response_cache(None)
+
+    def run(scenario, config=None, replicas=1):
+        async def main():
+            configs = config if isinstance(config, list) else [config] * replicas
+            servers = [OllamaStandIn(entry or StandInConfig(latency_ms=0)) for entry in configs]
+            for server in servers:
+                await server.start()
+            ollama_client.configure_ollama(host=','.join(server.url for server in servers))
+            try:
+                return await scenario(*servers)
+            finally:
+                await ollama_client.get_router().stop_probing()
+                await ollama_client.get_client_pool().close()
+                for server in servers:
+                    await server.stop()
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def make_agent():
+    """Builds an AIAgent over the demo catalog in main.py, without model warm-up or background health probes."""
+    from main import EXAMPLE_QUERIES, TABLE_METADATA
+    from src.ai_agent import AIAgent
+
+    def build(**config):
+        return AIAgent({
+            'example_queries': [dict(example) for example in EXAMPLE_QUERIES],
+            'table_metadata': TABLE_METADATA,
+            'warmup': False,
+            'health_check_interval': 0,
+            'result_cache': False,
+            **config
+        })
+
+    return build
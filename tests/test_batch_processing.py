@@ -0,0 +1,28 @@
+import asyncio
+from src.ai_agent import AIAgent
+
+
+def run_batch(inputs):
+    agent = AIAgent({'warmup': False})
+    calls = []
+
+    async def process_query(user_input, bypass_cache=False):
+        calls.append(user_input)
+        return {'user_input': user_input, 'success': True}
+
+    agent.process_query = process_query
+    return asyncio.run(agent.process_queries(inputs)), calls
+
+
+def test_questions_differing_in_operators_run_separately():
+    batch, calls = run_batch(['count orders > 5', 'count orders < 5'])
+    assert sorted(calls) == ['count orders < 5', 'count orders > 5']
+    assert batch['unique'] == 2
+    assert [result['user_input'] for result in batch['results']] == ['count orders > 5', 'count orders < 5']
+
+
+def test_trivially_different_questions_share_a_run():
+    batch, calls = run_batch(['count orders > 5', 'Count  orders > 5?'])
+    assert len(calls) == 1
+    assert batch['unique'] == 1
+    assert batch['results'][1]['user_input'] == 'Count  orders > 5?'
@@ -0,0 +1,40 @@
+import pytest
+from src.utils.cassette import Cassette, CassetteMissError, RECORD, REPLAY
+from src.utils.ollama_client import call_ollama, configure_cassette, configure_response_cache, stream_ollama
+from src.utils.response_cache import ResponseCache
+
+PROMPTS = ['You are an expert Redshift SQL developer.\nTable: orders\nColumns: order_id\n', 'hello']
+
+
+async def record_and_replay(server, path, repeat_before_recording):
+    configure_response_cache(ResponseCache())
+    if repeat_before_recording:
+        await call_ollama(PROMPTS[0])
+    configure_cassette(Cassette(path, mode=RECORD))
+    recorded = [await call_ollama(prompt) for prompt in PROMPTS]
+    recorded.append(''.join([chunk async for chunk in stream_ollama(PROMPTS[0])]))
+
+    await server.stop()
+    configure_response_cache(None)
+    configure_cassette(Cassette(path, mode=REPLAY))
+    try:
+        replayed = [await call_ollama(prompt) for prompt in PROMPTS]
+        replayed.append(''.join([chunk async for chunk in stream_ollama(PROMPTS[0])]))
+        with pytest.raises(CassetteMissError):
+            await call_ollama('never recorded')
+    finally:
+        configure_cassette(None)
+    return recorded, replayed
+
+
+def test_recorded_calls_replay_without_a_server(standin, tmp_path):
+    path = str(tmp_path / 'calls.jsonl')
+    recorded, replayed = standin(lambda server: record_and_replay(server, path, False))
+    assert replayed == recorded
+    assert recorded[0].startswith('SELECT order_id')
+
+
+def test_recording_bypasses_the_response_cache(standin, tmp_path):
+    path = str(tmp_path / 'calls.jsonl')
+    recorded, replayed = standin(lambda server: record_and_replay(server, path, True))
+    assert replayed == recorded
@@ -0,0 +1,72 @@
+from src.tools.ollama_standin import StandInConfig
+from src.utils.ollama_client import ChatSession
+
+QUESTION = 'Show me total order amounts per customer'
+
+
+def test_turns_follow_the_system_message_and_earlier_turns():
+    session = ChatSession('catalog')
+    session.add_turn('first', 'answer')
+    assert session.messages('second') == [
+        {'role': 'system', 'content': 'catalog'},
+        {'role': 'user', 'content': 'first'},
+        {'role': 'assistant', 'content': 'answer'},
+        {'role': 'user', 'content': 'second'}
+    ]
+
+
+def test_cached_tokens_come_from_the_host_evaluating_less_than_it_held():
+    session = ChatSession('catalog')
+    session.record_usage('a', {'prompt_eval_count': 500, 'eval_count': 40})
+    assert session.host == 'a' and session.context_tokens == 540
+
+    # The host only evaluated the new message, so it reused the 540 tokens it held
+    assert session.cached_tokens('a', {'prompt_eval_count': 30}) == 540
+    session.record_usage('a', {'prompt_eval_count': 30, 'eval_count': 10})
+    assert session.context_tokens == 580
+
+    # A full re-evaluation, another host or a missing count is a miss
+    assert session.cached_tokens('a', {'prompt_eval_count': 700}) == 0
+    assert session.cached_tokens('b', {'prompt_eval_count': 30}) == 0
+    assert session.cached_tokens('a', {}) == 0
+
+
+def run_query(standin, make_agent, config, replicas=1, **agent_config):
+    agent = make_agent(refinement_fast_path=False, **agent_config)
+
+    async def scenario(*servers):
+        await agent.start()
+        try:
+            return await agent.process_query(QUESTION), servers
+        finally:
+            await agent.close()
+
+    return standin(scenario, config=config, replicas=replicas)
+
+
+def test_session_turns_stay_on_one_replica_and_reuse_its_prompt_cache(standin, make_agent):
+    result, servers = run_query(standin, make_agent, StandInConfig(latency_ms=0, prefix_cache_slots=2), replicas=2, chat_session=True)
+
+    assert result['success'], result.get('error')
+    calls = result['metrics']['calls']
+    assert result['chat_session']['turns'] == len(calls) == 4
+    assert {call['host'] for call in calls} == {result['chat_session']['host']}
+    # Beyond the start-up health probe each replica answers, only the session's replica served the turns
+    requests = sorted(server.stats['requests'] for server in servers)
+    assert requests[1] - requests[0] == 4
+    assert calls[0]['prompt_tokens_cached'] == 0
+    assert all(call['prompt_tokens_cached'] > 0 for call in calls[1:])
+
+
+def test_session_reports_no_cached_tokens_without_a_prompt_cache(standin, make_agent):
+    result, _ = run_query(standin, make_agent, StandInConfig(latency_ms=0), chat_session=True)
+
+    assert result['success'], result.get('error')
+    assert all(call['prompt_tokens_cached'] == 0 for call in result['metrics']['calls'])
+
+
+def test_sessions_are_off_by_default(standin, make_agent):
+    result, _ = run_query(standin, make_agent, StandInConfig(latency_ms=0, prefix_cache_slots=2))
+
+    assert 'chat_session' not in result
+    assert all(call['prompt_tokens_cached'] is None for call in result['metrics']['calls'])
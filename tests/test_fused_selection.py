@@ -0,0 +1,54 @@
+from src.tools.ollama_standin import StandInConfig
+
+QUESTION = 'Show me total order amounts per customer'
+
+
+def run_query(standin, make_agent, config=None):
+    agent = make_agent(mode='fused', refinement_fast_path=False)
+
+    async def scenario(server):
+        await agent.start()
+        try:
+            return await agent.process_query(QUESTION)
+        finally:
+            await agent.close()
+
+    return standin(scenario, config=config)
+
+
+def test_fused_mode_makes_one_selection_call_before_generation(standin, make_agent):
+    result = run_query(standin, make_agent)
+
+    assert result['success'], result.get('error')
+    assert [call['stage'] for call in result['metrics']['calls']] == ['fused_selection', 'query_generation']
+    assert not result['steps']['fused_selection']['fallback']
+    for stage in ('refinement', 'query_selection', 'table_selection'):
+        assert result['steps'][stage]['fused']
+    assert result['steps']['refinement']['refined'] != QUESTION
+    assert 'orders' in result['steps']['table_selection']['selected_tables']
+
+
+def test_unparseable_fused_answer_falls_back_to_the_staged_calls(standin, make_agent):
+    config = StandInConfig(latency_ms=0, responses={'prepare everything needed': 'I am not sure what you mean.'})
+    result = run_query(standin, make_agent, config=config)
+
+    assert result['success'], result.get('error')
+    fused = result['steps']['fused_selection']
+    assert fused['fallback'] and 'parse error' in fused['fused_error']
+    stages = [call['stage'] for call in result['metrics']['calls']]
+    assert stages[0] == 'fused_selection'
+    assert {'refinement', 'query_selection', 'table_selection', 'query_generation'} <= set(stages)
+    assert not result['steps']['table_selection'].get('fused')
+
+
+def test_fused_answer_naming_an_unknown_example_falls_back(standin, make_agent):
+    answer = (
+        '{"refinedRequest": "Sum order_amount per customer_id", "selectedQueryIndex": 99, "queryConfidence": 90,'
+        ' "selectedTables": ["orders"], "selectedColumns": {"orders": ["order_amount"]}, "tableConfidence": 90, "reasoning": "x"}'
+    )
+    config = StandInConfig(latency_ms=0, responses={'prepare everything needed': answer})
+    result = run_query(standin, make_agent, config=config)
+
+    assert result['success'], result.get('error')
+    assert result['steps']['fused_selection']['fallback']
+    assert 'table_selection' in [call['stage'] for call in result['metrics']['calls']]
@@ -0,0 +1,27 @@
+from src.utils.host_router import HostRouter
+from src.utils.resilience import OllamaUnavailableError
+
+
+def test_prefers_hosts_with_the_model_loaded():
+    router = HostRouter(['a', 'b'])
+    router._state['b']['loaded_models'].add('llama3')
+    assert router.choose('llama3') == 'b'
+
+
+def test_shared_prompt_prefix_sticks_to_one_host():
+    router = HostRouter(['a', 'b'])
+    first = router.choose('llama3', 'schema prompt')
+    with router.track(first, 'llama3'):
+        assert router.choose('llama3', 'schema prompt') == first
+        assert router.choose('llama3', 'another prompt') != first
+
+
+def test_host_failures_open_its_breaker_and_route_around_it():
+    router = HostRouter(['a', 'b'], failure_threshold=1)
+    try:
+        with router.track('a'):
+            raise OllamaUnavailableError('connection refused')
+    except OllamaUnavailableError:
+        pass
+    assert router.get_stats()['a']['breaker'] == 'open'
+    assert router.choose() == 'b'
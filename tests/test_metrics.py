@@ -0,0 +1,22 @@
+import pytest
+from src.utils.metrics import HistogramSink, MetricsSink
+
+
+def test_metrics_sink_is_abstract():
+    with pytest.raises(TypeError):
+        MetricsSink()
+
+
+def test_histogram_sink_percentiles_and_counters():
+    sink = HistogramSink(buckets=[10, 100])
+    for value in range(1, 101):
+        sink.observe('latency_ms', value, {'stage': 'sql'})
+    sink.increment('calls_total', {'stage': 'sql'})
+    sink.increment('calls_total', {'stage': 'sql'}, 2)
+
+    histogram = sink.get_histogram('latency_ms', {'stage': 'sql'})
+    assert histogram['count'] == 100
+    assert histogram['buckets'] == {10: 10, 100: 90, float('inf'): 0}
+    assert histogram['p50'] == 51 and histogram['p99'] == 100
+    assert sink.get_counter('calls_total', {'stage': 'sql'}) == 3
+    assert sink.get_histogram('latency_ms', {'stage': 'other'}) is None
@@ -0,0 +1,49 @@
+import math
+import asyncio
+from src.tools.ollama_standin import StandInConfig
+from src.utils.model_warmer import ModelWarmer
+from src.utils.ollama_client import call_ollama
+
+COLD_LOADS = StandInConfig(latency_ms=0, cold_load_ms=30, models=['llama3.1', 'tiny', 'nomic-embed-text'])
+
+
+def test_warm_loads_every_model_on_every_replica(standin):
+    async def scenario(*servers):
+        warmer = ModelWarmer(['llama3.1', 'tiny', None], embed_models=[None], keep_alive='-1', refresh_interval=0)
+        return await warmer.warm(), [(server.url, server.loaded_models(), server._loaded_until) for server in servers]
+
+    stats, servers = standin(scenario, COLD_LOADS, replicas=2)
+    for url, loaded, loaded_until in servers:
+        assert set(stats[url]) == {'llama3.1', 'tiny', 'nomic-embed-text'}
+        assert stats[url]['tiny']['loaded'] and stats[url]['tiny']['load_ms'] >= 30
+        assert set(loaded) == {'llama3.1', 'tiny', 'nomic-embed-text'}
+        assert loaded_until['tiny'] == math.inf
+
+
+def test_unreachable_model_is_reported_not_raised(standin):
+    async def scenario(server):
+        await server.stop()
+        return await ModelWarmer(['llama3.1'], refresh_interval=0).warm()
+
+    stats = standin(scenario)
+    assert [entry['loaded'] for entry in stats.popitem()[1].values()] == [False]
+
+
+def test_models_are_re_pinned_only_while_traffic_flows(standin):
+    async def scenario(server):
+        warmer = ModelWarmer(['llama3.1'], keep_alive='1m', refresh_interval=0.05)
+        await warmer.warm()
+        warmer.start()
+        try:
+            await asyncio.sleep(0.2)
+            idle_requests = server.stats['requests']
+            await call_ollama('hello')
+            await asyncio.sleep(0.2)
+            return idle_requests, server.stats['requests']
+        finally:
+            await warmer.stop()
+
+    idle_requests, busy_requests = standin(scenario, COLD_LOADS)
+    # One warm-up request while idle; afterwards the chat call plus at least one re-pin
+    assert idle_requests == 1
+    assert busy_requests >= 3
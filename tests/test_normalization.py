@@ -0,0 +1,12 @@
+from src.ai_agent import normalize_user_input
+
+
+def test_folds_case_whitespace_and_trailing_punctuation():
+    assert normalize_user_input('  Show ALL   orders?  ') == normalize_user_input('show all orders')
+
+
+def test_keeps_operators_and_symbols():
+    assert normalize_user_input('orders with order_amount > 100') != normalize_user_input('orders with order_amount < 100')
+    assert normalize_user_input('status != 1') != normalize_user_input('status = 1')
+    assert normalize_user_input('discount 5%') != normalize_user_input('discount 5')
+    assert normalize_user_input('orders in 2023-01') != normalize_user_input('orders in 2023 01')
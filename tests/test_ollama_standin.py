@@ -0,0 +1,81 @@
+import json
+import pytest
+from src.tools.ollama_standin import StandInConfig, detect_stage, parse_keep_alive
+from src.utils.ollama_client import call_ollama, configure_retries, embed_texts, list_ollama_models, stream_ollama
+from src.utils.resilience import OllamaError, RetryPolicy
+
+TABLE_PROMPT = '''You are a database expert. Given a user's request and database table metadata, identify the tables.
+User Request: "total order amount per customer"
+Table: orders
+Columns:
+  - order_id (INTEGER): Order
+  - customer_id (INTEGER): Customer
+  - order_amount (DECIMAL): Amount
+Table: products
+Columns:
+  - product_name (VARCHAR): Name
+'''
+
+
+def test_detects_pipeline_stages_from_prompt_instructions():
+    assert detect_stage(TABLE_PROMPT) == 'table_selection'
+    assert detect_stage('You are an expert Redshift SQL developer.') == 'query_generation'
+    assert detect_stage('hello') is None
+
+
+def test_parses_keep_alive_durations():
+    assert parse_keep_alive('5m') == 300
+    assert parse_keep_alive('1h30m') == 5400
+    assert parse_keep_alive(-1) == -1
+
+
+def test_answers_each_stage_with_a_plausible_response(standin):
+    async def scenario(server):
+        answer = json.loads(await call_ollama(TABLE_PROMPT))
+        generation_prompt = 'You are an expert Redshift SQL developer.\nTable: orders\nColumns: order_id, order_amount\n'
+        streamed = ''.join([chunk async for chunk in stream_ollama(generation_prompt)])
+        return answer, streamed
+
+    answer, streamed = standin(scenario)
+    assert answer['selectedTables'][0] == 'orders'
+    assert streamed == 'SELECT order_id, order_amount\nFROM orders\nLIMIT 100;'
+
+
+def test_serves_models_and_embeddings(standin):
+    async def scenario(server):
+        return await list_ollama_models(), await embed_texts(['orders per customer', 'orders per customer', 'weather'])
+
+    models, vectors = standin(scenario)
+    assert 'llama3.1' in models
+    assert vectors[0] == vectors[1] != vectors[2]
+
+
+def test_injected_errors_fail_the_call(standin):
+    async def scenario(server):
+        configure_retries(RetryPolicy(max_retries=0))
+        with pytest.raises(OllamaError):
+            await call_ollama('hello')
+        return server.stats
+
+    stats = standin(scenario, StandInConfig(latency_ms=0, error_rate=1.0))
+    assert stats['errors'] == 1
+
+
+def test_prompt_cache_slots_only_evaluate_the_new_suffix(standin):
+    prefix = 'static instructions and catalog ' * 40
+
+    async def scenario(server):
+        await call_ollama(prefix + 'first question')
+        await call_ollama(prefix + 'second question')
+        return server.stats
+
+    stats = standin(scenario, StandInConfig(latency_ms=0, prefix_cache_slots=1))
+    assert stats['prefix_cache_tokens'] >= len(prefix) // 4
+
+
+def test_num_predict_truncates_non_streamed_answers(standin):
+    async def scenario(server):
+        return await call_ollama('You are an expert Redshift SQL developer.', options={'num_predict': 2})
+
+    # Two of the stand-in's four-character tokens of 'SELECT 1;'
+    assert standin(scenario) == 'SELECT 1'
@@ -0,0 +1,81 @@
+import pytest
+from src.utils.output_parsing import (
+    JSONStreamExtractor, OutputParseError, SQLStreamExtractor, extract_json_object, extract_sql, parse_json_response
+)
+
+
+def test_json_object_inside_prose():
+    text = 'Here is my answer: {"selectedTables": ["orders"], "note": "uses {braces}"} Hope that helps!'
+    assert extract_json_object(text) == {'selectedTables': ['orders'], 'note': 'uses {braces}'}
+
+
+def test_json_object_after_prose_with_unmatched_brace():
+    text = 'I picked the tables {as requested:\n{"selectedTables": ["orders"], "confidence": 90}'
+    assert extract_json_object(text) == {'selectedTables': ['orders'], 'confidence': 90}
+
+
+def test_streamed_json_object_is_returned_when_it_closes():
+    extractor = JSONStreamExtractor()
+    assert extractor.feed('Sure! {"a": ') is None
+    assert extractor.feed('{"b": 1}}') == {'a': {'b': 1}}
+
+
+def test_missing_json_object_raises():
+    with pytest.raises(OutputParseError):
+        extract_json_object('no structured answer here {')
+
+
+def test_parse_json_response_normalizes_keys_and_coerces_numbers():
+    result = parse_json_response('{"selectedQueryIndex": "2", "confidence": "85%"}', {
+        'selected_query_index': int,
+        'confidence': (int, float)
+    })
+    assert result == {'selected_query_index': 2, 'confidence': 85}
+
+
+def test_parse_json_response_reports_missing_fields():
+    with pytest.raises(OutputParseError, match='reasoning'):
+        parse_json_response('{"confidence": 1}', {'confidence': int, 'reasoning': str})
+
+
+def test_sql_after_prose_that_starts_with_a_keyword():
+    text = 'Select the top customers using this query:\nSELECT customer_id, SUM(order_amount) FROM orders GROUP BY 1;'
+    assert extract_sql(text) == 'SELECT customer_id, SUM(order_amount) FROM orders GROUP BY 1;'
+
+
+def test_fenced_sql_is_preferred_over_prose():
+    text = 'Delete from your mind any doubt.\n```sql\nSELECT * FROM orders;\n```\nThen run it.'
+    assert extract_sql(text) == 'SELECT * FROM orders;'
+
+
+def test_fence_containing_sql_wins_over_other_fences():
+    text = '```text\nSelect orders\n```\n```\nWITH recent AS (SELECT * FROM orders) SELECT * FROM recent;\n```'
+    assert extract_sql(text) == 'WITH recent AS (SELECT * FROM orders) SELECT * FROM recent;'
+
+
+def test_first_statement_only_and_semicolons_in_strings():
+    text = "SELECT 'a;b' AS x FROM t; DROP TABLE t;"
+    assert extract_sql(text) == "SELECT 'a;b' AS x FROM t;"
+
+
+def stream_sql(chunks):
+    extractor = SQLStreamExtractor()
+    pieces = [extractor.feed(chunk) for chunk in chunks]
+    pieces.append(extractor.finish())
+    return [piece for piece in pieces if piece], extractor.text
+
+
+def test_streamed_sql_skips_prose_and_fences():
+    pieces, text = stream_sql(['Here is the query:\n``', '`sql\nSELECT id', ', name\nFROM cust', 'omers;\n`', '``\nThis lists every customer.'])
+    assert ''.join(pieces) == extract_sql(text) == 'SELECT id, name\nFROM customers;'
+    assert pieces[0] == 'SELECT id'
+
+
+def test_streamed_sql_without_statement_start_is_emitted_at_the_end():
+    pieces, text = stream_sql(['no sql ', 'here'])
+    assert pieces == ['no sql here'] == [extract_sql(text)]
+
+
+def test_streamed_sql_stops_at_the_first_statement():
+    pieces, text = stream_sql(['SELECT 1;', ' SELECT 2;'])
+    assert ''.join(pieces) == extract_sql(text) == 'SELECT 1;'
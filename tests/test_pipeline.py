@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from src.utils.pipeline import Pipeline, PipelineStage, PipelineStageError
+
+
+def stage(name, events, depends_on=None, fail=False, fatal=True, delay=0.0):
+    async def run(result, context):
+        events.append(f"start {name}")
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError(f"{name} broke")
+        events.append(f"end {name}")
+        return {'success': True}
+    return PipelineStage(name, run, depends_on, fatal)
+
+
+def test_independent_stages_run_concurrently_after_their_dependencies():
+    events = []
+    pipeline = Pipeline([
+        stage('sql', events, ['tables', 'examples']),
+        stage('tables', events, ['intent'], delay=0.01),
+        stage('examples', events, ['intent'], delay=0.01),
+        stage('intent', events)
+    ])
+    result = asyncio.run(pipeline.run({'steps': {}}))
+
+    assert set(result['steps']) == {'intent', 'tables', 'examples', 'sql'}
+    assert events[:2] == ['start intent', 'end intent']
+    assert set(events[2:4]) == {'start tables', 'start examples'}
+    assert events[-2:] == ['start sql', 'end sql']
+
+
+def test_fatal_failure_cancels_dependent_stages():
+    events = []
+    pipeline = Pipeline([stage('intent', events, fail=True), stage('sql', events, ['intent'])])
+    with pytest.raises(PipelineStageError) as error:
+        asyncio.run(pipeline.run({'steps': {}}))
+    assert error.value.stage == 'intent'
+    assert 'start sql' not in events
+
+
+def test_non_fatal_failure_is_recorded_and_the_run_continues():
+    events = []
+    pipeline = Pipeline([stage('intent', events, fail=True, fatal=False), stage('sql', events, ['intent'])])
+    result = asyncio.run(pipeline.run({'steps': {}}))
+    assert result['steps']['intent']['success'] is False
+    assert result['steps']['sql']['success'] is True
+
+
+def test_dependency_cycle_is_rejected():
+    with pytest.raises(ValueError):
+        Pipeline([stage('a', [], ['b']), stage('b', [], ['a'])])
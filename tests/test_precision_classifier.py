@@ -0,0 +1,66 @@
+from main import TABLE_METADATA
+from src.utils.precision_classifier import PrecisionClassifier
+
+classifier = PrecisionClassifier(TABLE_METADATA)
+
+
+def test_question_naming_tables_columns_and_dates_is_precise():
+    assessment = classifier.assess('Sum order_amount from orders by customer_id for 2024-01-01 to 2024-03-31')
+    assert assessment['precise'], assessment['reasons']
+    assert 'orders' in assessment['tables']
+    assert {'order_amount', 'customer_id'} <= set(assessment['columns'])
+
+
+def test_plural_and_spaced_names_match_the_catalog():
+    assessment = classifier.assess('List the product name and price of products in 2023')
+    assert assessment['precise'], assessment['reasons']
+    assert 'products' in assessment['tables'] and 'product_name' in assessment['columns']
+
+
+def test_vague_or_unanchored_questions_need_refinement():
+    assert 'vague terms: best' in classifier.assess('Show the best products by price this year')['reasons']
+    assert 'time range not explicit' in classifier.assess('Show monthly order_amount from orders')['reasons']
+    assert 'names no catalog table' in classifier.assess('How is the weather looking around here')['reasons']
+    assert 'too short' in classifier.assess('orders')['reasons']
+
+
+def test_vague_terms_with_a_number_are_allowed():
+    assessment = classifier.assess('Top 10 products with the most stock_quantity above 500')
+    assert not any(reason.startswith('vague terms') for reason in assessment['reasons'])
+
+
+def test_compare_measures_how_much_of_the_question_a_refinement_kept():
+    comparison = classifier.compare('total order amount per customer', 'Sum order_amount per customer_id from orders')
+    assert comparison['similarity'] >= 0.6
+    assert 'customer_id' in comparison['new_columns']
+    assert classifier.compare('total order amount', 'list products by price')['similarity'] == 0
+
+
+def test_precise_questions_skip_the_refinement_call(standin, make_agent):
+    agent = make_agent()
+
+    async def scenario(server):
+        await agent.start()
+        try:
+            return await agent.process_query('Sum order_amount from orders by customer_id for 2024-01-01 to 2024-03-31')
+        finally:
+            await agent.close()
+
+    result = standin(scenario)
+    assert result['success'] and result['steps']['refinement']['skipped']
+    assert 'refinement' not in {call['stage'] for call in result['metrics']['calls']}
+
+
+def test_vague_questions_still_go_through_refinement(standin, make_agent):
+    agent = make_agent()
+
+    async def scenario(server):
+        await agent.start()
+        try:
+            return await agent.process_query('Show me some interesting stuff about sales')
+        finally:
+            await agent.close()
+
+    result = standin(scenario)
+    assert not result['steps']['refinement'].get('skipped')
+    assert 'refinement' in {call['stage'] for call in result['metrics']['calls']}
@@ -0,0 +1,101 @@
+import os
+import pytest
+from main import EXAMPLE_QUERIES, TABLE_METADATA
+from src.components.table_selector import TableSelector
+from src.components.query_selector import QuerySelector
+from src.components.query_generator import QueryGenerator
+from src.utils.prompt_templates import PromptTemplate, PromptLayout, VersionedPromptCache, LEGACY_LAYOUT
+
+TEMPLATE = 'Request: "{user_prompt}"\nTables:\n{tables}\nRespond as {{"tables": [...]}}'
+
+
+def test_render_matches_str_format():
+    values = {'user_prompt': 'top customers', 'tables': 'orders'}
+    assert PromptTemplate(TEMPLATE).render(**values) == TEMPLATE.format(**values)
+
+
+def test_partial_fills_some_slots_now_and_the_rest_later():
+    template = PromptTemplate(TEMPLATE).partial(tables='orders')
+    assert template.slots == ['user_prompt']
+    assert template.render(user_prompt='top customers') == TEMPLATE.format(user_prompt='top customers', tables='orders')
+
+
+def test_versioned_cache_drops_entries_from_older_versions():
+    cache = VersionedPromptCache()
+    template = cache.set('catalog', PromptTemplate('{a}'))
+    assert cache.get('catalog') is template
+    cache.bump()
+    assert cache.get('catalog') is None
+
+
+def test_table_prompt_reflects_added_metadata():
+    selector = TableSelector({'orders': {'description': 'Orders', 'columns': [{'name': 'order_id', 'type': 'INTEGER'}]}})
+    candidates = {'orders': selector.table_metadata['orders']['columns']}
+    first = selector._build_prompt('count orders', candidates)
+    assert first == selector._build_prompt('count orders', candidates)
+
+    selector.add_table_metadata('customers', {'description': 'Customers', 'columns': [{'name': 'customer_id', 'type': 'INTEGER'}]})
+    candidates = {name: metadata['columns'] for name, metadata in selector.table_metadata.items()}
+    prompt = selector._build_prompt('count orders', candidates)
+    assert 'Table: customers' in prompt and 'Table: orders' in prompt
+
+
+def test_cached_example_prompt_matches_a_fresh_rendering():
+    examples = [{'description': 'Orders per day', 'query': 'SELECT 1;'}, {'description': 'Revenue', 'query': 'SELECT 2;'}]
+    selector = QuerySelector(list(examples), prompt_layout=LEGACY_LAYOUT)
+    selector._build_prompt('warm the cache', [0, 1])
+    selector.add_example_query('SELECT 3;', 'Refunds')
+    prompt = selector._build_prompt('refunds', [0, 1, 2])
+    fresh = QuerySelector(examples + [{'description': 'Refunds', 'query': 'SELECT 3;'}], prompt_layout=LEGACY_LAYOUT)
+    assert prompt == fresh._build_prompt('refunds', [0, 1, 2])
+    assert 'Example 3:' in prompt
+
+
+def test_layout_rejects_request_slots_in_the_static_prefix():
+    with pytest.raises(ValueError, match='user_prompt'):
+        PromptLayout('Catalog: {catalog}\nRequest: {user_prompt}\n', 'Answer:', request_slots=['user_prompt'])
+
+
+def test_layout_renders_the_prefix_before_the_suffix():
+    layout = PromptLayout('Catalog: {catalog}\n', 'Request: {user_prompt}\n', request_slots=['user_prompt'])
+    assert layout.slots == ['catalog', 'user_prompt']
+    assert layout.partial(catalog='orders').render(user_prompt='count') == 'Catalog: orders\nRequest: count\n'
+
+
+def shared_prefix(build):
+    """The text two prompts for different questions have in common, and one of the prompts."""
+    first, second = build('total order amount per customer'), build('products low on stock')
+    return os.path.commonprefix([first, second]), first
+
+
+def test_selector_prompts_put_the_request_after_the_catalog():
+    query_selector = QuerySelector([dict(example) for example in EXAMPLE_QUERIES])
+    prefix, prompt = shared_prefix(lambda question: query_selector._build_prompt(question, list(range(len(EXAMPLE_QUERIES)))))
+    assert all(example['query'] in prefix for example in EXAMPLE_QUERIES)
+    # The prompts only diverge at the question, which comes last
+    assert prefix.endswith('User Request: "') and prompt.rstrip().endswith('"total order amount per customer"')
+
+    table_selector = TableSelector(TABLE_METADATA)
+    candidates = {name: metadata['columns'] for name, metadata in TABLE_METADATA.items()}
+    prefix, prompt = shared_prefix(lambda question: table_selector._build_prompt(question, candidates))
+    assert all(f'Table: {name}' in prefix for name in TABLE_METADATA)
+    # The prompts only diverge at the question, which comes last
+    assert prefix.endswith('User Request: "') and prompt.rstrip().endswith('"total order amount per customer"')
+
+
+def test_generation_prompt_keeps_the_instructions_ahead_of_the_request():
+    generator = QueryGenerator()
+    prefix, prompt = shared_prefix(lambda question: generator.prompt.render(
+        user_prompt=question, selected_query='SELECT 1;', tables_info='Table: orders\nColumns: order_id'
+    ))
+    assert 'Respond with ONLY the SQL query' in prefix and prefix.endswith('User Request: "')
+
+
+def test_legacy_layout_puts_the_request_first():
+    query_selector = QuerySelector([dict(example) for example in EXAMPLE_QUERIES], prompt_layout=LEGACY_LAYOUT)
+    prompt = query_selector._build_prompt('total order amount per customer', list(range(len(EXAMPLE_QUERIES))))
+    assert prompt.index('User Request') < prompt.index(EXAMPLE_QUERIES[0]['query'])
+
+    generator = QueryGenerator(prompt_layout=LEGACY_LAYOUT)
+    prompt = generator.prompt.render(user_prompt='count orders', selected_query='SELECT 1;', tables_info='Table: orders')
+    assert prompt.index('User Request') < prompt.index('Requirements')
@@ -0,0 +1,15 @@
+import asyncio
+from src.components import query_generator
+from src.components.query_generator import QueryGenerator
+
+
+def test_streamed_tokens_match_the_returned_query(monkeypatch):
+    async def fake_stream_ollama(prompt, model=None, options=None):
+        for chunk in ['Sure!\n```sql\n', 'SELECT customer_id', ' FROM orders;', '\n```', '\nDone.']:
+            yield chunk
+
+    monkeypatch.setattr(query_generator, 'stream_ollama', fake_stream_ollama)
+    tokens = []
+    result = asyncio.run(QueryGenerator().generate_redshift_query('orders', None, ['orders'], {}, on_token=tokens.append))
+    assert result['success'] and result['time_to_first_token'] is not None
+    assert ''.join(tokens) == result['query'] == 'SELECT customer_id FROM orders;'
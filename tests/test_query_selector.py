@@ -0,0 +1,96 @@
+import asyncio
+import json
+import pytest
+from src.components import query_selector
+from src.components.query_selector import QuerySelector
+from src.utils.embedding_index import EmbeddingIndex
+
+VOCABULARY = ['customer', 'spending', 'product', 'revenue', 'month', 'weather']
+
+
+def embed(text):
+    words = text.lower()
+    return [float(words.count(word)) for word in VOCABULARY]
+
+
+async def fake_embed_texts(texts, model=None):
+    return [embed(text) for text in texts]
+
+
+async def fake_iter_embeddings(texts, model=None):
+    yield [embed(text) for text in texts]
+
+
+async def failing_embed_texts(texts, model=None):
+    raise ConnectionError('embedding model unavailable')
+
+
+def examples():
+    topics = ['customer spending', 'product sales', 'monthly revenue per month'] * 4
+    return [{'description': f"{topic} report {number}", 'query': f"SELECT {number};"} for number, topic in enumerate(topics)]
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    monkeypatch.setattr(query_selector, 'embed_texts', fake_embed_texts)
+    monkeypatch.setattr(query_selector, 'iter_embeddings', fake_iter_embeddings)
+
+
+def test_embedding_index_returns_nearest_rows_first():
+    index = EmbeddingIndex(initial_capacity=1)
+    index.add([[1, 0], [0, 1], [1, 1]])
+    assert len(index) == 3
+    assert [row for row, _ in index.search([1, 0.1], 2)] == [0, 2]
+
+
+def test_embedding_index_rejects_mismatched_dimensions():
+    index = EmbeddingIndex()
+    index.add([[1, 0]])
+    with pytest.raises(ValueError):
+        index.add([[1, 0, 0]])
+
+
+def test_retrieves_top_k_examples_by_embedding(embeddings):
+    selector = QuerySelector(examples(), top_k=3)
+    assert asyncio.run(selector.build_index())
+    candidates = asyncio.run(selector._retrieve_candidates('total revenue by month'))
+    assert candidates == [2, 5, 8]
+
+
+def test_small_catalogs_skip_retrieval(embeddings):
+    selector = QuerySelector(examples()[:3], top_k=3)
+    assert asyncio.run(selector._retrieve_candidates('anything')) == [0, 1, 2]
+
+
+def test_embedding_failure_falls_back_to_bm25_top_k(embeddings, monkeypatch):
+    selector = QuerySelector(examples(), top_k=3)
+    asyncio.run(selector.build_index())
+    monkeypatch.setattr(query_selector, 'embed_texts', failing_embed_texts)
+    candidates = asyncio.run(selector._retrieve_candidates('customer spending'))
+    assert candidates == [0, 3, 6]
+    assert not selector._embed_breaker.available()
+
+
+def test_bm25_without_matches_returns_first_top_k(monkeypatch):
+    monkeypatch.setattr(query_selector, 'iter_embeddings', fake_iter_embeddings)
+    monkeypatch.setattr(query_selector, 'embed_texts', failing_embed_texts)
+    selector = QuerySelector(examples(), top_k=3)
+    assert selector._lexical_candidates('weather forecast') == [0, 1, 2]
+
+
+def test_selected_query_comes_from_the_candidate_examples(embeddings, monkeypatch):
+    prompts = []
+
+    async def fake_call_ollama(prompt, model=None, format=None, options=None):
+        prompts.append((prompt, format))
+        return json.dumps({'selectedQueryIndex': 3, 'confidence': 90, 'reasoning': 'monthly revenue'})
+
+    monkeypatch.setattr(query_selector, 'call_ollama', fake_call_ollama)
+    selector = QuerySelector(examples(), top_k=3)
+    asyncio.run(selector.build_index())
+    result = asyncio.run(selector.select_best_query('total revenue by month'))
+
+    assert result['success'] and result['selected_query'] == 'SELECT 2;'
+    prompt, schema = prompts[0]
+    assert 'SELECT 5;' in prompt and 'SELECT 0;' not in prompt
+    assert schema['properties']['selectedQueryIndex']['enum'] == [3, 6, 9]
@@ -0,0 +1,71 @@
+from src.utils.metrics import HistogramSink, add_metrics_sink, remove_metrics_sink
+from src.utils.resilience import CircuitBreaker
+
+
+def open_breaker(failure_threshold=2):
+    breaker = CircuitBreaker('test-host', failure_threshold=failure_threshold, reset_timeout=10.0)
+    for _ in range(failure_threshold):
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('test-host', failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.available()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.available()
+
+
+def test_open_breaker_allows_one_trial_after_reset_timeout():
+    breaker = open_breaker()
+    breaker.opened_at -= breaker.reset_timeout
+    assert breaker.available()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.begin()
+    assert not breaker.available()
+
+
+def test_successful_trial_closes_breaker():
+    breaker = open_breaker()
+    breaker.opened_at -= breaker.reset_timeout
+    breaker.available()
+    breaker.begin()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0 and breaker.available()
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = open_breaker(failure_threshold=5)
+    breaker.opened_at -= breaker.reset_timeout
+    breaker.available()
+    breaker.begin()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.available()
+
+
+def test_released_trial_lets_another_through():
+    breaker = open_breaker()
+    breaker.opened_at -= breaker.reset_timeout
+    breaker.available()
+    breaker.begin()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.available()
+
+
+def test_state_changes_are_reported_to_metrics():
+    sink = add_metrics_sink(HistogramSink())
+    try:
+        breaker = open_breaker()
+        breaker.opened_at -= breaker.reset_timeout
+        breaker.available()
+        breaker.record_success()
+    finally:
+        remove_metrics_sink(sink)
+    assert sink.get_gauge('ollama_breaker_state', {'host': 'test-host'}) == 0
+    for state in ('open', 'half_open', 'closed'):
+        assert sink.get_counter('ollama_breaker_transitions_total', {'host': 'test-host', 'state': state}) == 1
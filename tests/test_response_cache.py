@@ -0,0 +1,56 @@
+import time
+import asyncio
+import threading
+from src.utils.response_cache import LRUCache, ResponseCache, SQLiteCacheStore
+
+
+def test_sqlite_store_counts_replaced_keys_once(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / 'cache.db'), max_entries=3)
+    for _ in range(5):
+        store.set('a', 'first')
+    store.set('b', 'second')
+    store.set('c', 'third')
+    assert len(store) == 3
+    assert store.get('a')[0] == 'first'
+    store.close()
+
+
+def test_sqlite_store_evicts_least_recently_accessed(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / 'cache.db'), max_entries=2)
+    for action in (lambda: store.set('a', '1'), lambda: store.set('b', '2'), lambda: store.get('a'), lambda: store.set('c', '3')):
+        action()
+        # Eviction orders rows by access time, so keep the timestamps apart
+        time.sleep(0.01)
+    assert len(store) == 2
+    assert store.get('b') is None
+    assert store.get('a') is not None
+    store.close()
+
+
+def test_lru_cache_evicts_oldest_entry():
+    cache = LRUCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+
+
+def test_disk_hits_are_promoted_to_memory(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    asyncio.run(ResponseCache(disk_path=path).set('key', 'value'))
+    cache = ResponseCache(disk_path=path)
+    assert asyncio.run(cache.get('key')) == 'value'
+    assert asyncio.run(cache.get('key')) == 'value'
+    assert cache.stats['disk_hits'] == 1
+    assert cache.stats['memory_hits'] == 1
+
+
+def test_disk_tier_runs_off_the_event_loop(tmp_path, monkeypatch):
+    cache = ResponseCache(disk_path=str(tmp_path / 'cache.db'))
+    threads = []
+    disk_set = cache.disk.set
+    monkeypatch.setattr(cache.disk, 'set', lambda key, value: threads.append(threading.current_thread()) or disk_set(key, value))
+    asyncio.run(cache.set('key', 'value'))
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,78 @@
+import time
+import pytest
+from src.tools.ollama_standin import StandInConfig
+from src.utils.metrics import trace_request
+from src.utils.ollama_client import call_ollama, configure_hedging, configure_retries
+from src.utils.resilience import (
+    DeadlineExceededError, HedgePolicy, OllamaError, OllamaRequestError, OllamaUnavailableError, RetryPolicy,
+    deadline_scope, remaining_time
+)
+
+HEALTHY = StandInConfig(latency_ms=0)
+FAILING = StandInConfig(latency_ms=0, error_rate=1.0)
+STALLING = StandInConfig(latency_ms=0, stall_rate=1.0, stall_seconds=5)
+
+
+def test_backoff_only_for_retryable_errors_within_the_retry_budget():
+    policy = RetryPolicy(max_retries=2, base_delay=0.1, max_delay=0.15)
+    assert policy.backoff(0, OllamaRequestError('bad request')) is None
+    assert 0 <= policy.backoff(1, OllamaUnavailableError('refused')) <= 0.15
+    assert policy.backoff(2, OllamaUnavailableError('refused')) is None
+
+
+def test_nested_deadlines_only_shorten():
+    with deadline_scope(0.5):
+        with deadline_scope(10):
+            assert remaining_time() <= 0.5
+        assert RetryPolicy(timeout=120).attempt_timeout() <= 0.5
+    with deadline_scope(0):
+        with pytest.raises(DeadlineExceededError):
+            RetryPolicy().attempt_timeout()
+
+
+def test_hedge_delay_follows_the_latency_percentile():
+    policy = HedgePolicy(percentile=90, min_samples=10, min_delay_ms=5)
+    for wall_ms in range(1, 10):
+        policy.record('llama3.1', wall_ms)
+    assert policy.delay_ms('llama3.1') is None
+    policy.record('llama3.1', 100)
+    assert policy.delay_ms('llama3.1') == 100
+    assert policy.delay_ms('other') is None
+
+
+def test_failed_call_is_retried_on_another_replica(standin):
+    async def scenario(failing, healthy):
+        configure_retries(RetryPolicy(max_retries=1, base_delay=0.01))
+        with trace_request() as trace:
+            response = await call_ollama('hello')
+        return response, trace.calls[-1], failing.stats['errors']
+
+    response, call, errors = standin(scenario, [FAILING, HEALTHY])
+    assert response == 'OK'
+    assert call['retries'] == 1 and errors == 1
+
+
+def test_slow_call_is_hedged_on_another_replica(standin):
+    async def scenario(stalling, healthy):
+        policy = HedgePolicy(min_samples=1, min_delay_ms=50)
+        policy.record('llama3.1', 50)
+        configure_hedging(policy)
+        start = time.monotonic()
+        with trace_request() as trace:
+            response = await call_ollama('hello', model='llama3.1')
+        return response, time.monotonic() - start, trace.calls[-1], healthy.url
+
+    response, elapsed, call, healthy_url = standin(scenario, [STALLING, HEALTHY])
+    assert response == 'OK' and elapsed < 2
+    assert call['hedged'] and call['host'] == healthy_url
+
+
+def test_deadline_cuts_off_a_stalled_call(standin):
+    async def scenario(server):
+        start = time.monotonic()
+        with pytest.raises(OllamaError):
+            with deadline_scope(0.2):
+                await call_ollama('hello')
+        return time.monotonic() - start
+
+    assert standin(scenario, STALLING) < 2
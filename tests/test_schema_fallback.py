@@ -0,0 +1,46 @@
+import asyncio
+import json
+from src.components.table_selector import TableSelector
+from src.tools.ollama_standin import StandInConfig
+from src.utils import ollama_client
+from src.utils.ollama_client import call_ollama, stream_ollama
+
+SCHEMA = {'type': 'object', 'properties': {'answer': {'type': 'string'}}, 'required': ['answer']}
+PROMPT = 'Reply with {"answer": "yes", "extra": 1}'
+REJECTING = StandInConfig(latency_ms=0, reject_schema_formats=True, responses={'Reply with': '{"answer": "yes", "extra": 1}'})
+ACCEPTING = StandInConfig(latency_ms=0, responses={'Reply with': '{"answer": "yes", "extra": 1}'})
+
+
+def test_schema_is_applied_by_hosts_that_support_it(standin):
+    async def scenario(server):
+        return await call_ollama(PROMPT, format=SCHEMA)
+
+    assert json.loads(standin(scenario, ACCEPTING)) == {'answer': 'yes'}
+    assert not ollama_client._schema_rejecting_hosts
+
+
+def test_rejected_schema_falls_back_to_plain_json_for_concurrent_calls(standin):
+    async def scenario(server):
+        answers = await asyncio.gather(*[call_ollama(PROMPT, format=SCHEMA) for _ in range(3)])
+        streamed = ''.join([chunk async for chunk in stream_ollama(PROMPT, format=SCHEMA)])
+        return answers, streamed, server.url
+
+    answers, streamed, url = standin(scenario, REJECTING)
+    assert [json.loads(answer) for answer in answers] == [{'answer': 'yes', 'extra': 1}] * 3
+    assert json.loads(streamed)['answer'] == 'yes'
+    assert ollama_client._schema_rejecting_hosts == {url}
+
+
+def test_selection_keeps_only_catalog_names_in_plain_json_mode(standin):
+    catalog = {'orders': {'description': 'Orders', 'columns': [{'name': 'order_id', 'type': 'INTEGER'}]}}
+    answer = json.dumps({'selectedTables': ['orders', 'invented'], 'selectedColumns': {'orders': ['order_id', 'bogus']},
+                         'reasoning': 'r', 'confidence': 90})
+    config = StandInConfig(latency_ms=0, reject_schema_formats=True, responses={'database table metadata': answer})
+
+    async def scenario(server):
+        return await TableSelector(catalog).select_tables_and_columns('count orders')
+
+    result = standin(scenario, config)
+    assert result['success']
+    assert result['selected_tables'] == ['orders']
+    assert result['selected_columns'] == {'orders': ['order_id']}
@@ -0,0 +1,72 @@
+from src.tools.ollama_standin import StandInConfig
+
+QUESTION = 'Show me total order amounts per customer'
+
+
+def run_query(standin, make_agent, config=None, **agent_config):
+    agent = make_agent(speculative_selection=True, refinement_fast_path=False, **agent_config)
+
+    async def scenario(server):
+        await agent.start()
+        try:
+            return await agent.process_query(QUESTION)
+        finally:
+            await agent.close()
+
+    return standin(scenario, config=config)
+
+
+def test_selections_on_the_raw_input_are_kept_when_refinement_keeps_the_intent(standin, make_agent):
+    result = run_query(standin, make_agent)
+
+    assert result['success']
+    speculation = result['steps']['refinement']['speculation']
+    assert speculation['accepted']
+    assert speculation['query_selection'] == 'accepted'
+    stages = [call['stage'] for call in result['metrics']['calls']]
+    assert 'query_selection_speculative' in stages and 'table_selection_speculative' in stages
+    # The speculative results stand in for the staged calls
+    assert 'query_selection' not in stages and 'query_selection' in result['steps']
+
+
+def test_selections_rerun_when_refinement_changes_the_intent(standin, make_agent):
+    config = StandInConfig(latency_ms=0, responses={
+        'refines user queries': 'List product names with their price and stock quantity from products'
+    })
+    result = run_query(standin, make_agent, config=config)
+
+    assert result['success']
+    speculation = result['steps']['refinement']['speculation']
+    assert not speculation['accepted'] and speculation['similarity'] < 0.6
+    assert speculation['query_selection'] == 'cancelled' and speculation['table_selection'] == 'cancelled'
+    stages = [call['stage'] for call in result['metrics']['calls']]
+    assert 'query_selection' in stages and 'table_selection' in stages
+    assert 'products' in result['steps']['table_selection']['selected_tables']
+
+
+def test_speculation_is_off_by_default(standin, make_agent):
+    agent = make_agent(refinement_fast_path=False)
+
+    async def scenario(server):
+        await agent.start()
+        try:
+            return await agent.process_query(QUESTION)
+        finally:
+            await agent.close()
+
+    result = standin(scenario)
+    assert 'speculation' not in result['steps']['refinement']
+    assert not any(call['stage'].endswith('_speculative') for call in result['metrics']['calls'])
+
+
+def test_table_selection_reruns_when_refinement_adds_a_table(standin, make_agent):
+    config = StandInConfig(latency_ms=0, responses={
+        'refines user queries': 'Show total order amounts per customer together with product names from products'
+    })
+    result = run_query(standin, make_agent, config=config)
+
+    assert result['success']
+    speculation = result['steps']['refinement']['speculation']
+    assert speculation['accepted'] and 'products' in speculation['new_tables']
+    assert speculation['query_selection'] == 'accepted' and speculation['table_selection'] == 'rerun'
+    assert 'table_selection' in [call['stage'] for call in result['metrics']['calls']]
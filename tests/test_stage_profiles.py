@@ -0,0 +1,39 @@
+from src.ai_agent import AIAgent
+from src.tools.ollama_standin import StandInConfig
+from src.utils.ollama_client import split_profile
+
+QUESTION = 'Show me the total order amount per customer'
+
+
+def test_split_profile_separates_the_model_from_ollama_options():
+    assert split_profile({'model': 'tiny', 'num_predict': 64, 'stop': [';']}) == ('tiny', {'num_predict': 64, 'stop': [';']})
+    assert split_profile(None) == (None, {})
+
+
+def test_stage_overrides_merge_over_the_defaults():
+    agent = AIAgent({'warmup': False, 'stage_profiles': {'refinement': {'model': 'tiny'}}})
+    assert agent.stage_profiles['refinement']['model'] == 'tiny'
+    assert agent.stage_profiles['refinement']['num_predict'] == 256
+    assert agent.input_refinement.model == 'tiny'
+
+
+def test_each_stage_calls_its_own_model_with_its_options(standin, make_agent):
+    agent = make_agent(refinement_fast_path=False, stage_profiles={
+        'refinement': {'model': 'tiny'},
+        'query_selection': {'model': 'tiny'},
+        'table_selection': {'model': 'tiny'},
+        'query_generation': {'model': 'llama3.1', 'stop': ['\n']}
+    })
+
+    async def scenario(server):
+        await agent.start()
+        try:
+            return await agent.process_query(QUESTION)
+        finally:
+            await agent.close()
+
+    result = standin(scenario, StandInConfig(latency_ms=0, models=['llama3.1', 'tiny']))
+    models = {call['stage']: call['model'] for call in result['metrics']['calls']}
+    assert models == {'refinement': 'tiny', 'query_selection': 'tiny', 'table_selection': 'tiny', 'query_generation': 'llama3.1'}
+    # The stop sequence ends the generated SQL at its first line
+    assert result['final_query'].startswith('SELECT') and 'FROM' not in result['final_query']
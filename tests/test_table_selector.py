@@ -0,0 +1,94 @@
+import asyncio
+import json
+from src.components import table_selector
+from src.components.table_selector import TableSelector
+
+
+async def failing_embed_texts(texts, model=None):
+    raise ConnectionError('embedding model unavailable')
+
+
+async def failing_iter_embeddings(texts, model=None):
+    raise ConnectionError('embedding model unavailable')
+    yield
+
+
+def sales_catalog(tables=30, columns=3):
+    return {
+        f"region{number}_sales": {
+            'description': f"Sales for region {number}",
+            'columns': [{'name': f"metric{column}", 'type': 'INTEGER', 'description': 'Sales figure'} for column in range(columns)]
+        }
+        for number in range(tables)
+    }
+
+
+def selector(catalog, **kwargs):
+    return TableSelector(catalog, use_schema=True, **kwargs)
+
+
+def test_small_catalogs_are_shown_whole():
+    candidates = asyncio.run(selector(sales_catalog(tables=3))._retrieve_candidates('weather forecast'))
+    assert list(candidates) == ['region0_sales', 'region1_sales', 'region2_sales']
+
+
+def test_tables_and_columns_are_retrieved_within_budget(monkeypatch):
+    monkeypatch.setattr(table_selector, 'iter_embeddings', failing_iter_embeddings)
+    catalog = sales_catalog(tables=30, columns=3)
+    catalog['customers'] = {
+        'description': 'Customer accounts',
+        'columns': [{'name': f"field{number}", 'type': 'TEXT'} for number in range(10)] + [{'name': 'email', 'type': 'TEXT'}]
+    }
+    candidates = asyncio.run(selector(catalog, max_tables=5, max_columns_per_table=4)._retrieve_candidates('customer email'))
+    assert list(candidates)[0] == 'customers'
+    assert len(candidates) <= 5
+    assert len(candidates['customers']) == 4
+    assert 'email' in [col['name'] for col in candidates['customers']]
+
+
+def test_prompt_without_matches_falls_back_to_first_tables(monkeypatch):
+    monkeypatch.setattr(table_selector, 'iter_embeddings', failing_iter_embeddings)
+    monkeypatch.setattr(table_selector, 'embed_texts', failing_embed_texts)
+    candidates = asyncio.run(selector(sales_catalog(), max_tables=5)._retrieve_candidates('weather forecast'))
+    assert list(candidates) == [f"region{number}_sales" for number in range(5)]
+
+
+def test_selection_schema_never_has_an_empty_table_list(monkeypatch):
+    schemas = []
+
+    async def fake_call_ollama(prompt, model=None, format=None, options=None):
+        schemas.append(format)
+        return json.dumps({'selectedTables': ['region0_sales'], 'selectedColumns': {'region0_sales': ['metric0']},
+                           'reasoning': 'closest match', 'confidence': 20})
+
+    monkeypatch.setattr(table_selector, 'iter_embeddings', failing_iter_embeddings)
+    monkeypatch.setattr(table_selector, 'call_ollama', fake_call_ollama)
+    result = asyncio.run(selector(sales_catalog(), max_tables=5).select_tables_and_columns('weather forecast'))
+    assert result['success'] and result['selected_tables'] == ['region0_sales']
+    assert len(schemas[0]['properties']['selectedTables']['items']['enum']) == 5
+
+
+def test_replaced_table_is_indexed_from_its_new_metadata(monkeypatch):
+    monkeypatch.setattr(table_selector, 'iter_embeddings', failing_iter_embeddings)
+    tables = selector(sales_catalog(), max_tables=2)
+    tables.add_table_metadata('region7_sales', {'description': 'Shipping invoices', 'columns': [{'name': 'invoice_id', 'type': 'INTEGER'}]})
+    candidates = asyncio.run(tables._retrieve_candidates('invoice'))
+    assert list(candidates) == ['region7_sales']
+    assert asyncio.run(tables._retrieve_candidates('region 7 metric0')).get('region7_sales') is None
+
+
+def test_retrieves_by_embedding_once_the_index_is_built(monkeypatch):
+    def embed(text):
+        return [1.0, 0.0] if 'region3' in text else [0.0, 1.0]
+
+    async def fake_iter_embeddings(texts, model=None):
+        yield [embed(text) for text in texts]
+
+    async def fake_embed_texts(texts, model=None):
+        return [[1.0, 0.0] for _ in texts]
+
+    monkeypatch.setattr(table_selector, 'iter_embeddings', fake_iter_embeddings)
+    monkeypatch.setattr(table_selector, 'embed_texts', fake_embed_texts)
+    tables = selector(sales_catalog(), max_tables=1)
+    assert asyncio.run(tables.build_index())
+    assert list(asyncio.run(tables._retrieve_candidates('north east revenue'))) == ['region3_sales']